@@ -1,5 +1,7 @@
 import pytest
 import sys, os
+import io
+import threading
 import yaml
 
 
@@ -13,6 +15,7 @@ PACKAGE_CONFIG='xfmkit/config.yaml'
 sys.path.append(BASE_DIR)
 
 import xfmkit.bufferops as bufferops
+import xfmkit.parser as parser
 import tests.utils_tests as ut
 
 #get config
@@ -99,4 +102,79 @@ def test_buffer_01_load(datafiles):
             buffer.wait()
             assert [ buffer.fidx, buffer.len, buffer.chunksize ] == expected[3]
 
-        
\ No newline at end of file
+
+@pytest.mark.datafiles(
+    os.path.join(DATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    )
+def test_buffer_export_load(datafiles):
+    """
+    validate buffer contents across every chunk
+        compared to the file read whole
+    tests single-process and multiload
+    """
+    chunksize=int(0.3*MBCONV)
+
+    f = ut.findin("export.GeoPIXE", datafiles)
+    with open(f, mode='rb') as fi:
+        expected = fi.read()
+
+    for multiload in [ True, False]:
+        with open(f, mode='rb') as fi:
+            buffer=bufferops.MapBuffer(fi, chunksize, multiload)
+
+            result = b''
+            while buffer.len > 0:
+                assert buffer.fidx == len(result)
+                result += bytes(buffer.data[:buffer.len])
+                buffer=buffer.retrieve()
+            buffer.wait()
+
+            assert [ buffer.fidx, buffer.len ] == [ len(expected), 0 ]
+            assert result == expected
+
+
+@pytest.mark.datafiles(
+    os.path.join(DATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    )
+def test_buffer_mmap_load(datafiles):
+    """
+    validate memory-mapped buffer
+        whole file held in a single buffer
+        any further retrieve is beyond EOF
+    """
+    chunksize=int(1*MBCONV)
+
+    f = ut.findin("export.GeoPIXE", datafiles)
+    with open(f, mode='rb') as fi:
+        buffer=bufferops.MmapBuffer(fi, chunksize, False)
+
+        assert [ buffer.fidx, buffer.len, buffer.chunksize ] == [ 0, os.path.getsize(f), chunksize ]
+
+        #stream across the old chunk boundary without a join
+        stream, idx, buffer = bufferops.getstream(buffer, chunksize-8, PXHEADERLEN)
+        assert [ len(stream), idx, buffer.fidx ] == [ PXHEADERLEN, chunksize+8, 0 ]
+
+        with pytest.raises(parser.MapEarlyStop):
+            bufferops.getstream(buffer, buffer.len-8, PXHEADERLEN)
+
+
+def test_buffer_multiload_wait_after_error():
+    """
+    wait returns when the preloaded read failed
+        retrieve raises before queueing another read, so none is pending
+    """
+    class FailingReader(io.BytesIO):
+        def readinto(self, b):
+            raise OSError("read failed")
+
+    buffer=bufferops.MapBuffer(FailingReader(bytes(64)), 16, True)
+
+    with pytest.raises(EOFError):
+        buffer.retrieve()
+
+    waiting = threading.Thread(target=buffer.wait, daemon=True)
+    waiting.start()
+    waiting.join(5)
+
+    assert not waiting.is_alive()
+    assert buffer.thread is None
@@ -2,6 +2,7 @@ import pytest
 import sys, os
 import yaml
 import numpy as np
+from numpy.polynomial import Polynomial
 
 TEST_DIR=os.path.realpath(os.path.dirname(__file__))
 BASE_DIR=os.path.dirname(TEST_DIR)
@@ -19,6 +20,10 @@ PACKAGE_CONFIG='xfmkit/config.yaml'
 sys.path.append(BASE_DIR)
 
 import xfmkit.bufferops as bufferops
+import xfmkit.dtops as dtops
+import xfmkit.dtcalibration as dtcalibration
+import xfmkit.entry_calibrate as entry_calibrate
+import xfmkit.synthetic as synthetic
 import tests.utils_tests as ut
 import xfmkit.entry_raw as entry_raw
 
@@ -35,6 +40,14 @@ BYTESPERCHAN=config['BYTESPERCHAN']
 MBCONV=config['MBCONV']
 
 
+@pytest.fixture(autouse=True)
+def calibration_cache(tmp_path, monkeypatch):
+    """
+    default deadtime calibration cache within tmp_path, so no test reads ~/.xfmkit
+    """
+    monkeypatch.setattr(dtcalibration, "DEFAULT_CACHE", os.path.join(str(tmp_path), "home", dtcalibration.CALIBRATION_NAME))
+
+
 @pytest.mark.datafiles(
     os.path.join(BIGDATA_DIR, 'ts2_01_sub.GeoPIXE'),
     os.path.join(BIGDATA_DIR, 'ts2_01_sub_data.npy'),
@@ -83,4 +96,127 @@ def test_cycle_dtfill_cpp(datafiles):
 
     #check results
     assert np.allclose(pixelseries.data, expected_pxdata)
-    assert np.allclose(pixelseries.dt, expected_dt)
\ No newline at end of file
+    assert np.allclose(pixelseries.dt, expected_dt)
+
+
+def test_predict_dt_models():
+    """
+        vectorised deadtime models against the original per-value calculations
+
+        - poly3 as per numpy Polynomial over the calibrated domain
+        - linear as per the scalar calculation per pixel, capped at the cutoff
+        - model selected per time constant, uncalibrated time constants rejected
+    """
+    dwell = 100.0
+    rng = np.random.default_rng(0)
+    sums = rng.integers(0, 20000, (5000, 2)).astype(np.uint32)
+    sums[0] = [ 1000000, 1000000 ]  #beyond the cutoff
+
+    #poly3
+    expected = Polynomial(dtops.POLY3_COEFFICIENTS, domain=dtops.POLY3_DOMAIN, window=dtops.POLY3_WINDOW)(sums/dwell)*100
+
+    result = dtops.dt_model(0.5, dwell).predict(sums)
+
+    assert result.dtype == np.float32
+    assert np.allclose(result, expected, rtol=1e-5, atol=1e-4)
+
+    #linear
+    expected = [ min((sum(px)/dwell)/2*config['dtcalc_a'] + config['dtcalc_c'], config['dtcalc_cutoff']) for px in sums ]
+
+    result = dtops.dt_model(0.5, dwell, config, "linear").predict(sums)
+
+    assert np.allclose(result[:,0], expected) and np.array_equal(result[:,0], result[:,1])
+    assert result[0,0] == config['dtcalc_cutoff']
+
+    #model per time constant
+    assert dtops.dt_model(0.5, dwell, { **config, "dt_models": { 0.5: "linear" } }).name == "linear"
+
+    with pytest.raises(ValueError, match="not yet calibrated"):
+        dtops.dt_model(1.0, dwell, config)
+
+
+def test_calibrate_dt(tmp_path):
+    """
+        fit deadtime models to measured deadtimes, and predict from the cache
+
+        - one calibration per time constant and dwell
+        - predictions from the fit reproduce the measured deadtimes
+        - later runs extend the fit, unless reset
+        - out of date caches are ignored
+    """
+    files = []
+    for i, dwell in enumerate([ 100.0, 50.0 ]):
+        f = os.path.join(str(tmp_path), f"synthetic_{i}.GeoPIXE")
+        synthetic.write(f, 32, 32, 2, dwell=dwell, deadtime=8.0, seed=i)
+        files.append(f)
+
+    cachefile = os.path.join(str(tmp_path), "calibration", dtcalibration.CALIBRATION_NAME)
+    calconfig = { **config, "dt_calibration": cachefile, "DT_CALIBRATION": True }
+
+    cache = entry_calibrate.read_calibrate([ "-f", *files, "-c", cachefile ])
+
+    assert sorted(cache['calibrations']) == [ "0.5us/100ms", "0.5us/50ms" ]
+    assert cache['calibrations']["0.5us/100ms"]['nsamples'] == 32*32*2
+
+    #synthetic deadtimes are proportional to counts
+    result = synthetic.write(os.path.join(str(tmp_path), "check.GeoPIXE"), 8, 8, 2, dwell=100.0, deadtime=8.0, seed=0)
+    sums = np.sum(result['spectra'], axis=1, dtype=np.uint32)[result['choice']]
+
+    model = dtops.dt_model(0.5, 100.0, calconfig)
+
+    assert model.name == "calibrated"
+    assert np.allclose(model.predict(sums), result['dt'][result['choice']], atol=1e-3)
+
+    #nearest dwell for this time constant, otherwise as per dt_models
+    assert dtops.dt_model(0.5, 60.0, calconfig).calibration['dwell'] == 50.0
+    assert dtops.dt_model(0.5, 100.0, { **calconfig, "DT_CALIBRATION": False }).name == "poly3"
+
+    #opt-in, never without config
+    assert dtops.dt_model(0.5, 100.0, { **config, "dt_calibration": cachefile }).name == "poly3"
+    assert dtops.dt_model(0.5, 100.0).name == "poly3"
+
+    with pytest.raises(ValueError, match="not calibrated"):
+        dtops.dt_model(1.0, 100.0, calconfig, "calibrated")
+
+    #extend, then reset
+    cache = entry_calibrate.read_calibrate([ "-f", files[0], "-c", cachefile ])
+    assert cache['calibrations']["0.5us/100ms"]['nsamples'] == 2*32*32*2
+
+    cache = entry_calibrate.read_calibrate([ "-f", files[0], "-c", cachefile, "-rs" ])
+    assert list(cache['calibrations']) == [ "0.5us/100ms" ]
+    assert cache['calibrations']["0.5us/100ms"]['nsamples'] == 32*32*2
+
+    #out of date
+    cache['version'] = dtcalibration.CALIBRATION_VERSION + 1
+    dtcalibration.savecache(cache, cachefile)
+
+    assert dtcalibration.lookup(0.5, 100.0, calconfig) is None
+
+
+def test_cycle_dtpredict(tmp_path):
+    """
+        read->write->read cycle:
+            writes a .GeoPIXE file with predicted deadtimes,
+            then parses this to confirm the predictions were written
+
+    """
+    control_args = CONTROL_ARGS
+
+    #prep
+    f = os.path.join(str(tmp_path), "synthetic.GeoPIXE")
+    synthetic.write(f, 20, 10, 2, seed=2)
+
+    #arguments for write, predicting deadtimes
+    args_in = [ "-f", f, "-dt", "-w", "-ff" ] + control_args
+
+    #run predict/write
+    pixelseries, xfmap = entry_raw.read_raw(args_in)
+
+    expected_dt = dtops.dt_poly3(pixelseries.sum, xfmap.dwell)
+
+    #use output file as input for next run
+    f_result = os.path.join(str(tmp_path), "out_synthetic/synthetic_mod.GeoPIXE")
+
+    pixelseries, ___ = entry_raw.read_raw([ "-f", f_result, "-ff" ] + control_args)
+
+    assert np.array_equal(pixelseries.dt, expected_dt)
@@ -1,5 +1,8 @@
 import pytest
 import sys, os
+import time, threading
+import subprocess
+import json
 import yaml
 import numpy as np
 
@@ -14,14 +17,38 @@ CHUNK_SIZE=5
 CONTROL_ARGS=[ "-s", str(CHUNK_SIZE),]
 CONTROL_ARGS_MULTILOAD=[ "-s", str(CHUNK_SIZE), "-m"]
 CONTROL_ARGS_MULTILOAD=[ ]
+CONTROL_ARGS_MMAP=[ "-s", str(CHUNK_SIZE), "-mm"]
+CONTROL_ARGS_PYTHON=[ "-s", str(CHUNK_SIZE), "-p"]
+CONTROL_ARGS_PARALLEL=[ "-s", str(CHUNK_SIZE), "-p", "-j", "2"]
+CONTROL_ARGS_SPARSE=[ "-s", str(CHUNK_SIZE), "-sp"]
+CONTROL_ARGS_STREAM=[ "-s", str(CHUNK_SIZE), "-st"]
+CONTROL_ARGS_REDUCED=[ "-s", str(CHUNK_SIZE), "-rd"]
+CONTROL_ARGS_REBIN=[ "-s", str(CHUNK_SIZE), "-cw", "100", "3001", "-rb", "4"]
+CONTROL_ARGS_OUTOFCORE=[ "-s", str(CHUNK_SIZE), "-oc"]
+CONTROL_ARGS_TILED=[ "-s", str(CHUNK_SIZE), "-et"]
+CONTROL_ARGS_FOLLOW=[ "-s", str(CHUNK_SIZE), "-fl", "-fi", "0.1", "-ft", "2"]
+CONTROL_ARGS_VALIDATE=[ "-s", str(CHUNK_SIZE), "-v", "-p"]
+CONTROL_ARGS_PLAN=[ "-s", str(CHUNK_SIZE), "-mm", "-p", "-ml", "514"]
+CONTROL_ARGS_ROI=[ "-s", str(CHUNK_SIZE), "-r", "-x", "3", "9", "-y", "2", "5"]
 
 PACKAGE_CONFIG='xfmkit/config.yaml'
 
 sys.path.append(BASE_DIR)
 
 import xfmkit.bufferops as bufferops
+import xfmkit.parser as parser
+import xfmkit.structures as structures
+import xfmkit.tilestore as tilestore
+import xfmkit.planner as planner
+import xfmkit.instrument as instrument
+import xfmkit.synthetic as synthetic
+import xfmkit.benchmark as benchmark
+import xfmkit.argops as argops
 import tests.utils_tests as ut
 import xfmkit.entry_raw as entry_raw
+import xfmkit.entry_batch as entry_batch
+import xfmkit.entry_catalogue as entry_catalogue
+import xfmkit.entry_benchmark as entry_benchmark
 
 
 #get config
@@ -350,3 +377,1190 @@ def test_cycle_unchanged_cpp(datafiles):
     assert np.allclose(pixelseries.dt, expected_dt)
 
 
+#-------------------------------------------------------------------
+#------------MEMORY-MAPPED------------------------------------------
+#-------------------------------------------------------------------
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_parse_mmap(datafiles):
+    """
+        parse memory-mapped datafile 
+    """
+    control_args = CONTROL_ARGS_MMAP
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    #arguments
+    args_in = [ "-f", str(f), ] + control_args
+
+    #run
+    pixelseries, ___ = entry_raw.read_raw(args_in)
+
+    assert np.allclose(pixelseries.data, expected_pxdata)
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    )
+def test_integration_index_vector(datafiles):
+    """
+        index datafile via bulk header decode
+
+        compare to streamed index
+    """
+    control_args = CONTROL_ARGS
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    #run
+    expected, expected_xfmap = entry_raw.read_raw([ "-f", str(f), "-i", "-si", "-ff" ] + control_args)
+    pixelseries, xfmap = entry_raw.read_raw([ "-f", str(f), "-i", "-ff" ] + control_args)
+
+    assert np.array_equal(xfmap.indexlist, expected_xfmap.indexlist)
+    assert np.array_equal(pixelseries.pxlen, expected.pxlen)
+    assert np.array_equal(pixelseries.xidx, expected.xidx)
+    assert np.array_equal(pixelseries.yidx, expected.yidx)
+    assert np.array_equal(pixelseries.det, expected.det)
+    assert np.array_equal(pixelseries.dt, expected.dt)
+
+
+#-------------------------------------------------------------------
+#------------PYTHON PARSE-------------------------------------------
+#-------------------------------------------------------------------
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_parse_python(datafiles):
+    """
+        parse datafile via NumPy, without parsercore
+    """
+    control_args = CONTROL_ARGS_PYTHON
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    #arguments
+    args_in = [ "-f", str(f), ] + control_args
+
+    #run
+    pixelseries, ___ = entry_raw.read_raw(args_in)
+
+    assert np.allclose(pixelseries.data, expected_pxdata)
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_index_cache(datafiles):
+    """
+        index datafile, then re-parse from the cached index
+
+        cache should be invalidated when file is modified
+    """
+    control_args = CONTROL_ARGS
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+    cachefile = parser.indexcachepath(str(f))
+
+    #index and write cache
+    expected, expected_xfmap = entry_raw.read_raw([ "-f", str(f), "-i", ] + control_args)
+    assert os.path.isfile(cachefile)
+
+    #parse using cache
+    pixelseries, xfmap = entry_raw.read_raw([ "-f", str(f), ] + control_args)
+
+    assert np.array_equal(xfmap.indexlist, expected_xfmap.indexlist)
+    assert np.array_equal(pixelseries.pxlen, expected.pxlen)
+    assert np.array_equal(pixelseries.dt, expected.dt)
+    assert np.allclose(pixelseries.data, expected_pxdata)
+
+    #modify timestamp and confirm fingerprint changes
+    old_fingerprint = parser.fingerprint(str(f))
+    stat = os.stat(f)
+    os.utime(f, ns=(stat.st_atime_ns, stat.st_mtime_ns+1000000000))
+
+    assert not parser.fingerprint(str(f)) == old_fingerprint
+
+
+def test_integration_parse_multiload_cpp(tmp_path, monkeypatch):
+    """
+    parse via parsercore with chunks preloaded by the reader thread
+
+        full chunks are passed as the preloaded bytearray, not copied
+        parsercore builds taking bytes only get a copy instead
+    """
+    parsercore = pytest.importorskip("parsercore")
+
+    readstream = parsercore.readstream
+    streams = []
+
+    def readstream_buffer(indexlist, pxlen, stream, length):
+        streams.append(type(stream))
+        return readstream(indexlist, pxlen, stream, length)
+
+    def readstream_bytes(indexlist, pxlen, stream, length):
+        if not type(stream) is bytes:
+            raise TypeError(f"readstream given {type(stream).__name__}, expected bytes")
+        streams.append(type(stream))
+        return readstream(indexlist, pxlen, stream, length)
+
+    f = os.path.join(str(tmp_path), "synthetic.GeoPIXE")
+    result = synthetic.write(f, 64, 64, 2, seed=5)
+
+    #several full chunks, then the final partial chunk
+    monkeypatch.setattr(parsercore, "readstream", readstream_buffer)
+    pixelseries, ___ = entry_raw.read_raw([ "-f", f, "-s", "1", "-m", "-ff" ])
+
+    assert len(streams) > 2
+    assert bytearray in streams
+    assert np.array_equal(pixelseries.data, synthetic.expected(result))
+
+    streams.clear()
+    monkeypatch.setattr(parsercore, "readstream", readstream_bytes)
+    pixelseries, ___ = entry_raw.read_raw([ "-f", f, "-s", "1", "-m", "-ff" ])
+
+    assert len(streams) > 2
+    assert np.array_equal(pixelseries.data, synthetic.expected(result))
+
+
+def test_integration_index_cache_invalid(tmp_path):
+    """
+        cache from a truncated map, with a missing or mis-sized array
+
+        should fall back to a fresh index, leaving pixelseries untruncated
+    """
+    f = os.path.join(str(tmp_path), "synthetic.GeoPIXE")
+    synthetic.write(f, 20, 10, 2, truncate=0.6, seed=4)
+    cachefile = parser.indexcachepath(f)
+
+    #index and write cache, truncated to the rows found
+    expected, ___ = entry_raw.read_raw([ "-f", f, "-i", ] + CONTROL_ARGS)
+    assert expected.npx < 20*10
+
+    with np.load(cachefile) as cache:
+        contents = dict(cache)
+
+    chunksize = CHUNK_SIZE*MBCONV
+
+    for name, value in [ ("dt", None), ("det", contents['det'][:-1]) ]:
+        damaged = { key: array for key, array in contents.items() if not key == name }
+        if value is not None:
+            damaged[name] = value
+
+        np.savez(cachefile, **damaged)
+
+        xfmap = structures.Xfmap(config, f, None, False, chunksize, False, True)
+        pixelseries = structures.PixelSeries(config, xfmap, xfmap.npx, xfmap.detarray, False)
+
+        pixelseries, xfmap, cached = parser.loadindex(xfmap, pixelseries, f)
+        xfmap.closefiles()
+
+        assert not cached
+        assert pixelseries.npx == 20*10 and pixelseries.pxlen.shape[0] == 20*10
+
+
+def test_integration_parse_truncated(tmp_path):
+    """
+        parse a synthetic map truncated mid-row, via each parse path
+
+        compare to known:
+            - pixels indexed before EOF
+            - padding to the end of the last row left empty
+    """
+    f = os.path.join(str(tmp_path), "synthetic.GeoPIXE")
+    result = synthetic.write(f, 20, 34, 2, truncate=0.55, seed=8)
+
+    paths = [ [], [ "-p" ], [ "-mm" ], [ "-p", "-j", "2" ], [ "-sp" ], [ "-rd" ], [ "-oc", "-e" ] ]
+
+    for extra in paths:
+        pixelseries, xfmap = entry_raw.read_raw([ "-f", f, "-s", "1", "-ff" ] + extra)
+
+        npx = xfmap.npx_found
+        assert 0 < npx < pixelseries.npx and pixelseries.npx % 20 == 0
+
+        expected_pxdata = np.zeros((pixelseries.npx, 2, NCHAN), dtype=np.uint16)
+        expected_pxdata[:npx] = synthetic.expected(result, 0, npx)
+
+        flattened = pixelseries.flattened.toarray() if "-sp" in extra else pixelseries.flattened
+
+        assert np.array_equal(flattened, np.sum(expected_pxdata, axis=1)), extra
+        assert np.array_equal(pixelseries.sum, np.sum(expected_pxdata, axis=2)), extra
+
+
+def test_integration_colours_rebin(tmp_path):
+    """
+        colour map from rebinned and windowed spectra
+
+        compare to known:
+            - colour map from full spectra, within rounding
+            - colour map made from windowed spectra
+    """
+    f = os.path.join(str(tmp_path), "synthetic.GeoPIXE")
+    synthetic.write(f, 20, 10, 2, seed=9)
+
+    pixelseries, ___ = entry_raw.read_raw([ "-f", f, "-a", "-ff" ])
+    expected_rgb = pixelseries.rgbarray.astype(np.int32)
+
+    pixelseries, ___ = entry_raw.read_raw([ "-f", f, "-a", "-ff", "-rb", "4" ])
+
+    assert np.max(np.abs(pixelseries.rgbarray.astype(np.int32) - expected_rgb)) <= 2
+
+    #counts outside the window are dropped, so only check the map is made
+    pixelseries, ___ = entry_raw.read_raw([ "-f", f, "-a", "-ff", "-cw", "-rb", "4" ])
+
+    assert pixelseries.rgbarray is not None
+    assert pixelseries.rgbarray.shape == expected_rgb.shape
+
+
+def test_spectorgb_blocks(monkeypatch):
+    """
+        colour products a few pixels at a time
+
+        compare to known:
+            - products of whole arrays, dense and sparse
+            - single spectrum
+    """
+    import scipy.sparse
+    import xfmkit.rgbspectrum as rgbspectrum
+
+    #block of 3 pixels, so the last block is partial
+    monkeypatch.setattr(rgbspectrum, "RGB_BLOCK", 3*8*NCHAN)
+
+    rng = np.random.default_rng(0)
+    spectra = rng.integers(0, 50, (100, NCHAN), dtype=np.uint32)
+    energy = np.arange(NCHAN)*0.01
+    red, green, blue = rng.random((3, NCHAN))
+
+    expected = [ (spectra @ colour)/NCHAN for colour in (red, green, blue) ] + [ np.sum(spectra, axis=1) ]
+
+    for dataset in [ spectra, scipy.sparse.csr_matrix(spectra) ]:
+        result = rgbspectrum.spectorgb(energy, dataset, red, green, blue)
+
+        for r, e in zip(result, expected):
+            assert np.allclose(r, e)
+
+    result = rgbspectrum.spectorgb(energy, spectra[7], red, green, blue)
+
+    for r, e in zip(result, expected):
+        assert np.allclose(r, e[7])
+
+
+def test_integration_write_truncated(tmp_path):
+    """
+        write a truncated synthetic map, then parse it back
+
+        compare to known:
+            - pixels indexed before EOF, and no others
+    """
+    f = os.path.join(str(tmp_path), "synthetic.GeoPIXE")
+    result = synthetic.write(f, 20, 34, 2, truncate=0.55, seed=8)
+    f_result = os.path.join(str(tmp_path), "out_synthetic/synthetic_mod.GeoPIXE")
+
+    ___, xfmap = entry_raw.read_raw([ "-f", f, "-i", "-w", "-ff" ])
+    npx = xfmap.npx_found
+
+    pixelseries, xfmap = entry_raw.read_raw([ "-f", f_result, "-ff" ])
+
+    assert xfmap.npx_found == npx
+    assert np.array_equal(pixelseries.data[:npx], synthetic.expected(result, 0, npx))
+
+
+def test_integration_roi_truncated(tmp_path):
+    """
+        region of interest running past EOF of a truncated synthetic map
+
+        compare to known:
+            - region clipped to rows indexed before EOF
+            - pixel data within the region
+    """
+    f = os.path.join(str(tmp_path), "synthetic.GeoPIXE")
+    result = synthetic.write(f, 20, 34, 2, truncate=0.55, seed=8)
+
+    pixelseries, xfmap = entry_raw.read_raw([ "-f", f, "-s", "1", "-ff", "-r", "-x", "2", "19", "-y", "10", "30" ])
+
+    #last row is partly indexed, and does not reach x=19
+    nrows = xfmap.npx_found // 20
+    assert xfmap.npx_found % 20 < 19
+    assert pixelseries.dimensions == ( nrows-10, 17 )
+
+    expected_pxdata = synthetic.expected(result, 0, nrows*20).reshape(nrows, 20, 2, NCHAN)[10:,2:19].reshape(-1, 2, NCHAN)
+
+    assert np.array_equal(pixelseries.data, expected_pxdata)
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_parse_parallel(datafiles):
+    """
+        parse datafile across multiple processes
+    """
+    control_args = CONTROL_ARGS_PARALLEL
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    #arguments
+    args_in = [ "-f", str(f), ] + control_args
+
+    #run
+    pixelseries, ___ = entry_raw.read_raw(args_in)
+
+    assert np.allclose(pixelseries.data, expected_pxdata)
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_parse_sparse(datafiles):
+    """
+        parse datafile into sparse CSR arrays
+
+        compare to known:
+            - dense data
+            - derived sums
+    """
+    control_args = CONTROL_ARGS_SPARSE
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    #arguments
+    args_in = [ "-f", str(f), ] + control_args
+
+    #run
+    pixelseries, ___ = entry_raw.read_raw(args_in)
+
+    result = pixelseries.data.toarray().reshape(expected_pxdata.shape)
+
+    assert np.array_equal(result, expected_pxdata)
+    assert np.array_equal(pixelseries.flattened.toarray(), np.sum(expected_pxdata, axis=1))
+    assert np.array_equal(pixelseries.sum, np.sum(expected_pxdata, axis=2))
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_stream(datafiles):
+    """
+        stream datafile in pixel batches
+
+        compare to known:
+            - derived sums, without full dataset
+            - data, reassembled from batches
+    """
+    control_args = CONTROL_ARGS_STREAM
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    #arguments
+    args_in = [ "-f", str(f), ] + control_args
+
+    #run
+    pixelseries, xfmap = entry_raw.read_raw(args_in)
+
+    assert pixelseries.data is None
+    assert np.array_equal(pixelseries.sum, np.sum(expected_pxdata, axis=2))
+
+    result = np.concatenate([ batch.data for batch in parser.iter_pixels(xfmap, pixelseries, batch=7) ])
+
+    assert np.array_equal(result, expected_pxdata)
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_parse_roi(datafiles):
+    """
+        parse a region of interest from datafile
+
+        compare to known:
+            - region of data
+            - region coordinates
+    """
+    control_args = CONTROL_ARGS_ROI
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    #arguments
+    args_in = [ "-f", str(f), ] + control_args
+
+    #run
+    pixelseries, xfmap = entry_raw.read_raw(args_in)
+
+    expected_pxdata = expected_pxdata.reshape(xfmap.yres, xfmap.xres, xfmap.ndet, -1)[2:5,3:9]
+
+    assert pixelseries.dimensions == (3, 6)
+    assert np.array_equal(pixelseries.xidx[:,0].reshape(3, 6), np.tile(np.arange(3, 9), (3, 1)))
+    assert np.array_equal(pixelseries.data, expected_pxdata.reshape(pixelseries.npx, xfmap.ndet, -1))
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_write_bulk(datafiles):
+    """
+        write cropped file via byte runs
+
+        - write cropped file with new deadtimes, via byte runs and per-record
+        - assert files are identical
+        - read cropped output file back in
+        - assert parsed pixel array is correct
+    """
+    control_args = CONTROL_ARGS
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+    f_result = os.path.join(os.path.dirname(f), "out_ts2_01_sub_export/ts2_01_sub_export_mod.GeoPIXE")
+
+    #arguments for crop/write
+    args_in = [ "-f", str(f), "-i", "-w", "-x", "3", "9", "-y", "2", "5", "-dt", "25", ] + control_args
+
+    #run per-record write, then byte run write
+    ___, ___ = entry_raw.read_raw(args_in + ["-si"])
+
+    with open(f_result, "rb") as result:
+        expected_bytes = result.read()
+
+    ___, xfmap = entry_raw.read_raw(args_in)
+
+    with open(f_result, "rb") as result:
+        assert result.read() == expected_bytes
+
+    #read output file back in
+    pixelseries, ___ = entry_raw.read_raw([ "-f", f_result, ] + control_args)
+
+    expected_pxdata = expected_pxdata.reshape(xfmap.yres, xfmap.xres, xfmap.ndet, -1)[2:5,3:9]
+
+    assert np.all(pixelseries.dt == 25)
+    assert np.array_equal(pixelseries.data, expected_pxdata.reshape(pixelseries.npx, xfmap.ndet, -1))
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_parse_reduced(datafiles):
+    """
+        parse datafile accumulating derived arrays only
+
+        compare to known:
+            - flattened data
+            - derived sums
+    """
+    control_args = CONTROL_ARGS_REDUCED
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    #arguments
+    args_in = [ "-f", str(f), ] + control_args
+
+    #run
+    pixelseries, ___ = entry_raw.read_raw(args_in)
+
+    assert pixelseries.data is None
+    assert np.array_equal(pixelseries.flattened, np.sum(expected_pxdata, axis=1))
+    assert np.array_equal(pixelseries.sum, np.sum(expected_pxdata, axis=2))
+    assert np.array_equal(pixelseries.flatsum, np.sum(expected_pxdata, axis=(1,2)))
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_parse_rebin(datafiles):
+    """
+        parse datafile within a channel window, rebinning channels
+
+        compare to known:
+            - windowed and rebinned pixel data
+            - derived sums
+    """
+    control_args = CONTROL_ARGS_REBIN
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = bufferops.binspectra(np.load(str(ef)), 100, 3001, 4)
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    #arguments
+    args_in = [ "-f", str(f), ] + control_args
+
+    #run
+    pixelseries, ___ = entry_raw.read_raw(args_in)
+
+    assert pixelseries.nchan == 726
+    assert len(pixelseries.energy) == pixelseries.nchan
+    assert np.array_equal(pixelseries.data, expected_pxdata)
+    assert np.array_equal(pixelseries.sum, np.sum(expected_pxdata, axis=2))
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_parse_outofcore(datafiles):
+    """
+        parse datafile directly into a memory-mapped export file
+
+        compare to known:
+            - pixel data held by pixelseries
+            - exported .npy file
+    """
+    control_args = CONTROL_ARGS_OUTOFCORE
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    #arguments
+    args_in = [ "-f", str(f), ] + control_args
+
+    #run
+    pixelseries, ___ = entry_raw.read_raw(args_in)
+
+    assert isinstance(pixelseries.data, np.memmap)
+    assert np.array_equal(pixelseries.data, expected_pxdata)
+    assert np.array_equal(np.load(pixelseries.datafile), expected_pxdata)
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_export_tiled(datafiles):
+    """
+        export datafile as a tiled store and read back windows
+
+        compare to known:
+            - full cube
+            - windows crossing tile edges, incl. short edge tiles
+    """
+    control_args = CONTROL_ARGS_TILED
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    #arguments
+    args_in = [ "-f", str(f), ] + control_args
+
+    #run
+    pixelseries, xfmap = entry_raw.read_raw(args_in)
+
+    expected_cube = expected_pxdata.reshape(xfmap.yres, xfmap.xres, xfmap.ndet, -1)
+
+    exportdir = os.path.join(os.path.dirname(str(f)), config['OUTDIR']+"_ts2_01_sub_export", config['EXPORTDIR'])
+    store = tilestore.TileStore(tilestore.storepath(exportdir, config['export_filename']))
+
+    assert np.array_equal(store.read(), expected_cube)
+
+    #small tiles, to exercise edges
+    small = tilestore.write(os.path.join(str(datafiles), "small.tiles"), pixelseries.data, pixelseries.dimensions, pixelseries.ndet, \
+        tilepixels=3, tilechannels=1000, codec="lzma")
+    store = tilestore.TileStore(small)
+
+    assert np.array_equal(store.read((2, 8), (5, 19), (90, 2100)), expected_cube[2:8, 5:19, :, 90:2100])
+    assert np.array_equal(store.read((9, 10), None, (4000, 4096)), expected_cube[9:10, :, :, 4000:4096])
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_follow(datafiles):
+    """
+        follow datafile as it is written, in pieces cut mid-record
+
+        compare to known:
+            - pixel data
+            - derived sums
+    """
+    control_args = CONTROL_ARGS_FOLLOW
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    with open(f, mode='rb') as fi:
+        stream = fi.read()
+
+    #header and first few pixels, then the rest in uneven pieces
+    cuts = [ len(stream)//10, len(stream)//3+5, len(stream)//2+11, len(stream) ]
+    f_grow = os.path.join(os.path.dirname(str(f)), "grow.GeoPIXE")
+
+    with open(f_grow, mode='wb') as fo:
+        fo.write(stream[:cuts[0]])
+
+    def append():
+        for start, end in zip(cuts[:-1], cuts[1:]):
+            time.sleep(0.3)
+            with open(f_grow, mode='ab') as fo:
+                fo.write(stream[start:end])
+
+    writer = threading.Thread(target=append)
+    writer.start()
+
+    #arguments
+    args_in = [ "-f", f_grow, ] + control_args
+
+    #run
+    try:
+        pixelseries, ___ = entry_raw.read_raw(args_in)
+    finally:
+        writer.join()
+
+    assert np.array_equal(pixelseries.data, expected_pxdata)
+    assert np.array_equal(pixelseries.sum, np.sum(expected_pxdata, axis=2))
+    assert np.array_equal(pixelseries.flattened, np.sum(expected_pxdata, axis=1))
+
+
+def test_integration_follow_header_only(tmp_path, monkeypatch):
+    """
+        follow a synthetic map from when only its header is written, without parsercore
+
+        compare to known:
+            - pixel data
+    """
+    #no C++ parser, should fall back to python
+    monkeypatch.setattr(parser._follow, "parsercore", None)
+
+    f = os.path.join(str(tmp_path), "synthetic.GeoPIXE")
+    result = synthetic.write(f, 20, 10, 2, seed=6)
+
+    with open(f, mode='rb') as fi:
+        stream = fi.read()
+
+    #header only, then the rest in uneven pieces
+    headerlen = 2 + int.from_bytes(stream[:2], "little")
+    cuts = [ headerlen, len(stream)//3+5, len(stream)//2+11, len(stream) ]
+    f_grow = os.path.join(str(tmp_path), "grow.GeoPIXE")
+
+    with open(f_grow, mode='wb') as fo:
+        fo.write(stream[:cuts[0]])
+
+    def append():
+        for start, end in zip(cuts[:-1], cuts[1:]):
+            time.sleep(0.3)
+            with open(f_grow, mode='ab') as fo:
+                fo.write(stream[start:end])
+
+    writer = threading.Thread(target=append)
+    writer.start()
+
+    try:
+        pixelseries, ___ = entry_raw.read_raw([ "-f", f_grow, "-ff" ] + CONTROL_ARGS_FOLLOW)
+    finally:
+        writer.join()
+
+    assert np.array_equal(pixelseries.data, synthetic.expected(result))
+
+
+def test_integration_follow_preview(tmp_path):
+    """
+        refresh plots, as for each set of rows while following
+
+        check:
+            - no figures left open after each refresh
+    """
+    import matplotlib.pyplot as plt
+    import xfmkit.utils as utils
+
+    f = os.path.join(str(tmp_path), "synthetic.GeoPIXE")
+    synthetic.write(f, 20, 10, 2, seed=6)
+
+    pixelseries, xfmap = entry_raw.read_raw([ "-f", f, "-ff" ])
+    plt.close('all')
+
+    args_in = [ "-f", f, "-ff", "-a" ]
+    pxconfig = utils.initcfg(entry_raw.PACKAGE_CONFIG)
+    args = argops.readargs(args_in, pxconfig)
+    pxconfig, dirs = utils.initfiles(args, pxconfig)
+
+    entry_raw.preview(pxconfig, args, dirs, pixelseries, xfmap)
+
+    assert plt.get_fignums() == []
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_batch(datafiles):
+    """
+        process a directory of maps, one with a corrupt record
+
+        check:
+            - exported data for each valid map
+            - failed map is retried, and reported in the summary
+    """
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+    batchdir = os.path.join(str(datafiles), "batch")
+    os.mkdir(batchdir)
+
+    with open(f, mode='rb') as fi:
+        stream = bytearray(fi.read())
+
+    for name in [ "map_a", "map_b" ]:
+        with open(os.path.join(batchdir, name+".GeoPIXE"), mode='wb') as fo:
+            fo.write(stream)
+
+    #a later record too short to hold its own header
+    idx = int.from_bytes(stream[0:2], 'little') + 2
+    for i in range(50):
+        idx += int.from_bytes(stream[idx+2:idx+6], 'little')
+    stream[idx+2:idx+6] = (3).to_bytes(4, 'little')
+
+    with open(os.path.join(batchdir, "map_c.GeoPIXE"), mode='wb') as fo:
+        fo.write(stream)
+
+    #arguments
+    args_in = [ "-b", batchdir, "-bw", "1", "-br", "1", "-s", str(CHUNK_SIZE), "-e" ]
+
+    #run
+    summary = entry_batch.read_batch(args_in)
+
+    status = { os.path.basename(result['file']): result for result in summary['maps'] }
+
+    assert os.path.isfile(os.path.join(batchdir, entry_batch.SUMMARY_NAME))
+    assert status['map_c.GeoPIXE']['status'] == "failed"
+    assert status['map_c.GeoPIXE']['attempts'] == 2
+
+    for name in [ "map_a", "map_b" ]:
+        assert status[name+".GeoPIXE"]['status'] == "done"
+        exported = np.load(os.path.join(batchdir, config['OUTDIR']+"_"+name, config['EXPORTDIR'], config['export_filename']+".npy"))
+        assert np.array_equal(exported, expected_pxdata)
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    )
+def test_integration_catalogue(datafiles):
+    """
+        catalogue a directory of maps from their headers
+
+        compare to known:
+            - map properties from Xfmap
+            - unreadable file reported, not raised
+    """
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+    catdir = os.path.join(str(datafiles), "catalogue")
+    os.makedirs(os.path.join(catdir, "sub"))
+
+    with open(f, mode='rb') as fi:
+        stream = fi.read()
+
+    for name in [ "map_a.GeoPIXE", os.path.join("sub", "map_b.GeoPIXE") ]:
+        with open(os.path.join(catdir, name), mode='wb') as fo:
+            fo.write(stream)
+
+    with open(os.path.join(catdir, "map_c.GeoPIXE"), mode='wb') as fo:
+        fo.write(stream[:100])
+
+    f_out = os.path.join(catdir, "catalogue.csv")
+
+    #arguments
+    args_in = [ "-cat", catdir, "-cr", "-co", f_out ]
+
+    #run
+    rows = entry_catalogue.read_catalogue(args_in)
+
+    xfmap = structures.Xfmap(config, str(f), None, False, 1, False)
+    xfmap.closefiles()
+
+    assert len(rows) == 3
+    assert os.path.isfile(f_out)
+
+    rows = { os.path.basename(row['file']): row for row in rows }
+
+    for name in [ "map_a.GeoPIXE", "map_b.GeoPIXE" ]:
+        row = rows[name]
+        assert row['error'] is None
+        assert ( row['xres'], row['yres'], row['ndet'], row['nchan'], row['dwell_ms'] ) \
+            == ( xfmap.xres, xfmap.yres, xfmap.ndet, xfmap.nchannels, xfmap.dwell )
+
+    assert rows["map_c.GeoPIXE"]['error'] is not None
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_validate(datafiles):
+    """
+        parse a map with corrupt records, resynchronising past each
+
+        compare to known:
+            - pixel data, with corrupt records as zero spectra
+            - corrupt regions and missing records in integrity report
+    """
+    control_args = CONTROL_ARGS_VALIDATE
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    xfmap = structures.Xfmap(config, str(f), None, False, 1, False, True)
+    pixelseries = structures.PixelSeries(config, xfmap, xfmap.npx, xfmap.detarray, False)
+    pixelseries, xfmap = parser.indexmap_vector(xfmap, pixelseries)
+    xfmap.closefiles()
+
+    #break the flag of one record, and the length of another
+    with open(f, mode='r+b') as fo:
+        fo.seek(int(xfmap.indexlist[57,1]))
+        fo.write(b'XX')
+        fo.seek(int(xfmap.indexlist[120,0])+2)
+        fo.write((7).to_bytes(4, 'little'))
+
+    expected_pxdata[57,1] = 0
+    expected_pxdata[120,0] = 0
+
+    #arguments
+    args_in = [ "-f", str(f), "-ff" ] + control_args
+
+    #run
+    pixelseries, xfmap = entry_raw.read_raw(args_in)
+
+    assert np.array_equal(pixelseries.data, expected_pxdata)
+
+    exportdir = os.path.join(os.path.dirname(str(f)), config['OUTDIR']+"_ts2_01_sub_export", config['EXPORTDIR'])
+
+    with open(os.path.join(exportdir, parser.REPORT_NAME)) as fr:
+        report = json.load(fr)
+
+    assert report['repaired']
+    assert len(report['corrupt_regions']) == 2
+    assert report['records_missing'] == 2
+    assert report['missing'] == [ { "x": 17, "y": 2, "det": 1 }, { "x": 0, "y": 6, "det": 0 } ]
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export_data.npy'),
+    )
+def test_integration_plan(datafiles, monkeypatch):
+    """
+        select a parse strategy within a memory limit
+
+        compare to known:
+            - strategy chosen when dense parse exceeds limit
+            - pixel data parsed via that strategy
+            - failure when no strategy fits
+    """
+    control_args = CONTROL_ARGS_PLAN
+
+    #small decode blocks, so the parsed arrays decide the strategy for this small map
+    monkeypatch.setattr(bufferops, "DECODE_PAIRS", 4096)
+
+    #get expected
+    ef = ut.findin("ts2_01_sub_export_data.npy", datafiles)
+    expected_pxdata = np.load(str(ef))       
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    #arguments
+    args_in = [ "-f", str(f), ] + control_args
+
+    #run
+    args = planner.plan(config, argops.readargs(args_in, config))
+
+    assert planner.strategyof(args) == "rebinned"
+
+    pixelseries, ___ = entry_raw.read_raw(args_in)
+
+    assert np.array_equal(pixelseries.data, bufferops.binspectra(expected_pxdata, 0, config['NCHAN'], args.rebin))
+
+    with pytest.raises(MemoryError):
+        entry_raw.read_raw([ "-f", str(f), "-ml", "1" ])
+
+
+def test_integration_plan_decoding(tmp_path, monkeypatch):
+    """
+        parse peak includes the decode temporaries of each path
+
+        check:
+            - NumPy decode adds one block of DECODE_PAIRS pairs
+            - parsercore adds the window copy and its full dense spectra, more again if rebinned
+    """
+    f = os.path.join(str(tmp_path), "synthetic.GeoPIXE")
+    result = synthetic.write(f, 20, 10, 2, sparsity=0.75, seed=7)
+
+    def parsepeak(args_in, strategy, rebin):
+        args = argops.readargs([ "-f", f, "-s", "1", "-mm" ] + args_in, config)
+        name, held, peak = planner.estimate(config, args, planner.readheader(config, args), strategy, rebin)[1]
+        assert name == "parse"
+        return peak - held
+
+    assert parsepeak([ "-p" ], "dense", 1) == bufferops.DECODE_PAIRS*planner.DECODE_BYTES_PER_PAIR
+    assert parsepeak([ "-p" ], "rebinned", 4) == bufferops.DECODE_PAIRS*planner.DECODE_BYTES_PER_PAIR
+    assert parsepeak([], "sparse", 1) == bufferops.DECODE_PAIRS*planner.DECODE_BYTES_PER_PAIR
+
+    #any module stands in for parsercore, only its presence is checked
+    monkeypatch.setattr(planner, "parsercore", planner)
+
+    #window of one chunk, decoded to full spectra of the pixels within it
+    windowpx = 20*10*MBCONV/result["bytes"]
+    dense = parsepeak([], "dense", 1)
+    assert np.isclose(dense, MBCONV + windowpx*2*NCHAN*2, rtol=0.01)
+
+    assert parsepeak([], "rebinned", 4) > dense
+
+
+def test_integration_plan_config_on_use(tmp_path, monkeypatch):
+    """
+        planner reads reducer settings from the conf file only when classify is planned
+
+        check:
+            - import does not read the conf file
+            - estimate without -c does not read it
+            - estimate with -c does
+    """
+    import importlib
+    import xfmkit.config as configuration
+
+    reads = []
+    get = configuration.get
+
+    def recordget(section, value):
+        reads.append((section, value))
+        return get(section, value)
+
+    monkeypatch.setattr(configuration, "get", recordget)
+    importlib.reload(planner)
+    assert reads == []
+
+    f = os.path.join(str(tmp_path), "synthetic.GeoPIXE")
+    synthetic.write(f, 20, 10, 2, seed=7)
+
+    args = argops.readargs([ "-f", f, "-s", "1" ], config)
+    planner.estimate(config, args, planner.readheader(config, args), "dense", 1)
+    assert reads == []
+
+    args = argops.readargs([ "-f", f, "-s", "1", "-c" ], config)
+    stages = planner.estimate(config, args, planner.readheader(config, args), "dense", 1)
+    assert stages[-1][0] == "classify"
+    assert ('reducer', 'pixel_cutoff_pca_only') in reads
+
+
+@pytest.mark.datafiles(
+    os.path.join(BIGDATA_DIR, 'ts2_01_sub_export.GeoPIXE'),
+    )
+def test_integration_run_report(datafiles):
+    """
+        record throughput of each stage, and pass progress to a callback
+
+        compare to known:
+            - stages recorded in run report
+            - bytes, records and pixels counted from index
+            - progress reaching total for parse
+    """
+    control_args = CONTROL_ARGS_PYTHON
+
+    #prep
+    f = ut.findin("ts2_01_sub_export.GeoPIXE", datafiles)
+
+    events = []
+
+    #arguments
+    args_in = [ "-f", str(f), "-ff" ] + control_args
+
+    #run
+    pixelseries, xfmap = entry_raw.read_raw(args_in, callback=lambda stage, done, total: events.append(( stage, done, total )))
+
+    exportdir = os.path.join(os.path.dirname(str(f)), config['OUTDIR']+"_ts2_01_sub_export", config['EXPORTDIR'])
+
+    with open(os.path.join(exportdir, instrument.REPORT_NAME)) as fr:
+        report = json.load(fr)
+
+    stages = { stage['stage']: stage for stage in report['stages'] }
+
+    assert list(stages) == [ "header", "index", "parse", "derived", "export" ]
+    assert stages['header']['bytes'] == xfmap.datastart
+    assert stages['parse']['bytes'] == np.sum(pixelseries.pxlen, dtype=np.uint64)
+    assert stages['parse']['records'] == xfmap.npx*xfmap.ndet
+    assert stages['parse']['pixels'] == xfmap.npx
+    assert all(stage['wall_s'] >= 0 for stage in report['stages'])
+
+    assert events[-1] == ( "parse", xfmap.npx, xfmap.npx )
+    assert instrument.active is None
+
+
+def test_integration_synthetic(tmp_path):
+    """
+        write synthetic maps and parse them back
+
+        compare to known:
+            - header and detectors read from synthetic map
+            - pixel data and deadtimes written
+            - corrupt records and truncated rows repaired as empty spectra
+    """
+    control_args = CONTROL_ARGS_PYTHON
+
+    #prep
+    f = os.path.join(str(tmp_path), "synthetic.GeoPIXE")
+    result = synthetic.write(f, 30, 12, 3, seed=1)
+
+    xfmap = structures.Xfmap(config, f, None, False, 1, False)
+    xfmap.closefiles()
+
+    assert ( xfmap.xres, xfmap.yres, xfmap.ndet ) == ( 30, 12, 3 )
+
+    #arguments
+    args_in = [ "-f", f, "-ff" ] + control_args
+
+    #run
+    pixelseries, xfmap = entry_raw.read_raw(args_in)
+
+    assert np.array_equal(pixelseries.data, synthetic.expected(result))
+    assert np.array_equal(pixelseries.dt, result['dt'][result['choice']])
+
+    #corrupt and truncated
+    f = os.path.join(str(tmp_path), "synthetic_corrupt.GeoPIXE")
+    result = synthetic.write(f, 30, 12, 3, corrupt=3, truncate=0.9, seed=1)
+
+    pixelseries, xfmap = entry_raw.read_raw([ "-f", f, "-ff", "-v" ] + control_args)
+
+    expected = synthetic.expected(result, 0, pixelseries.npx)
+    mismatched = np.any(pixelseries.data != expected, axis=2)
+
+    assert len(result['corrupted']) == 3
+    assert np.sum(mismatched[:-xfmap.xres]) == 3
+    assert np.all(pixelseries.data[mismatched] == 0)
+
+
+def test_integration_benchmark(tmp_path):
+    """
+        benchmark stages over two small maps, against a saved baseline
+
+        compare to known:
+            - one result per size and stage, with throughput and memory
+            - no regression against a baseline from the same run
+            - regression raised against an inflated baseline
+    """
+    stages = [ "startup", "index", "index_stream", "parse_python", "derived", "write", "write_stream", "deadtime" ]
+    baseline = os.path.join(str(tmp_path), "baseline.json")
+
+    args_in = [ "-o", str(tmp_path), "-sz", "12x8", "20x10", "-rp", "1", "-st" ] + stages + [ "-bl", baseline, "-sb" ]
+
+    #run
+    results = entry_benchmark.read_benchmark(args_in)
+
+    assert [ ( row["size"], row["stage"] ) for row in results["results"] ] \
+        == [ ( size, stage ) for size in [ "12x8", "20x10" ] for stage in stages ]
+
+    for row in results["results"]:
+        assert row["pixels"] == row["xres"]*row["yres"]
+        assert row["wall_s"] > 0
+        assert row["rss_peak_mb"] > 0
+
+    with open(os.path.join(str(tmp_path), "benchmark_results.json"), "r") as f:
+        assert json.load(f)["results"] == results["results"]
+
+    assert benchmark.compare(results, results) == []
+
+    #inflate the baseline throughput tenfold
+    with open(baseline, "r") as f:
+        inflated = json.load(f)
+
+    for row in inflated["results"]:
+        row["wall_s"] = 1.0
+        row["px_per_s"] = 10*row["px_per_s"]
+
+    with open(baseline, "w") as f:
+        json.dump(inflated, f)
+
+    with pytest.raises(ValueError, match="regressions against baseline"):
+        entry_benchmark.read_benchmark([ "-o", str(tmp_path), "-sz", "12x8", "-rp", "1", "-st", "index", "-bl", baseline ])
+
+
+def test_integration_startup():
+    """
+        import each command-line entry point in a fresh interpreter
+
+        compare to known:
+            - analysis dependencies are not imported until their flags are used
+    """
+    deferred = [ "umap", "hdbscan", "pacmap", "sklearn", "minisom", "seaborn", "colorcet", "matplotlib.pyplot", \
+                    "pandas", "periodictable", "scipy.stats", "scipy.ndimage" ]
+
+    command = "import sys, json; import xfmkit.entry_raw, xfmkit.entry_batch, xfmkit.entry_catalogue, xfmkit.entry_processed; " \
+        f"print(json.dumps([ m for m in {deferred} if m in sys.modules ]))"
+
+    #run
+    result = subprocess.run([ sys.executable, "-c", command ], cwd=BASE_DIR, capture_output=True, text=True, check=True)
+
+    assert json.loads(result.stdout.splitlines()[-1]) == []
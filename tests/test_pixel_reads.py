@@ -14,6 +14,7 @@ sys.path.append(BASE_DIR)
 
 import tests.utils_tests as ut
 import xfmkit.bufferops as bufferops
+import xfmkit.synthetic as synthetic
 
 #get config
 with open(os.path.join(BASE_DIR, PACKAGE_CONFIG), "r") as f:
@@ -141,6 +142,122 @@ def test_readpxdata_empty():
     assert np.array_equal(counts, expected_counts)
 
 
+@pytest.mark.datafiles(
+    os.path.join(DATA_DIR, 'px14387_0_header.bin'),
+    os.path.join(DATA_DIR, 'px14387_1_header.bin'),
+    )
+def test_readpxheaders_det01(datafiles):
+    """
+    bulk read of consecutive pixel headers, two-detector format
+        should match readpxheader for each header
+    """
+    expected =  [[ 3868, 51, 56, 0, 15.940695762634277 ], \
+                [ 4040, 51, 56, 1, 12.854915618896484 ] ]
+
+    #join the headers in detector order, with padding between
+    stream = b''
+    offsets = []
+    for f in sorted(datafiles.iterdir()):
+        with open(f, mode='rb') as fi:
+            offsets.append(len(stream))
+            stream += fi.read(PXHEADERLEN) + b'\x00'*6
+
+    headers = bufferops.readpxheaders(stream, np.array(offsets, dtype=np.uint64), PXHEADERLEN)
+
+    for i in range(len(expected)):
+        result = [ headers['pxlen'][i], headers['xidx'][i], headers['yidx'][i], headers['det'][i], headers['dt'][i] ]
+        assert result == expected[i]
+
+
+@pytest.mark.datafiles(
+    os.path.join(DATA_DIR, 'px14387_1_header.bin'),
+    os.path.join(DATA_DIR, 'px14387_1_data.bin'),
+    os.path.join(DATA_DIR, 'px14387_1_data_counts.npy'),
+    )
+def test_readpxspectra_det01(datafiles):
+    """
+    bulk read of pixel data, two-detector format
+        same record repeated at odd offset, should match readpxdata for each
+    """
+    ef = ut.findin("counts.npy", datafiles)
+    expected_counts = np.load(str(ef))
+
+    with open(ut.findin("header.bin", datafiles), mode='rb') as fi:
+        record = fi.read()
+    with open(ut.findin("data.bin", datafiles), mode='rb') as fi:
+        record += fi.read()
+
+    #leading byte to offset the records from the start of the stream
+    stream = b'\x00' + record + record
+    offsets = np.array([ 1, 1+len(record) ], dtype=np.uint64)
+    pxlens = np.array([ len(record), len(record) ], dtype=np.uint16)
+
+    result = np.zeros((2, NCHAN), dtype=np.uint16)
+    result = bufferops.readpxspectra(stream, offsets, pxlens, PXHEADERLEN, BYTESPERCHAN, result)
+
+    assert np.array_equal(result[0], expected_counts)
+    assert np.array_equal(result[1], expected_counts)
+
+
+def test_readpxspectra_blocks(monkeypatch):
+    """
+    bulk read split into many small decode blocks, should match the records written
+        with and without a rebinned channel window
+    """
+    rng = np.random.default_rng(0)
+    spectra, dt = synthetic.templates(rng, 16, NCHAN, 10.0, 500, "poisson", 0.5, 0.9, 5.0)
+    choice = rng.integers(0, 16, 200)
+
+    words, offsets = synthetic.records(synthetic.encode(spectra), choice, dt, 0, 10, 2)
+    lengths = np.diff(np.append(offsets, len(words)))
+
+    #a block is far smaller than the stream, and not a multiple of any record
+    monkeypatch.setattr(bufferops, "DECODE_PAIRS", 37)
+
+    result = np.zeros((len(choice), NCHAN), dtype=np.uint16)
+    result = bufferops.readpxspectra(words.tobytes(), 4*offsets, 4*lengths, PXHEADERLEN, BYTESPERCHAN, result)
+
+    assert np.array_equal(result, spectra[choice])
+
+    result = np.zeros((len(choice), 500), dtype=np.uint32)
+    result = bufferops.readpxspectra(words.tobytes(), 4*offsets, 4*lengths, PXHEADERLEN, BYTESPERCHAN, result, (100, 2100), 4)
+
+    assert np.array_equal(result, spectra[choice][:,100:2100].reshape(-1, 500, 4).sum(axis=2))
+
+
+def test_readpxspectra_rebin_overflow():
+    """
+    counts summed across a bin beyond uint16 should not wrap
+        for the NumPy decoder, and for spectra already decoded eg. by parsercore
+    """
+    spectra = np.zeros((2, NCHAN), dtype=np.uint16)
+    spectra[:, 8:12] = 60000
+
+    words, offsets = synthetic.records(synthetic.encode(spectra), np.array([0, 1]), np.zeros(2, dtype=np.float32), 0, 1, 2)
+    lengths = np.diff(np.append(offsets, len(words)))
+
+    result = np.zeros((2, NCHAN//4), dtype=bufferops.spectrumdtype(4))
+    result = bufferops.readpxspectra(words.tobytes(), 4*offsets, 4*lengths, PXHEADERLEN, BYTESPERCHAN, result, None, 4)
+
+    assert np.all(result[:, 2] == 240000)
+    assert np.all(bufferops.binspectra(spectra, 0, NCHAN, 4)[:, 2] == 240000)
+
+    #narrower output would wrap, so is rejected
+    with pytest.raises(ValueError):
+        bufferops.readpxspectra(words.tobytes(), 4*offsets, 4*lengths, PXHEADERLEN, BYTESPERCHAN, \
+            np.zeros((2, NCHAN//4), dtype=np.uint16), None, 4)
+
+
+def test_readpxheaders_bad_flag():
+    """
+    missing pixel flag should raise
+    """
+    stream = bufferops.pxheadstruct.pack(b'D', b'X', 16, 0, 0, 0, 0.0)
+
+    with pytest.raises(ValueError):
+        bufferops.readpxheaders(stream, np.array([0], dtype=np.uint64), PXHEADERLEN)
+
+
 
 
 
@@ -1,2 +1,7 @@
 from ._raw import *
-from ._processed import *
\ No newline at end of file
+from ._processed import *
+from ._batch import *
+from ._catalogue import *
+from ._synthetic import *
+from ._benchmark import *
+from ._calibrate import *
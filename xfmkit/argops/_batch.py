@@ -0,0 +1,95 @@
+import os
+import argparse
+import psutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def checkargs_batch(args, config):
+    """
+    sanity check on batch args
+    - raises on invalid values
+    - fills memory and worker defaults from the system
+    """
+    if args.batch == None:
+        raise ValueError("No input files or directories specified")
+
+    if args.batch_workers == None:
+        args.batch_workers = os.cpu_count() or 1
+
+    if args.batch_workers < 1:
+        raise ValueError("Number of batch workers must be >= 1")
+
+    if args.batch_retries < 0:
+        raise ValueError("Number of batch retries must be >= 0")
+
+    if args.batch_memory == None:
+        vmem=psutil.virtual_memory()
+        args.batch_memory = round(vmem[0]*float(config['BATCH_MEMORY_FRACTION'])/config['MBCONV'])
+
+    if args.batch_memory <= 0:
+        raise ValueError("Batch memory limit must be > 0")
+
+    return args
+
+
+def readargs_batch(args_in, config):
+    """
+    read in a set of command-line args for processing many maps
+
+    args not recognised here are passed on unchanged to each map, as per readargs
+        eg. xfmkit-batch -b ./night/ -bw 4 -a -e
+
+    returns the parsed batch args, and the list of args for each map
+    """
+
+    #initialise the parser
+    argparser = argparse.ArgumentParser(
+        description="XFM data loader and analysis package - batch processing"
+    )
+
+    #--------------------------
+    #set up the expected args
+    #--------------------------
+    argparser.add_argument(
+        "-b", "--batch",
+        help="Specify directories, .GeoPIXE files or glob patterns to be read in"
+        "directories are searched for .GeoPIXE files, not including subdirectories",
+        nargs='+',
+    )
+    argparser.add_argument(
+        "-bw", "--batch-workers",
+        help="Maximum number of maps processed at once"
+        "Defaults to the number of CPUs",
+        type=int,
+    )
+    argparser.add_argument(
+        "-bm", "--batch-memory",
+        help="Memory (in Mb) to share between maps processed at once"
+        "maps are started only while their estimated memory fits within this limit"
+        "Defaults to BATCH_MEMORY_FRACTION of system memory",
+        type=int,
+    )
+    argparser.add_argument(
+        "-br", "--batch-retries",
+        help="Number of times to retry a map that fails"
+        "Defaults to 1",
+        type=int,
+        default=int(1),
+    )
+    argparser.add_argument(
+        "-bs", "--batch-summary",
+        help="Specify a file for the per-map status summary (.json)"
+        "Defaults to xfmkit_batch.json in the directory containing the first map",
+        type=os.path.abspath,
+    )
+
+    args, args_map = argparser.parse_known_args(args_in)
+
+    if "-f" in args_map or "--input-file" in args_map:
+        raise ValueError("Input files are given via --batch")
+
+    args = checkargs_batch(args, config)
+
+    return args, args_map
@@ -0,0 +1,125 @@
+import os
+import re
+import argparse
+import logging
+
+import xfmkit.benchmark as benchmark
+
+logger = logging.getLogger(__name__)
+
+
+def mapsize(value: str):
+    """
+    read a map size as XRESxYRES, eg. 64x64
+    """
+    match = re.fullmatch(r"(\d+)[xX](\d+)", value)
+
+    if match is None:
+        raise argparse.ArgumentTypeError(f"map size {value} not recognised, expected eg. 64x64")
+
+    return [ int(match.group(1)), int(match.group(2)) ]
+
+
+def checkargs_benchmark(args, config):
+    """
+    sanity check on benchmark args
+    """
+    if args.output_directory == None:
+        raise ValueError("No output directory specified")
+
+    if not os.path.isdir(args.output_directory):
+        raise FileNotFoundError(f"Output directory {args.output_directory} not found")
+
+    for xres, yres in args.sizes:
+        if xres < 1 or yres < 1:
+            raise ValueError("Map dimensions must be >= 1")
+
+    if args.detectors < 1:
+        raise ValueError("Number of detectors must be >= 1")
+
+    if args.repeats < 1:
+        raise ValueError("Number of repeats must be >= 1")
+
+    if not 0 < args.tolerance < 1:
+        raise ValueError("Tolerance must be > 0 and < 1")
+
+    if args.save_baseline and args.baseline == None:
+        raise ValueError("--save-baseline requires --baseline")
+
+    if args.baseline != None and not args.save_baseline and not os.path.isfile(args.baseline):
+        raise FileNotFoundError(f"Baseline {args.baseline} not found, create it with --save-baseline")
+
+    return args
+
+
+def readargs_benchmark(args_in, config):
+    """
+    read in a set of command-line args for benchmarking
+    """
+
+    #initialise the parser
+    argparser = argparse.ArgumentParser(
+        description="XFM data loader and analysis package - benchmark suite"
+    )
+
+    #--------------------------
+    #set up the expected args
+    #--------------------------
+    argparser.add_argument(
+        "-o", "--output-directory",
+        help="Specify the directory for the results file",
+        type=os.path.abspath,
+    )
+    argparser.add_argument(
+        "-sz", "--sizes",
+        help="Map sizes to benchmark, as XRESxYRES"
+        f"Defaults to {' '.join(benchmark.DEFAULT_SIZES)}",
+        nargs='+',
+        type=mapsize,
+        default=[ mapsize(size) for size in benchmark.DEFAULT_SIZES ],
+    )
+    argparser.add_argument(
+        "-st", "--stages",
+        help="Stages to benchmark"
+        "Defaults to all",
+        nargs='+',
+        choices=benchmark.STAGES,
+        default=list(benchmark.STAGES),
+    )
+    argparser.add_argument(
+        "-d", "--detectors",
+        help="Number of detectors in each map"
+        "Defaults to 2",
+        type=int,
+        default=int(2),
+    )
+    argparser.add_argument(
+        "-rp", "--repeats",
+        help="Number of runs of each stage, the fastest is kept"
+        "Defaults to 3",
+        type=int,
+        default=int(3),
+    )
+    argparser.add_argument(
+        "-bl", "--baseline",
+        help="Compare results against this baseline .json, failing on any regression",
+        type=os.path.abspath,
+    )
+    argparser.add_argument(
+        "-sb", "--save-baseline",
+        help="Write the results as the new --baseline, instead of comparing",
+        action='store_true',
+    )
+    argparser.add_argument(
+        "-tl", "--tolerance",
+        help="Fractional loss of throughput, or gain in memory, counted as a regression"
+        f"Defaults to {benchmark.TOLERANCE}",
+        type=float,
+        default=float(benchmark.TOLERANCE),
+    )
+
+    args = argparser.parse_args(args_in)
+
+    args = checkargs_benchmark(args, config)
+
+    return args
@@ -0,0 +1,81 @@
+import os
+import argparse
+import logging
+
+import xfmkit.dtcalibration as dtcalibration
+
+logger = logging.getLogger(__name__)
+
+
+def checkargs_calibrate(args, config):
+    """
+    sanity check on deadtime calibration args
+    """
+    if args.input_files == None:
+        raise ValueError("No input files specified")
+
+    for fi in args.input_files:
+        if not os.path.isfile(fi):
+            raise FileNotFoundError(f"Input file {fi} not found")
+
+        if not os.path.splitext(fi)[1] == config['FTYPE']:
+            raise ValueError(f"Input file {fi} is not {config['FTYPE']}")
+
+    if args.time_constant != None and args.time_constant <= 0:
+        raise ValueError("Time constant must be > 0")
+
+    if not 1 <= args.degree <= dtcalibration.MAX_DEGREE:
+        raise ValueError(f"Polynomial degree must be >= 1 and <= {dtcalibration.MAX_DEGREE}")
+
+    return args
+
+
+def readargs_calibrate(args_in, config):
+    """
+    read in a set of command-line args for deadtime calibration
+    """
+
+    #initialise the parser
+    argparser = argparse.ArgumentParser(
+        description="XFM data loader and analysis package - deadtime calibration"
+    )
+
+    #--------------------------
+    #set up the expected args
+    #--------------------------
+    argparser.add_argument(
+        "-f", "--input-files",
+        help="Specify .GeoPIXE files with measured deadtimes to calibrate from",
+        nargs='+',
+        type=os.path.abspath,
+    )
+    argparser.add_argument(
+        "-c", "--cache",
+        help="Calibration cache to update"
+        "Defaults to dt_calibration in config, or ~/.xfmkit/dt_calibration.json",
+        type=os.path.abspath,
+    )
+    argparser.add_argument(
+        "-tc", "--time-constant",
+        help="Time constant (us) of the input files"
+        "Defaults to time_constant in config",
+        type=float,
+    )
+    argparser.add_argument(
+        "-dg", "--degree",
+        help="Degree of the fitted polynomial"
+        f"Defaults to {dtcalibration.DEFAULT_DEGREE}",
+        type=int,
+        default=int(dtcalibration.DEFAULT_DEGREE),
+    )
+    argparser.add_argument(
+        "-rs", "--reset",
+        help="Discard the existing cache, instead of extending its fits with the input files",
+        action='store_true',
+    )
+
+    args = argparser.parse_args(args_in)
+
+    args = checkargs_calibrate(args, config)
+
+    return args
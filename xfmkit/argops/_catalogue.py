@@ -0,0 +1,65 @@
+import os
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def checkargs_catalogue(args, config):
+    """
+    sanity check on catalogue args
+    """
+    if args.catalogue == None:
+        raise ValueError("No input files or directories specified")
+
+    if args.catalogue_workers < 1:
+        raise ValueError("Number of catalogue workers must be >= 1")
+
+    if args.catalogue_output != None and not os.path.splitext(args.catalogue_output)[1] in [ ".csv", ".json" ]:
+        raise ValueError("Catalogue output must be .csv or .json")
+
+    return args
+
+
+def readargs_catalogue(args_in, config):
+    """
+    read in a set of command-line args for cataloguing many maps
+    """
+
+    #initialise the parser
+    argparser = argparse.ArgumentParser(
+        description="XFM data loader and analysis package - header catalogue"
+    )
+
+    #--------------------------
+    #set up the expected args
+    #--------------------------
+    argparser.add_argument(
+        "-cat", "--catalogue",
+        help="Specify directories, .GeoPIXE files or glob patterns to be catalogued",
+        nargs='+',
+    )
+    argparser.add_argument(
+        "-cr", "--catalogue-recursive",
+        help="Search directories recursively for .GeoPIXE files",
+        action='store_true',
+    )
+    argparser.add_argument(
+        "-cw", "--catalogue-workers",
+        help="Number of files read at once"
+        "Defaults to 16",
+        type=int,
+        default=int(16),
+    )
+    argparser.add_argument(
+        "-co", "--catalogue-output",
+        help="Write the catalogue to file, as .csv or .json"
+        "Otherwise the catalogue is printed only",
+        type=os.path.abspath,
+    )
+
+    args = argparser.parse_args(args_in)
+
+    args = checkargs_catalogue(args, config)
+
+    return args
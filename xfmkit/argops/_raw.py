@@ -3,7 +3,6 @@ import argparse
 import psutil
 import logging
 
-import xfmkit.processops as processops
 import xfmkit.config as config
 
 logger = logging.getLogger(__name__)
@@ -40,6 +39,15 @@ def checkargs(args, config):
         print("continuing with --write-modified enabled")
         args.write_modified = True
 
+    if args.out_of_core and args.sparse:
+        print("-------------------------------")
+        print("WARNING: --out-of-core requires the dense dataset")
+        print("continuing with --sparse disabled")
+        args.sparse = False
+
+    if args.out_of_core or args.export_tiled:
+        args.export_data = True
+
     if args.index_only and args.export_data:
         print("-------------------------------")
         print("WARNING: must parse map to use --export-data")
@@ -61,6 +69,31 @@ def checkargs(args, config):
     else:
        raise ValueError("modify-deadtimes value out of range")
 
+    if args.roi and args.write_modified:
+        print("-------------------------------")
+        print("WARNING: cropped .GeoPIXE file is written from the full map")
+        print("continuing with --roi disabled")
+        args.roi = False
+
+    if args.roi:
+        if args.x_coords == None and args.y_coords == None:
+            raise ValueError("--roi requires --x-coords and/or --y-coords")
+        if args.x_coords == None:
+            args.x_coords = [ 0, int(999999)]
+        if args.y_coords == None:
+            args.y_coords = [0 , int(999999)]
+
+        if (args.x_coords[0] >= args.x_coords[1]):
+            raise ValueError("First x_coordinate must be < second x_coordinate")
+        if (args.y_coords[0] >= args.y_coords[1]):
+            raise ValueError("First y_coordinate must be < second y_coordinate")
+
+        if not args.memory_map:
+            print("-------------------------------")
+            print("WARNING: --roi seeks within a memory-mapped file")
+            print("continuing with --memory-map enabled")
+            args.memory_map = True
+
     if args.write_modified:
         if args.x_coords == None:
             args.x_coords = [ 0, int(999999)]
@@ -72,11 +105,128 @@ def checkargs(args, config):
         if (args.y_coords[0] >= args.x_coords[1]):
             raise ValueError("First y_coordinate must be < second y_coordinate")
 
-    elif args.x_coords != None or args.y_coords != None:
+    elif (args.x_coords != None or args.y_coords != None) and not args.roi:
         print("-------------------------------")
         print("WARNING: crop coordinates given without --write-modified")
         print("cropped .GeoPIXE file will not will be produced")        
 
+    if args.jobs < 1:
+        raise ValueError("Number of parse processes must be >= 1")
+
+    if args.multiload and args.memory_map:
+        print("-------------------------------")
+        print("WARNING: --multiload has no effect on a memory-mapped file")
+        print("continuing with --multiload disabled")
+        args.multiload = False
+
+    if args.stream and args.classify_spectra:
+        print("-------------------------------")
+        print("WARNING: --classify-spectra requires the full dataset")
+        print("continuing with --stream disabled")
+        args.stream = False
+
+    if args.stream and args.export_data:
+        print("-------------------------------")
+        print("WARNING: --export-data requires the full dataset")
+        print("continuing with --stream disabled")
+        args.stream = False
+
+    if args.stream and args.sparse:
+        print("-------------------------------")
+        print("WARNING: --sparse has no effect when streaming")
+        print("continuing with --sparse disabled")
+        args.sparse = False
+
+    if args.rebin < 1:
+        raise ValueError("Channel rebin factor must be >= 1")
+
+    if args.channel_window != None and not len(args.channel_window) in [ 0, 2 ]:
+        raise ValueError("Channel window must be given as: start, end")
+
+    if ( args.channel_window != None or args.rebin > 1 ) and args.modify_deadtimes < 0:
+        print("-------------------------------")
+        print("WARNING: deadtimes will be predicted from counts within --channel-window only")
+
+    if args.reduced and args.export_data:
+        print("-------------------------------")
+        print("WARNING: --export-data requires the full dataset")
+        print("continuing with --reduced disabled")
+        args.reduced = False
+
+    if args.reduced and args.stream:
+        print("-------------------------------")
+        print("WARNING: --reduced has no effect when streaming")
+        print("continuing with --reduced disabled")
+        args.reduced = False
+
+    if args.reduced and args.sparse:
+        print("-------------------------------")
+        print("WARNING: --sparse has no effect with --reduced")
+        print("continuing with --sparse disabled")
+        args.sparse = False
+
+    if args.reduced and args.jobs > 1:
+        print("-------------------------------")
+        print("WARNING: reduced parse runs in a single process")
+        print("continuing with --jobs 1")
+        args.jobs = 1
+
+    if args.sparse and args.jobs > 1:
+        print("-------------------------------")
+        print("WARNING: sparse parse runs in a single process")
+        print("continuing with --jobs 1")
+        args.jobs = 1
+
+    if args.follow and args.follow_interval <= 0:
+        raise ValueError("Follow interval must be > 0")
+
+    if args.follow and args.roi:
+        print("-------------------------------")
+        print("WARNING: --roi is not available while following a file")
+        print("continuing with --roi disabled")
+        args.roi = False
+
+    if args.follow and ( args.sparse or args.stream or args.reduced ):
+        print("-------------------------------")
+        print("WARNING: --follow parses into the dense dataset")
+        print("continuing with --sparse, --stream and --reduced disabled")
+        args.sparse = False
+        args.stream = False
+        args.reduced = False
+
+    if args.follow and args.jobs > 1:
+        print("-------------------------------")
+        print("WARNING: --follow parses in a single process")
+        print("continuing with --jobs 1")
+        args.jobs = 1
+
+    if args.validate and args.follow:
+        print("-------------------------------")
+        print("WARNING: --validate is not available while following a file")
+        print("continuing with --validate disabled")
+        args.validate = False
+
+    if args.validate and args.write_modified:
+        print("-------------------------------")
+        print("WARNING: modified .GeoPIXE file cannot be written from a repaired index")
+        print("continuing with --write-modified disabled")
+        args.write_modified = False
+
+    if args.validate and args.stream_index:
+        print("-------------------------------")
+        print("WARNING: --validate indexes from a memory-mapped file")
+        print("continuing with --stream-index disabled")
+        args.stream_index = False
+
+    if args.validate and not args.memory_map:
+        print("-------------------------------")
+        print("WARNING: --validate seeks within a memory-mapped file")
+        print("continuing with --memory-map enabled")
+        args.memory_map = True
+
+    if args.memory_limit is not None and args.memory_limit <= 0:
+        raise ValueError("Memory limit must be > 0")
+
     #if chunk size is small, convert to bytes
     if args.chunk_size < config['MBCONV']:
         args.chunk_size=args.chunk_size*config['MBCONV']
@@ -107,7 +257,7 @@ def readargs(args_in, config):
 
         #sanity check and use config if failed
     if not isinstance(default_chunksize, int) or default_chunksize <= 1000:
-        default_chunksize = config['CHUNKSIZE']
+        default_chunksize = config['CHUNKSIZE_FALLBACK']
 
     #--------------------------
     #set up the expected args
@@ -140,6 +290,21 @@ def readargs(args_in, config):
         "to export as csv, change SAVEFMT_READABLE = True in xfmkit/config.yaml",
         action='store_true',
     )
+    argparser.add_argument(
+        "-et", "--export-tiled", 
+        help="Export pixel data as a compressed, tiled store instead of .npy"
+        "spatial tiles x channel blocks are compressed independently, empty tiles are skipped"
+        "windows can be read back via xfmkit.tilestore.TileStore(path).read(y, x, channels)"
+        "implies --export-data",
+        action='store_true',
+    )
+    argparser.add_argument(
+        "-oc", "--out-of-core", 
+        help="Parse pixel data directly into a memory-mapped .npy file in the exports directory"
+        "allows maps larger than physical memory, and produces the --export-data file as it parses"
+        "implies --export-data",
+        action='store_true',
+    )
     argparser.add_argument(
         "-w", "--write-modified", 
         help="Write modified .GeoPIXE file readable by CSIRO GeoPIXE package"
@@ -152,8 +317,8 @@ def readargs(args_in, config):
         help="Start and end coordinates in X direction"
         "as: X_start, X_end"
         "Will crop exported .GeoPIXE file to within these coordinates"
-        "Does not affect parsing and analysis, only exported .geoPIXE file"
-        "use with --write-modified",
+        "Does not affect parsing and analysis unless --roi is given"
+        "use with --write-modified or --roi",
         nargs='+', 
         type=int, 
     )
@@ -162,11 +327,19 @@ def readargs(args_in, config):
         help="Start and end coordinates in Y direction"
         "as: Y_start, Y_end"
         "Will crop exported .GeoPIXE file to within these coordinates"
-        "Does not affect parsing and analysis, only exported .geoPIXE file"
-        "use with --write-modified",
+        "Does not affect parsing and analysis unless --roi is given"
+        "use with --write-modified or --roi",
         nargs='+', 
         type=int, 
     )
+    argparser.add_argument(
+        '-r', "--roi", 
+        help="Parse only the region within --x-coords and --y-coords"
+        "Seeks directly to each row of the region using the pixel index"
+        "Outputs and analysis are sized to the region"
+        "not compatible with --write-modified",
+        action='store_true', 
+    )
     argparser.add_argument(
         "-dt", "--modify-deadtimes", 
         help="Fill or predict deadtimes and write to output .GeoPIXE file"
@@ -219,17 +392,122 @@ def readargs(args_in, config):
     #resource args eg. multiload, batch size
     argparser.add_argument(
         '-m', "--multiload", 
-        help="Pre-cache memory using second process"
+        help="Pre-cache memory using a reader thread"
         "Prevents parse operation waiting on disk I/O"
         "Increases memory usage for buffer to 2x --memory-size",
         action='store_true', 
     )
+    argparser.add_argument(
+        '-mm', "--memory-map", 
+        help="Memory-map the whole file instead of reading it in chunks"
+        "Avoids copying bytes into buffers during indexing and parsing"
+        "--chunk-size is still used to size each parse window",
+        action='store_true', 
+    )
+    argparser.add_argument(
+        '-si', "--stream-index", 
+        help="Index by streaming each pixel header through the chunked buffer"
+        "and write modified files one record at a time in the same way"
+        "Default indexes all pixel headers at once from a memory-mapped file"
+        "and writes modified files as contiguous byte runs",
+        action='store_true', 
+    )
     argparser.add_argument(
         '-p', "--python-only", 
         help="Parse using python only"
         "Exclude C++ submodule",
         action='store_true', 
     )    
+    argparser.add_argument(
+        '-j', "--jobs", 
+        help="Number of processes to parse pixel data in parallel"
+        "Each process reads its own partition of the file"
+        "Defaults to 1 (single process)",
+        type=int, 
+        default=int(1),
+    )
+    argparser.add_argument(
+        '-sp', "--sparse", 
+        help="Store pixel spectra as sparse CSR arrays instead of a dense cube"
+        "Holds only the channels present in each record, greatly reducing memory for large maps"
+        "Parses via Python, in a single process",
+        action='store_true', 
+    )
+    argparser.add_argument(
+        '-cw', "--channel-window", 
+        help="Keep only channels within a window while parsing"
+        "as: start, end"
+        "If given without values, uses MIN_E to MAX_E from config"
+        "Channels outside the window are dropped from all outputs, including sums",
+        nargs='*', 
+        type=int, 
+    )
+    argparser.add_argument(
+        '-rb', "--rebin", 
+        help="Sum every N channels into one while parsing"
+        "eg. 4 reduces 4096 channels to 1024"
+        "Defaults to 1 (no rebinning)",
+        type=int, 
+        default=int(1),
+    )
+    argparser.add_argument(
+        '-rd', "--reduced", 
+        help="Accumulate flattened spectra and per-detector sums while parsing"
+        "Does not keep per-detector spectra, reducing memory by the number of detectors"
+        "Parses via Python, in a single process"
+        "not compatible with --export-data",
+        action='store_true', 
+    )
+    argparser.add_argument(
+        '-st', "--stream", 
+        help="Decode pixel data in batches without holding the full dataset"
+        "Derived sums, deadtime prediction and colour maps are calculated batch by batch"
+        "Memory use is bounded by --chunk-size"
+        "not compatible with --classify-spectra and --export-data",
+        action='store_true', 
+    )
+    argparser.add_argument(
+        '-fl', "--follow", 
+        help="Follow a .GeoPIXE file while it is still being written"
+        "new rows are indexed and parsed as they complete"
+        "with --analyse, deadtime and colour plots are refreshed as rows land",
+        action='store_true', 
+    )
+    argparser.add_argument(
+        '-fi', "--follow-interval", 
+        help="Seconds between checks for new rows while following"
+        "Defaults to 10",
+        type=float, 
+        default=float(10),
+    )
+    argparser.add_argument(
+        '-ft', "--follow-timeout", 
+        help="Stop following after this many seconds without a new row"
+        "the map is then truncated to the rows found"
+        "Defaults to 600",
+        type=float, 
+        default=float(600),
+    )
+    argparser.add_argument(
+        '-v', "--validate", 
+        help="Check every pixel record while indexing, and repair the index around corrupt records"
+        "records lost to corruption are parsed as empty spectra"
+        "writes integrity_report.json to the output directory"
+        "Always re-indexes the file, ignoring any cached index",
+        action='store_true', 
+    )
+    argparser.add_argument(
+        '-ml', "--memory-limit", 
+        help="Memory (in Mb) available to the parse"
+        "a strategy that fits is selected before parsing, if none is given"
+        "Defaults to MEMORY_FRACTION of available system memory",
+        type=int, 
+    )
+    argparser.add_argument(
+        '-np', "--no-plan", 
+        help="Parse as requested without estimating memory beforehand",
+        action='store_true', 
+    )
     argparser.add_argument(
         '-s', "--chunk-size", 
         help="Size of memory buffer (in Mb) to load while parsing"
@@ -0,0 +1,132 @@
+import os
+import argparse
+import logging
+
+import xfmkit.synthetic as synthetic
+
+logger = logging.getLogger(__name__)
+
+
+def checkargs_synthetic(args, config):
+    """
+    sanity check on synthetic map args
+    """
+    if args.synthetic == None:
+        raise ValueError("No output file specified")
+
+    if not os.path.splitext(args.synthetic)[1] == config['FTYPE']:
+        raise ValueError(f"Synthetic map must be written as {config['FTYPE']}")
+
+    if args.xres < 1 or args.yres < 1:
+        raise ValueError("Map dimensions must be >= 1")
+
+    if args.detectors < 1:
+        raise ValueError("Number of detectors must be >= 1")
+
+    if args.rate <= 0:
+        raise ValueError("Count rate must be > 0")
+
+    if not 0 <= args.sparsity < 1:
+        raise ValueError("Sparsity must be >= 0 and < 1")
+
+    if args.truncate != None and not 0 < args.truncate <= 1:
+        raise ValueError("Truncated fraction must be > 0 and <= 1")
+
+    if args.corrupt < 0:
+        raise ValueError("Number of corrupt records must be >= 0")
+
+    return args
+
+
+def readargs_synthetic(args_in, config):
+    """
+    read in a set of command-line args for writing a synthetic map
+    """
+
+    #initialise the parser
+    argparser = argparse.ArgumentParser(
+        description="XFM data loader and analysis package - synthetic map generator"
+    )
+
+    #--------------------------
+    #set up the expected args
+    #--------------------------
+    argparser.add_argument(
+        "-syn", "--synthetic",
+        help="Specify the .GeoPIXE file to be written",
+        type=os.path.abspath,
+    )
+    argparser.add_argument(
+        "-x", "--xres",
+        help="Map width in pixels"
+        "Defaults to 100",
+        type=int,
+        default=int(100),
+    )
+    argparser.add_argument(
+        "-y", "--yres",
+        help="Map height in pixels"
+        "Defaults to 100",
+        type=int,
+        default=int(100),
+    )
+    argparser.add_argument(
+        "-d", "--detectors",
+        help="Number of detectors"
+        "Defaults to 2",
+        type=int,
+        default=int(2),
+    )
+    argparser.add_argument(
+        "-r", "--rate",
+        help="Mean counts per spectrum"
+        "Defaults to 1000",
+        type=float,
+        default=float(1000),
+    )
+    argparser.add_argument(
+        "-rd", "--rate-distribution",
+        help="Distribution of counts per spectrum"
+        "Defaults to lognormal",
+        choices=synthetic.RATE_DISTRIBUTIONS,
+        default="lognormal",
+    )
+    argparser.add_argument(
+        "-sp", "--sparsity",
+        help="Fraction of empty channels in each spectrum"
+        "Defaults to 0.9",
+        type=float,
+        default=float(0.9),
+    )
+    argparser.add_argument(
+        "-dt", "--deadtime",
+        help="Mean deadtime (%%), scaled by counts in each spectrum"
+        "Defaults to 5",
+        type=float,
+        default=float(5),
+    )
+    argparser.add_argument(
+        "-t", "--truncate",
+        help="Cut the file to this fraction of its full size, mid-record",
+        type=float,
+    )
+    argparser.add_argument(
+        "-c", "--corrupt",
+        help="Number of records with corrupted flag or length"
+        "Defaults to 0",
+        type=int,
+        default=int(0),
+    )
+    argparser.add_argument(
+        "-sd", "--seed",
+        help="Seed for the random generator"
+        "Defaults to 0",
+        type=int,
+        default=int(0),
+    )
+
+    args = argparser.parse_args(args_in)
+
+    args = checkargs_synthetic(args, config)
+
+    return args
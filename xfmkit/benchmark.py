@@ -0,0 +1,395 @@
+import os
+import sys
+import json
+import platform
+import threading
+import subprocess
+from contextlib import contextmanager
+
+import numpy as np
+import psutil
+
+from tabulate import tabulate
+
+import xfmkit.structures as structures
+import xfmkit.parser as parser
+import xfmkit.dtops as dtops
+import xfmkit.instrument as instrument
+
+try:
+    import parsercore
+except ImportError:
+    parsercore = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+"""
+Benchmarks each stage of a parse over a matrix of map sizes
+
+- each stage is run on a synthetic map, see synthetic.py
+    setup for each stage (opening, indexing, parsing) is not timed
+- startup runs xfmkit-raw -i in a fresh interpreter, so includes import time
+- each stage is repeated, keeping the fastest run
+- throughput per stage as per instrument.Stage,
+    with peak resident memory sampled while the stage runs
+- results are written to json, and compared against a stored baseline
+    a loss of throughput or gain in memory beyond the tolerance is a regression
+"""
+#-----------------------------------
+#vars
+#-----------------------------------
+RESULTS_NAME = "benchmark_results.json"
+
+DEFAULT_SIZES = [ "64x64", "128x128", "256x128" ]
+
+#stages in order of a run, see read() and read_raw()
+STAGES = [ "startup", "index", "index_stream", "parse", "parse_python", "derived", "write", "write_stream", \
+            "colours", "deadtime", "clustering" ]
+
+TOLERANCE = 0.25        #fractional change counted as a regression
+MIN_WALL = 0.01         #(s) faster stages are too noisy to compare
+MIN_MEMORY = 16         #(Mb) smaller changes in memory are not compared
+
+#HDBSCAN in clustering.classify needs a minimum cluster size of at least 2, ie. npx/1000 > 1.5
+MIN_CLUSTER_PIXELS = 2000
+
+#read_raw in a fresh interpreter, run from the package root
+STARTUP_COMMAND = "import sys; from xfmkit.entry_raw import read_raw; read_raw(sys.argv[1:])"
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_INTERVAL = 0.005 #(s) between samples of resident memory
+MBCONV = 1048576        #bytes per Mb
+
+
+class RssMonitor:
+    """
+    samples resident memory of this process and its children from a background thread
+        keeps the peak since the last reset
+    """
+    def __init__(self, interval: float=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def rss(self):
+        total = self.process.memory_info().rss
+
+        for child in self.process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+
+        return total
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, self.rss())
+            self.stopped.wait(self.interval)
+
+    def reset(self):
+        """
+        restart the peak from current memory
+
+        returns current memory
+        """
+        current = self.rss()
+        self.peak = current
+
+        return current
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class MapBenchmark:
+    """
+    runs stages against one map, holding the setup they share
+    """
+    def __init__(self, config, args, dirs, npx: int, monitor):
+        self.config = config
+        self.args = args
+        self.dirs = dirs
+        self.npx = npx
+        self.monitor = monitor
+        self.samples = {}
+        self.parsed = None
+
+    def openmap(self, write: bool=False):
+        """
+        fresh map and pixel objects, as per read()
+        """
+        xfmap = structures.Xfmap(self.config, self.dirs.fi, self.dirs.fsub if write else None, write, \
+            self.args.chunk_size, self.args.multiload, self.args.memory_map)
+
+        pixelseries = structures.PixelSeries(self.config, xfmap, xfmap.npx, xfmap.detarray, True)
+
+        return xfmap, pixelseries
+
+    def indexed(self, write: bool=False):
+        xfmap, pixelseries = self.openmap(write)
+        pixelseries, xfmap = parser.indexmap_vector(xfmap, pixelseries)
+
+        return xfmap, pixelseries
+
+    def parsedmap(self):
+        """
+        map parsed once, with derived properties, shared by the analysis stages
+        """
+        if self.parsed is None:
+            xfmap, pixelseries = self.indexed()
+            pixelseries = parser.parse(xfmap, pixelseries, self.args.multiload, parsercore is None)
+            pixelseries = pixelseries.get_derived()
+            xfmap.closefiles()
+            self.parsed = ( xfmap, pixelseries )
+
+        return self.parsed
+
+    @contextmanager
+    def measure(self, name: str):
+        """
+        time a stage, with peak memory while it runs
+
+        yields instrument.Stage, to which counts may be added
+        """
+        start = self.monitor.reset()
+
+        with instrument.stage(name) as stage:
+            yield stage
+
+        peak = max(self.monitor.peak, self.monitor.rss())
+
+        self.samples.setdefault(name, []).append({
+            **stage.asdict(),
+            "rss_peak_mb": round(peak/MBCONV, 3),
+            "rss_delta_mb": round((peak-start)/MBCONV, 3),
+        })
+
+    def best(self, name: str):
+        """
+        fastest run of a stage
+        """
+        return min(self.samples[name], key=lambda sample: sample["wall_s"])
+
+
+def datasize(pixelseries):
+    return np.sum(pixelseries.pxlen, dtype=np.uint64)
+
+
+def bench_startup(bench):
+    """
+    index-only run from the command line, dominated by interpreter start and imports
+    """
+    command = [ sys.executable, "-c", STARTUP_COMMAND, "-f", bench.dirs.fi, "-o", bench.dirs.odir, "-i", "-ff" ]
+
+    with bench.measure("startup") as stage:
+        subprocess.run(command, check=True, cwd=PACKAGE_ROOT, stdout=subprocess.DEVNULL)
+        stage.add(pixels=bench.npx)
+
+
+def bench_index(bench):
+    xfmap, pixelseries = bench.openmap()
+
+    with bench.measure("index") as stage:
+        pixelseries, xfmap = parser.indexmap_vector(xfmap, pixelseries)
+        stage.add(datasize(pixelseries), pixelseries.pxlen.size, pixelseries.npx)
+
+    xfmap.closefiles()
+
+
+def bench_index_stream(bench):
+    xfmap, pixelseries = bench.openmap()
+
+    with bench.measure("index_stream") as stage:
+        pixelseries, xfmap = parser.indexmap(xfmap, pixelseries, bench.args.multiload)
+        stage.add(datasize(pixelseries), pixelseries.pxlen.size, pixelseries.npx)
+
+    xfmap.closefiles()
+
+
+def bench_parse(bench, name: str, python_only: bool):
+    xfmap, pixelseries = bench.indexed()
+
+    with bench.measure(name) as stage:
+        pixelseries = parser.parse(xfmap, pixelseries, bench.args.multiload, python_only)
+        stage.add(datasize(pixelseries), pixelseries.pxlen.size, pixelseries.npx)
+
+    xfmap.closefiles()
+
+
+def bench_derived(bench):
+    xfmap, pixelseries = bench.parsedmap()
+
+    with bench.measure("derived") as stage:
+        pixelseries.get_derived()
+        stage.add(pixels=pixelseries.npx)
+
+
+def bench_write(bench, name: str, bulk: bool):
+    xfmap, pixelseries = bench.indexed(write=True)
+    args = bench.args
+
+    with bench.measure(name) as stage:
+        if bulk:
+            parser.writemap_bulk(bench.config, xfmap, pixelseries, args.x_coords, args.y_coords, args.modify_deadtimes)
+        else:
+            parser.writemap(bench.config, xfmap, pixelseries, args.x_coords, args.y_coords, args.modify_deadtimes, args.multiload)
+        stage.add(xfmap.outfile.tell(), pixelseries.pxlen.size, pixelseries.npx)
+
+    xfmap.closefiles()
+
+
+def bench_colours(bench):
+    import xfmkit.rgbspectrum as rgbspectrum
+
+    xfmap, pixelseries = bench.parsedmap()
+
+    with bench.measure("colours") as stage:
+        rgbimg, ___, ___, ___ = rgbspectrum.calccolours(bench.config, pixelseries, xfmap, pixelseries.flattened, bench.dirs)
+        stage.add(pixels=pixelseries.npx)
+
+    if rgbimg is None:
+        raise ValueError("colour map failed during benchmark")
+
+
+def bench_deadtime(bench):
+    xfmap, pixelseries = bench.parsedmap()
+
+    with bench.measure("deadtime") as stage:
+        dtops.predict_dt(pixelseries, xfmap, bench.config)
+        stage.add(pixels=pixelseries.npx)
+
+
+def bench_clustering(bench):
+    import xfmkit.clustering as clustering
+
+    xfmap, pixelseries = bench.parsedmap()
+
+    with bench.measure("clustering") as stage:
+        clustering.run(pixelseries.flattened, bench.dirs.embeddings, force_embed=True, force_clust=True)
+        stage.add(pixels=pixelseries.npx)
+
+
+RUNNERS = {
+    "startup": bench_startup,
+    "index": bench_index,
+    "index_stream": bench_index_stream,
+    "parse": lambda bench: bench_parse(bench, "parse", False),
+    "parse_python": lambda bench: bench_parse(bench, "parse_python", True),
+    "derived": bench_derived,
+    "write": lambda bench: bench_write(bench, "write", True),
+    "write_stream": lambda bench: bench_write(bench, "write_stream", False),
+    "colours": bench_colours,
+    "deadtime": bench_deadtime,
+    "clustering": bench_clustering,
+}
+
+
+def runmap(config, args, dirs, npx: int, stages, repeats: int, monitor):
+    """
+    benchmark stages against the map in dirs.fi
+
+    returns list of result rows, one per stage, fastest run of each
+    """
+    bench = MapBenchmark(config, args, dirs, npx, monitor)
+    rows = []
+
+    for name in stages:
+        if name == "parse" and parsercore is None:
+            print("WARNING: parsercore submodule not available")
+            print("continuing without the parse stage")
+            continue
+
+        if name == "clustering" and npx < MIN_CLUSTER_PIXELS:
+            print(f"WARNING: clustering requires at least {MIN_CLUSTER_PIXELS} pixels")
+            print("continuing without the clustering stage")
+            continue
+
+        print("--------------")
+        print(f"BENCHMARK {name}")
+
+        for ___ in range(repeats):
+            RUNNERS[name](bench)
+
+        rows.append(bench.best(name))
+
+    bench.parsed = None
+
+    return rows
+
+
+def machine():
+    """
+    properties of this machine, kept with the results
+    """
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+        "memory_mb": round(psutil.virtual_memory().total/MBCONV),
+        "parsercore": parsercore is not None,
+    }
+
+
+def exportresults(results, filepath):
+    """
+    write results to json
+    """
+    with open(filepath, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def loadresults(filepath):
+    with open(filepath, "r") as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance: float=TOLERANCE):
+    """
+    compare each stage and map size present in both results and baseline
+
+    returns list of regressions as [ size, stage, metric, baseline, current, change (%) ]
+    """
+    reference = { ( row["size"], row["stage"] ): row for row in baseline["results"] }
+
+    regressions = []
+
+    for row in results["results"]:
+        base = reference.get(( row["size"], row["stage"] ))
+
+        if base is None:
+            continue
+
+        #throughput, from the fastest run
+        if base["wall_s"] >= MIN_WALL and base["px_per_s"] and row["px_per_s"] is not None:
+            if row["px_per_s"] < base["px_per_s"]*(1-tolerance):
+                regressions.append([ row["size"], row["stage"], "px_per_s", base["px_per_s"], row["px_per_s"], \
+                    round(100*(row["px_per_s"]/base["px_per_s"]-1), 1) ])
+
+        #memory gained while the stage runs
+        gained = row["rss_delta_mb"] - base["rss_delta_mb"]
+
+        if gained > MIN_MEMORY and row["rss_delta_mb"] > base["rss_delta_mb"]*(1+tolerance):
+            regressions.append([ row["size"], row["stage"], "rss_delta_mb", base["rss_delta_mb"], row["rss_delta_mb"], \
+                round(100*gained/max(base["rss_delta_mb"], 1), 1) ])
+
+    return regressions
+
+
+def report(results):
+    """
+    print a table of results
+    """
+    columns = [ "size", "stage", "wall_s", "cpu_s", "mb_per_s", "px_per_s", "rss_peak_mb", "rss_delta_mb" ]
+
+    print(tabulate([ [ row[column] for column in columns ] for row in results["results"] ], \
+        headers=columns, tablefmt='psql'))
@@ -1,10 +1,13 @@
 import struct 
 import sys
+import os
+import array
 import numpy as np
 import json
 import copy
-
-import multiprocessing as mp
+import mmap
+import queue
+import threading
 
 import xfmkit.byteops as byteops
 import xfmkit.parser as parser
@@ -18,23 +21,40 @@ logger = logging.getLogger(__name__)
 this = sys.modules[__name__]
 
 pxheadstruct = struct.Struct("<ccI3Hf")
+pxlenstruct = struct.Struct("<I")
+
+#structured equivalent of pxheadstruct, to decode many headers at once
+pxheaddtype = np.dtype([('pxflag', 'S2'), ('pxlen', '<u4'), ('xidx', '<u2'), \
+                        ('yidx', '<u2'), ('det', '<u2'), ('dt', '<f4')])
 
-def worker(infile, chunksize, pipe_child):
+#channel/count pairs decoded at once via NumPy, independent of the read chunk
+#   bounds the per-pair index temporaries to a few Mb
+DECODE_PAIRS = 262144
+
+def reader(infile, buffers, requests, results):
     """
-    Worker for multiload
-        loads new buffer object in a subprocess to cache it 
-        then sends data and file index via pipe to MapBuffer.retrieve()
-            will hold open until data is received
-            to take data as dummy and close, use MapBuffer.wait()
+    Reader thread for multiload
+        persists for the life of a MapBuffer
+        fills the requested preallocated buffer from infile via readinto
+        then returns file index and length read via results
+        exits on request None
     
     NB: reads from infile concurrently, make sure completed before main
         reinitialises buffer or moves file head
     """
-    nextbuffer=MapBuffer(infile, chunksize, True)
-    pipe_child.send(nextbuffer.data)
-    pipe_child.send(nextbuffer.fidx)
-    pipe_child.close()
-    #should wait here until received
+    while True:
+        i = requests.get()
+
+        if i is None:
+            return
+
+        try:
+            fidx = infile.tell()
+            nread = infile.readinto(buffers[i])
+            results.put((fidx, nread))
+        except Exception as err:
+            results.put(err)
+
 
 class MapBuffer:
     """
@@ -44,11 +64,6 @@ class MapBuffer:
         self.infile=infile
         self.fidx = self.infile.tell()
 
-        if (self.fidx == 0):
-            cache_flag = True
-        else:
-            cache_flag = False
-
         self.chunksize=chunksize
         self.multiload=multiload
         self.len = 0
@@ -61,41 +76,58 @@ class MapBuffer:
 
         self.check()
 
-        if self.multiload and cache_flag:
+        self.thread = None
+        self.pending = False    #a read is queued and its result not yet taken
+        if self.multiload:
+            #two chunks, alternately filled by the reader thread and used here
+            self.buffers = [ bytearray(self.chunksize), bytearray(self.chunksize) ]
+            self.spare = 0
+            self.requests = queue.Queue()
+            self.results = queue.Queue()
+
+            self.thread = threading.Thread(target=reader, \
+                args=(self.infile, self.buffers, self.requests, self.results), daemon=True)
+            self.thread.start()
+
             self.cache()
 
         return
 
     def cache(self):
         """
-        Spawn new multiload to pre-load next chunk
-        Create a pipe to transfer newly loaded chunk
+        Request reader thread to pre-load next chunk
+            into whichever buffer is not currently in use
         """
-        #print('Caching...')
-        self.pipe_parent, self.pipe_child = mp.Pipe()   
-        self.process = mp.Process(target=worker, args=(self.infile, self.chunksize, self.pipe_child))
-        self.process.start()
+        self.requests.put(self.spare)
+        self.pending = True
 
     def retrieve(self):
         """
         Receives data and file index from next chunk preloaded by multiload
 
-            Waits for process to complete, close pipes
+            Waits for read to complete
             Assign new data to current buffer
             Begin caching next chunk
         """
         if self.multiload:
-            nextdata=self.pipe_parent.recv()
-            nextfidx=self.pipe_parent.recv()
+            result = self.results.get()
+            self.pending = False
 
-            self.process.join()    
-            self.pipe_parent.close
-            self.pipe_child.close
+            if isinstance(result, Exception):
+                raise EOFError(f"No data to load from {self.infile}") from result
 
-            self.data = nextdata
+            nextfidx, nread = result
+
+            if nread == self.chunksize:
+                self.data = self.buffers[self.spare]
+            else:
+                #final chunk, trimmed to length read
+                self.data = bytes(memoryview(self.buffers[self.spare])[:nread])
             self.fidx = nextfidx
-            self.len = len(nextdata)
+            self.len = nread
 
+            #previous chunk is no longer in use, so becomes the spare
+            self.spare = 1 - self.spare
             self.cache()
         else:
             try:
@@ -127,15 +159,71 @@ class MapBuffer:
     def wait(self):
         """
         wait for running cache to complete
+            and stop the reader thread
         """
-        if self.multiload:
-            #need to receive sends, otherwise will block indefinitely
-            ___=self.pipe_parent.recv()
-            ___=self.pipe_parent.recv()
-            self.process.join()
+        if self.thread is not None:
+            #take the pending read as dummy, if any
+            #   none is pending if retrieve raised before re-caching
+            if self.pending:
+                ___=self.results.get()
+                self.pending = False
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
         else:
             pass
 
+class MmapBuffer:
+    """
+    Object exposing the whole file as a single memory-mapped chunk
+        mirrors the MapBuffer interface, so getstream() etc. accept either
+
+    data is a zero-copy memoryview over the mapping
+        no chunk boundaries: any attempt to load beyond it is EOF
+    """
+    def __init__(self, infile, chunksize: int, multiload: bool):
+        self.infile=infile
+        self.fidx = 0
+        self.chunksize=chunksize
+        self.multiload=False    #whole file is already available, nothing to pre-cache
+
+        try:
+            self.mmap = mmap.mmap(self.infile.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise EOFError(f"No data to load from {self.infile}")
+
+        self.data = memoryview(self.mmap)
+        self.len = len(self.data)
+
+        self.check()
+
+        return
+
+    def retrieve(self):
+        """
+        Mapping already covers the full file
+            any request for a further chunk means we have run past EOF
+        """
+        print(f"\n WARNING: Early EOF at byte {self.len} - map dimensions may be incorrect in file header.")
+        raise parser.MapEarlyStop
+
+    def check(self):
+        """
+        simple sanity checks/readouts on self
+        """
+        if self.len == 0:
+            print(f"\n WARNING: Attempting to map empty file - dimensions in header may be incorrect.")
+            raise parser.MapEarlyStop
+
+        return
+
+    def wait(self):
+        """
+        no cache process to wait for
+        """
+        pass
+
+
 def getstream(buffer, idx: int, length: int):
     """
     get the next stream, loading new buffer if current read would exceed buffer length
@@ -203,6 +291,60 @@ def getdetectors(buffer, idx, pxheaderlen):
 
     return detarray[:i]
 
+def probeheader(infile, pxheaderlen: int):
+    """
+    read the JSON header and detector config directly from the file
+        reads only the header length, the header, and pixel headers until detectors repeat
+        equivalent to readjsonheader and getdetectors, without loading a chunk
+
+    returns header dict, byte index of first pixel record, detector array
+    """
+    infile.seek(0)
+
+    raw = infile.read(2)
+
+    if len(raw) < 2:
+        raise ValueError("FATAL: file header missing, cannot read map params")
+
+    headerlen = struct.unpack("<H", raw)[0]
+
+    if headerlen == 20550:  #(="DP" as <uint16)
+        raise ValueError("FATAL: file header missing, cannot read map params")
+    elif headerlen <= 500:
+        raise ValueError("FATAL: file header too small, check input")
+
+    headerraw = infile.read(headerlen)
+
+    if len(headerraw) < headerlen:
+        raise ValueError("FATAL: file ends within header")
+
+    headerdict = json.loads(headerraw.decode('utf-8'))
+
+    #step through pixel headers until detector 0 repeats
+    datastart = headerlen+2
+    idx = datastart
+    detectors = []
+
+    while True:
+        infile.seek(idx)
+        headstream = infile.read(pxheaderlen)
+
+        if len(headstream) < pxheaderlen:
+            raise parser.MapEarlyStop
+
+        pxlen, xidx, yidx, det, dt = readpxheader(headstream)
+
+        if len(detectors) > 0 and det == 0:
+            break
+
+        detectors.append(int(det))
+        idx += pxlen
+
+    infile.seek(0)
+
+    return headerdict, datastart, np.array(detectors, dtype=int)
+
+
 def readjsonheader(buffer, idx):
 
         if idx != 0:
@@ -223,7 +365,7 @@ def readjsonheader(buffer, idx):
             headerraw, idx, buffer = getstream(buffer, 2, headerlen)
 
             #read it as utf8
-            headerstream = headerraw.decode('utf-8')
+            headerstream = bytes(headerraw).decode('utf-8')
             
             #load into dictionary via json builtin
             headerdict = json.loads(headerstream)
@@ -273,6 +415,121 @@ def readpxheader(headstream):
     return pxlen, xidx, yidx, det, dt
 
 
+def hoprecords(data, idx: int, end: int, maxrecords: int, pxheaderlen: int):
+    """
+    locate pixel records by hopping over the record lengths
+        reads only the 4-byte length from each header
+        stops at maxrecords, or at the last record completed before end
+
+    takes: 
+        data supporting random access, ie. memory-mapped file
+        byte index of first record
+
+    returns: 
+        array of record start indexes, index following last record
+    """
+    offsets = array.array('Q')
+    nrecords = 0
+
+    while nrecords < maxrecords and idx+pxheaderlen <= end:
+        pxlen = pxlenstruct.unpack_from(data, idx+2)[0]
+
+        if pxlen < pxheaderlen:
+            raise ValueError(f"FATAL: pixel record at byte {idx} shorter than header")
+        if idx+pxlen > end:
+            break
+
+        offsets.append(idx)
+        idx+=pxlen
+        nrecords+=1
+
+    return np.array(offsets, dtype=np.uint64), idx
+
+
+def hopvalid(data, idx: int, end: int, maxrecords: int, pxheaderlen: int, bytesperchan: int):
+    """
+    as hoprecords, checking each record as it is passed
+        stops at the first record without a "DP" flag,
+        or with a length too short or not a whole number of channel/count pairs
+        or which runs past end
+
+    returns:
+        array of record start indexes, index following last valid record
+    """
+    offsets = array.array('Q')
+    nrecords = 0
+
+    while nrecords < maxrecords and idx+pxheaderlen <= end:
+        if not data[idx:idx+2] == b'DP':
+            break
+
+        pxlen = pxlenstruct.unpack_from(data, idx+2)[0]
+
+        if pxlen < pxheaderlen or (pxlen-pxheaderlen) % bytesperchan != 0 or idx+pxlen > end:
+            break
+
+        offsets.append(idx)
+        idx+=pxlen
+        nrecords+=1
+
+    return np.array(offsets, dtype=np.uint64), idx
+
+
+def resync(mm, idx: int, end: int, pxheaderlen: int, bytesperchan: int, ndet: int, xres: int, yres: int):
+    """
+    search forward from idx for the next plausible pixel record
+        a candidate begins with "DP", has a valid length, detector and coordinates,
+        and is followed by another "DP" flag, or ends exactly at end
+
+    takes mm supporting find, ie. mmap
+
+    returns byte index of the candidate, or end if none is found
+    """
+    pos = idx+1
+
+    while True:
+        pos = mm.find(b'DP', pos, end)
+
+        if pos < 0 or pos+pxheaderlen > end:
+            return end
+
+        ___, ___, pxlen, xidx, yidx, det, ___ = pxheadstruct.unpack_from(mm, pos)
+        follows = pos+pxlen
+
+        if pxlen >= pxheaderlen and (pxlen-pxheaderlen) % bytesperchan == 0 \
+                and xidx < xres and yidx < yres and det < ndet \
+                and ( follows == end or ( follows+2 <= end and mm[follows:follows+2] == b'DP' ) ):
+            return pos
+
+        pos+=1
+
+
+def readpxheaders(data, offsets, pxheaderlen: int, blocksize: int=262144):
+    """
+    read the headers for many pixel records at once
+
+    gathers the header bytes at each offset and views them as pxheaddtype
+        in blocks, to limit the size of the gather index
+
+    returns structured array with fields matching readpxheader
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    step = np.arange(pxheaderlen, dtype=np.uint64)
+
+    headers = np.empty(len(offsets), dtype=pxheaddtype)
+
+    for i in range(0, len(offsets), blocksize):
+        block = offsets[i:i+blocksize]
+        headers[i:i+blocksize] = raw[block[:,None]+step].view(pxheaddtype)[:,0]
+
+    #check for pixel start flag "DP":
+    badflags = np.flatnonzero(headers['pxflag'] != b'DP')
+    if len(badflags) > 0:
+        raise ValueError(f"ERROR: pixel flag 'DP' expected but not found at byte {offsets[badflags[0]]}")
+
+    return headers
+
+
 def readpxdata(stream, readlength, bytesperchan: int, nchannels: int):
     """
     read in data from a single pixel
@@ -312,6 +569,179 @@ def readpxdata(stream, readlength, bytesperchan: int, nchannels: int):
     return chan, counts
 
 
+def readpxpairs(data, offsets, pxlens, pxheaderlen: int, bytesperchan: int):
+    """
+    read the channel/count pairs for many pixel records at once
+
+    views the data as channel/count uint16 pairs
+        and gathers the pairs belonging to each record, in file order
+
+    takes: 
+        data supporting buffer protocol, eg. memory-mapped file
+        record start indexes and lengths, flattened
+
+    returns: 
+        channel and count arrays, concatenated across records
+        number of pairs in each record
+
+    NB: temporaries scale with the number of pairs, use iterpairs for large windows
+    """
+    starts = offsets.astype(np.int64)+pxheaderlen
+    npairs = (pxlens.astype(np.int64)-pxheaderlen)//bytesperchan
+
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.uint16), npairs
+
+    #record lengths are whole pairs, so all records share the same alignment
+    align = int(starts[0]) % bytesperchan
+    if np.any(starts % bytesperchan != align):
+        raise ValueError("pixel records not aligned to channel/count pairs")
+
+    pairs = np.frombuffer(data, dtype='<u2', offset=align, \
+            count=((len(data)-align)//bytesperchan)*2).reshape(-1,2)
+
+    #index of every pair, per record
+    total = int(np.sum(npairs))
+    pairidx = np.arange(total, dtype=np.int64) + np.repeat((starts-align)//bytesperchan - (np.cumsum(npairs)-npairs), npairs)
+
+    pxpairs = pairs[pairidx]
+
+    return pxpairs[:,0], pxpairs[:,1], npairs
+
+
+def pairblocks(npairs, maxpairs: int=DECODE_PAIRS):
+    """
+    split records into runs of about maxpairs channel/count pairs
+        a record is never split, so a run may exceed maxpairs by up to one record
+
+    returns list of (first record, last record+1)
+    """
+    if len(npairs) == 0:
+        return []
+
+    cumulative = np.cumsum(npairs)
+    nblocks = -(-int(cumulative[-1]) // maxpairs)
+
+    edges = np.searchsorted(cumulative, np.arange(1, nblocks, dtype=np.int64)*maxpairs, side='left') + 1
+    edges = np.unique(np.concatenate(( [0], np.minimum(edges, len(npairs)), [len(npairs)] )))
+
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+def iterpairs(data, offsets, pxlens, pxheaderlen: int, bytesperchan: int, maxpairs: int=None):
+    """
+    read the channel/count pairs for many pixel records, a block of about maxpairs at a time
+        see readpxpairs
+        maxpairs defaults to DECODE_PAIRS
+
+    yields first record, last record+1, channel and count arrays, number of pairs in each record
+    """
+    npairs = (pxlens.astype(np.int64)-pxheaderlen)//bytesperchan
+
+    for first, last in pairblocks(npairs, this.DECODE_PAIRS if maxpairs is None else maxpairs):
+        chan, counts, blockpairs = readpxpairs(data, offsets[first:last], pxlens[first:last], pxheaderlen, bytesperchan)
+
+        yield first, last, chan, counts, blockpairs
+
+
+def binchannels(chan, chanstart: int, chanend: int, rebin: int):
+    """
+    map decoded channels onto a channel window, rebinned by an integer factor
+
+    takes: 
+        channel per pair as uint16, eg. from readpxpairs
+        window as first channel, last channel+1
+        number of channels per bin
+
+    returns: 
+        output channel per pair
+        bin phase per pair, ie. position of channel within its bin
+        mask of pairs within the window
+
+    NB: output channel and phase are only meaningful where the mask is set
+    """
+    chan = np.asarray(chan, dtype=np.uint16)
+
+    valid = (chan >= chanstart) & (chan < chanend)
+
+    #wraps below the window, which is masked
+    offset = chan - np.uint16(chanstart)
+
+    if rebin == 1:
+        return offset, np.zeros_like(offset), valid
+
+    return offset // np.uint16(rebin), offset % np.uint16(rebin), valid
+
+
+def spectrumdtype(rebin: int):
+    """
+    dtype holding decoded counts
+        widened when rebinning, as counts summed across a bin may exceed uint16
+    """
+    return np.dtype(np.uint16) if rebin == 1 else np.dtype(np.uint32)
+
+
+def binspectra(spectra, chanstart: int, chanend: int, rebin: int):
+    """
+    restrict full spectra to a channel window, rebinned by an integer factor
+        equivalent of binchannels for already-decoded spectra, eg. from parsercore
+        the final bin is zero-padded if the window is not a multiple of rebin
+
+    returns array with the last axis of length ceil((chanend-chanstart)/rebin)
+        as uint32 if rebinned, see spectrumdtype
+    """
+    if chanstart == 0 and chanend == spectra.shape[-1] and rebin == 1:
+        return spectra
+
+    window = spectra[...,chanstart:chanend]
+
+    pad = (-window.shape[-1]) % rebin
+    if pad > 0:
+        window = np.concatenate((window, np.zeros(window.shape[:-1]+(pad,), dtype=window.dtype)), axis=-1)
+
+    return window.reshape(window.shape[:-1]+(window.shape[-1]//rebin, rebin)).sum(axis=-1, dtype=np.promote_types(spectra.dtype, spectrumdtype(rebin)))
+
+
+def readpxspectra(data, offsets, pxlens, pxheaderlen: int, bytesperchan: int, out, chanwindow=None, rebin: int=1):
+    """
+    read the spectra for many pixel records at once
+
+    gathers the pairs a block at a time via iterpairs, so temporaries are bounded by DECODE_PAIRS
+        then scatters counts into out[record, channel] in a single assignment per block
+        or one assignment per bin phase if rebinning, as channels are unique within a record
+
+    takes: 
+        data supporting buffer protocol, eg. memory-mapped file
+        record start indexes and lengths, flattened
+        output array of shape (nrecords, nchannels), already zeroed
+            as uint32 or wider if rebinning, see spectrumdtype
+        optional channel window and rebin factor, see binchannels
+
+    returns: 
+        output array
+        channels beyond nchannels or the window are dropped, as per gapfill
+    """
+    if chanwindow is None:
+        chanwindow = (0, out.shape[1]*rebin)
+
+    if out.dtype.itemsize < spectrumdtype(rebin).itemsize:
+        raise ValueError(f"rebinned spectra require output of {spectrumdtype(rebin)}, got {out.dtype}")
+
+    for first, last, chan, counts, npairs in iterpairs(data, offsets, pxlens, pxheaderlen, bytesperchan):
+        record = np.repeat(np.arange(first, last, dtype=np.uint32), npairs)
+
+        outchan, phase, valid = binchannels(chan, chanwindow[0], chanwindow[1], rebin)
+
+        if rebin == 1:
+            out[record[valid], outchan[valid]] = counts[valid]
+        else:
+            for i in range(rebin):
+                mask = valid & (phase == i)
+                out[record[mask], outchan[mask]] += counts[mask]
+
+    return out
+
+
 def writefileheader(xfmap, xcoords, ycoords):
     """
     writes the main header for the file
@@ -407,6 +837,52 @@ def writepxheader(config, xfmap, pxseries, det: int, pxidx: int, xcoords, ycoord
     xfmap.outfile.write(outstream)
         
 
+def packpxheaders(config, pxlen, xidx, yidx, det, dt):
+    """
+    build the headers for many pixel records at once
+        structured equivalent of the pack in writepxheader
+    
+    takes flattened arrays of header values, one per record
+
+    returns structured array of pxheaddtype, bytes via .tobytes()
+    """
+    headers = np.empty(len(pxlen), dtype=pxheaddtype)
+
+    headers['pxflag'] = config['PXFLAG'].encode(config['CHARENCODE'])
+    headers['pxlen'] = pxlen
+    headers['xidx'] = xidx
+    headers['yidx'] = yidx
+    headers['det'] = det
+    headers['dt'] = dt
+
+    return headers
+
+
+def copyrange(infd: int, outfd: int, start: int, length: int):
+    """
+    copy a byte range from one file descriptor to the current position of another
+        in-kernel via copy_file_range or sendfile where available
+        otherwise via a buffered read and write
+    """
+    end = start + length
+    
+    while start < end:
+        count = end - start
+        try:
+            if hasattr(os, 'copy_file_range'):
+                copied = os.copy_file_range(infd, outfd, count, start)
+            else:
+                copied = os.sendfile(outfd, infd, start, count)
+        except (AttributeError, OSError):
+            #eg. filesystems or platforms without in-kernel copies
+            copied = os.write(outfd, os.pread(infd, min(count, 1 << 26), start))
+        
+        if copied == 0:
+            raise ValueError(f"unexpected end of file copying bytes {start} to {end}")
+
+        start += copied
+
+
 def writepxrecord(xfmap, stream, length):
     """
     write the pixel data directly from stream
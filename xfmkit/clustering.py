@@ -1,15 +1,10 @@
+import sys
 import time
 import os
 import re
-import hdbscan
 import numpy as np
-import umap.umap_ as umap
-import pacmap
 import pickle
-
-from sklearn import decomposition
-from sklearn.cluster import KMeans
-from sklearn.neighbors import KernelDensity
+from scipy import sparse
 
 import xfmkit.utils as utils
 import xfmkit.config as config
@@ -38,34 +33,65 @@ default_classifier=config.get('classifier', 'default_classifier')
 #-----------------------------------
 #GROUPS
 #-----------------------------------
-REDUCERS = [
-    (decomposition.PCA, {"n_components": 2}),
-
-    (umap.UMAP, {"n_components":2, 
-        "n_neighbors": 30,  #300 
-        "min_dist": min_separation, 
-        "low_memory": True, 
-        "verbose": True}),
-
-    (pacmap.PaCMAP, {"n_components":2,
-        "n_neighbors": None,    #automatic
-        "verbose": True }),
-]
-
-CLASSIFIERS = [
-    (KMeans, {"init":"random", 
-        "n_clusters": 10, 
-        "n_init": 10, 
-        "max_iter": 300, 
-        "random_state": 42 }),
-
-    (hdbscan.HDBSCAN, {"min_cluster_size": 100,
-        "min_samples": 500,  #500
-        "alpha": 1.0,   #1.0
-        "cluster_selection_epsilon": 0.2,
-        "cluster_selection_method": "eom", #eom
-        "gen_min_span_tree": True }),
-]
+#   reducers and classifiers import umap, hdbscan, pacmap and sklearn, so are only built on first use
+
+this = sys.modules[__name__]
+
+this.available_reducers = None
+this.available_classifiers = None
+
+def reducers():
+    """
+    list of available reducers as ( operator, args )
+    """
+    if this.available_reducers is None:
+        import umap.umap_ as umap
+        import pacmap
+        from sklearn import decomposition
+
+        this.available_reducers = [
+            (decomposition.PCA, {"n_components": 2}),
+
+            (decomposition.TruncatedSVD, {"n_components": 2}),
+
+            (umap.UMAP, {"n_components":2, 
+                "n_neighbors": 30,  #300 
+                "min_dist": min_separation, 
+                "low_memory": True, 
+                "verbose": True}),
+
+            (pacmap.PaCMAP, {"n_components":2,
+                "n_neighbors": None,    #automatic
+                "verbose": True }),
+        ]
+
+    return this.available_reducers
+
+
+def classifiers():
+    """
+    list of available classifiers as ( operator, args )
+    """
+    if this.available_classifiers is None:
+        import hdbscan
+        from sklearn.cluster import KMeans
+
+        this.available_classifiers = [
+            (KMeans, {"init":"random", 
+                "n_clusters": 10, 
+                "n_init": 10, 
+                "max_iter": 300, 
+                "random_state": 42 }),
+
+            (hdbscan.HDBSCAN, {"min_cluster_size": 100,
+                "min_samples": 500,  #500
+                "alpha": 1.0,   #1.0
+                "cluster_selection_epsilon": 0.2,
+                "cluster_selection_method": "eom", #eom
+                "gen_min_span_tree": True }),
+        ]
+
+    return this.available_classifiers
 
 """
     (hdbscan.HDBSCAN, {"min_cluster_size": 1000,    #6000
@@ -110,7 +136,7 @@ def reduce(data, reducer_name: str, target_components=final_components):
     args:       data, reducer_name ("PCA", "UMAP"), target components
     returns:    reducer and embedding matrix
     """  
-    reducer_list=REDUCERS
+    reducer_list=reducers()
 
     operator, args = find_operator(reducer_list, reducer_name)
     args["n_components"]=target_components
@@ -131,7 +157,16 @@ def multireduce(data, target_components=final_components):
 
     start_time = time.time()
 
-    if npx >= pixel_cutoff_pca_only:
+    if sparse.issparse(data):
+        #PCA cannot centre sparse data without densifying, use truncated SVD instead
+        #   then chain into UMAP as for high-dimensional data
+        if npx >= pixel_cutoff_pca_only:
+            reducer, embedding = reduce(data, "TruncatedSVD", target_components)   
+        else:
+            __reducer, __embedding = reduce(data, "TruncatedSVD", umap_precomponents)   
+            reducer, embedding = reduce(__embedding, "UMAP", target_components)        
+
+    elif npx >= pixel_cutoff_pca_only:
         #if number of pixels is very high, use PCA
         reducer, embedding = reduce(data, "PCA", target_components)   
 
@@ -215,7 +250,7 @@ def classify(embedding, eom: bool = False, majors_only: bool = False, use_classi
     returns:    category-by-pixel matrix, shape [nreducers,chan]
     """
     print("RUNNING CLASSIFIER")
-    classifier_list = CLASSIFIERS
+    classifier_list = classifiers()
 
     if majors_only:
         cluster_sizefactor=50
@@ -282,7 +317,8 @@ def calc_classavg(data, categories):
         print(f"cluster {i}, count: {pxincat}") #DEBUG
 
         if pxincat > 0:
-            result[i,:]=(np.mean(data_subset,axis=0))
+            #via method, so sparse data gives the same result
+            result[i,:]=np.asarray(data_subset.mean(axis=0)).ravel()
         else:   #assign nan to any category with zero, avoids warning from np.mean
             result[i,:]=float("nan")
         
@@ -291,6 +327,8 @@ def calc_classavg(data, categories):
 
 class KdeMap():
     def __init__(self, embedding, n=default_kde_points):
+        from sklearn.neighbors import KernelDensity
+
         self.kde = KernelDensity(kernel='gaussian',bandwidth=min_separation*kde_separation_bandwidth_mult)
         self.n = n
 
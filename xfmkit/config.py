@@ -9,12 +9,17 @@ CONF_FILE_DEFAULT="conf/xfmkit.conf"
 
 config = configparser.ConfigParser()
 
+this = sys.modules[__name__]
+
+this.loaded = None      #conf file read into config, if any
+
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
 __base__ = os.path.dirname(__location__)
 
 def setup(conf_file=CONF_FILE_DEFAULT):
     """
     Initialise config file
+        read on first use otherwise, see load()
     """
     conf_location = os.path.join(__base__,conf_file)
 
@@ -25,9 +30,19 @@ def setup(conf_file=CONF_FILE_DEFAULT):
     except IOError:
         raise FileNotFoundError(f"{conf_location} not found")
 
+    this.loaded = conf_location
+
     return 
 
-setup(conf_file=CONF_FILE_DEFAULT)
+
+def load():
+    """
+    read the default config file, unless a config file has already been read
+    """
+    if this.loaded is None:
+        setup(conf_file=CONF_FILE_DEFAULT)
+
+    return
 
 def get(section, value, default=None, mandatory=True):
     """
@@ -35,6 +50,7 @@ def get(section, value, default=None, mandatory=True):
 
     attempt cast via json.loads
     """
+    load()
 
     try:
         config_return = config.get(section, value)
@@ -53,6 +69,7 @@ def get_str(section, value, default=None, mandatory=True):
     Reads config value as string (needs cast when called)
     or return default
     """
+    load()
 
     try:
         return config.get(section, value).strip()
@@ -0,0 +1,329 @@
+import os
+import json
+import time
+import numpy as np
+from numpy.polynomial import Polynomial
+
+from tabulate import tabulate
+
+import logging
+logger = logging.getLogger(__name__)
+
+"""
+Calibrates deadtime prediction against measured deadtimes
+
+- measured deadtime and counts per pixel per detector are read from each map
+    spectra are streamed batch by batch, only the sums are held
+- samples are grouped by time constant and dwell
+- each group is fitted with a polynomial in count rate (counts/ms per detector)
+    by least squares, accumulated a block of samples at a time via QR
+    so the fit is stable and memory is independent of the no. samples
+- the accumulated state is kept in the calibration cache, so later maps extend the fit
+- fitted models are loaded by dtops.dt_model, see lookup()
+"""
+#-----------------------------------
+#vars
+#-----------------------------------
+CALIBRATION_VERSION = 1
+CALIBRATION_NAME = "dt_calibration.json"
+DEFAULT_CACHE = os.path.join(os.path.expanduser("~"), ".xfmkit", CALIBRATION_NAME)
+
+DEFAULT_DEGREE = 3
+MAX_DEGREE = 6
+MIN_SAMPLES = 1000      #fewer samples in a group are not fitted
+RATE_SCALE = 100        #(counts/ms) rates are scaled by this while fitting, keeps the system well conditioned
+MAX_DT = 100            #(%) measured deadtimes at or above this are invalid, as are those <= 0
+
+FIT_BLOCK = 262144      #samples added to the fit at once
+
+
+def cachepath(config=None):
+    """
+    calibration cache, as given by dt_calibration in config, or DEFAULT_CACHE
+    """
+    path = None if config is None else config.get('dt_calibration')
+
+    return DEFAULT_CACHE if not path else os.path.abspath(os.path.expanduser(path))
+
+
+def groupkey(timeconst: float, dwell: float):
+    return f"{float(timeconst):g}us/{float(dwell):g}ms"
+
+
+class Accumulator:
+    """
+    least-squares fit of deadtime against count rate, built up a block of samples at a time
+
+    holds R of the QR decomposition of [ V | dt ], where V is the Vandermonde matrix of scaled rates
+        R[:-1,:-1] c = R[:-1,-1] solves for the coefficients
+        R[-1,-1]**2 is the residual sum of squares
+    """
+    def __init__(self, degree: int=DEFAULT_DEGREE, state=None, nsamples: int=0, rate_min: float=np.inf, rate_max: float=-np.inf):
+        if not 1 <= degree <= MAX_DEGREE:
+            raise ValueError(f"polynomial degree must be >= 1 and <= {MAX_DEGREE}")
+
+        self.degree = degree
+        self.r = np.zeros((degree+2, degree+2)) if state is None else np.asarray(state, dtype=np.float64)
+        self.nsamples = int(nsamples)
+        self.rate_min = float(rate_min)
+        self.rate_max = float(rate_max)
+
+        if not self.r.shape == (degree+2, degree+2):
+            raise ValueError(f"accumulated state of shape {self.r.shape} does not match degree {degree}")
+
+    def add(self, rate, dt):
+        """
+        add samples of count rate and measured deadtime to the fit
+        """
+        rate = np.asarray(rate, dtype=np.float64).ravel()
+        dt = np.asarray(dt, dtype=np.float64).ravel()
+
+        if not rate.shape == dt.shape:
+            raise ValueError("rate and dt array sizes differ")
+
+        if len(rate) == 0:
+            return self
+
+        for first in range(0, len(rate), FIT_BLOCK):
+            u = rate[first:first+FIT_BLOCK]/RATE_SCALE
+
+            block = np.empty((len(u), self.degree+2))
+            block[:,0] = 1
+            for k in range(1, self.degree+1):
+                np.multiply(block[:,k-1], u, out=block[:,k])
+            block[:,-1] = dt[first:first+FIT_BLOCK]
+
+            self.r = np.linalg.qr(np.vstack(( self.r, block )), mode='r')
+
+        self.nsamples += len(rate)
+        self.rate_min = min(self.rate_min, float(np.min(rate)))
+        self.rate_max = max(self.rate_max, float(np.max(rate)))
+
+        return self
+
+    def fit(self):
+        """
+        solve for the fitted polynomial
+
+        returns Polynomial in count rate over the sampled range, giving deadtime (%)
+            and the rms residual (%)
+        """
+        if self.nsamples < max(MIN_SAMPLES, self.degree+1):
+            raise ValueError(f"{self.nsamples} samples are too few to fit, requires at least {MIN_SAMPLES}")
+
+        if not self.rate_max > self.rate_min:
+            raise ValueError("samples span a single count rate, cannot fit")
+
+        #least-squares solution, as lstsq for rank-deficient cases
+        coefficients = np.linalg.lstsq(self.r[:-1,:-1], self.r[:-1,-1], rcond=None)[0]
+
+        scaled = Polynomial(coefficients, domain=[0, RATE_SCALE], window=[0, 1])
+        polynomial = scaled.convert(domain=[self.rate_min, self.rate_max], window=[-1, 1])
+
+        rms = float(abs(self.r[-1,-1])/np.sqrt(self.nsamples))
+
+        return polynomial, rms
+
+
+def samples(pixelseries, dwell: float):
+    """
+    count rate and measured deadtime for each pixel and detector with a valid deadtime
+
+    returns rate (counts/ms), dt (%) as 1D arrays
+    """
+    if not pixelseries.sum.shape == pixelseries.dt.shape:
+        raise ValueError("sum and dt array sizes differ")
+
+    dt = pixelseries.dt.ravel()
+    counts = pixelseries.sum.ravel()
+
+    valid = ( dt > 0 ) & ( dt < MAX_DT ) & ( counts > 0 )
+
+    return counts[valid]/float(dwell), dt[valid]
+
+
+def ingest(config, fi, timeconst: float=None):
+    """
+    read measured deadtimes and per-detector sums from the map at fi
+
+    the map is indexed, or its index loaded from cache, then streamed without holding the spectra
+
+    returns timeconst, dwell, rate, dt
+    """
+    import xfmkit.structures as structures
+    import xfmkit.parser as parser
+
+    chunksize = int(config['CHUNKSIZE_FALLBACK']*config['MBCONV'])
+
+    xfmap = structures.Xfmap(config, fi, None, False, chunksize, False, True)
+
+    try:
+        pixelseries = structures.PixelSeries(config, xfmap, xfmap.npx, xfmap.detarray, True, STREAM=True)
+
+        cached = False
+        if config['INDEX_CACHE']:
+            pixelseries, xfmap, cached = parser.loadindex(xfmap, pixelseries, fi)
+
+        if not cached:
+            pixelseries, xfmap = parser.indexmap_vector(xfmap, pixelseries)
+
+        pixelseries = pixelseries.get_derived(parser.iter_pixels(xfmap, pixelseries))
+    finally:
+        xfmap.closefiles()
+
+    timeconst = xfmap.timeconst if timeconst is None else float(timeconst)
+
+    rate, dt = samples(pixelseries, xfmap.dwell)
+
+    return timeconst, xfmap.dwell, rate, dt
+
+
+def emptycache():
+    return { "version": CALIBRATION_VERSION, "calibrations": {} }
+
+
+def loadcache(filepath):
+    """
+    read the calibration cache
+
+    a missing, unreadable or out of date cache is treated as empty, with a warning for the latter two
+    """
+    if not os.path.isfile(filepath):
+        return emptycache()
+
+    try:
+        with open(filepath, mode='r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        print(f"WARNING: could not read deadtime calibration {filepath}")
+        print("continuing without deadtime calibration")
+        return emptycache()
+
+    if not cache.get("version") == CALIBRATION_VERSION:
+        print(f"WARNING: deadtime calibration {filepath} is version {cache.get('version')}, expected {CALIBRATION_VERSION}")
+        print("continuing without deadtime calibration")
+        return emptycache()
+
+    return cache
+
+
+def savecache(cache, filepath):
+    """
+    write the calibration cache, replacing the previous one only once complete
+    """
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+    tempfile = filepath+".tmp"
+
+    with open(tempfile, mode='w') as f:
+        json.dump(cache, f, indent=2)
+
+    os.replace(tempfile, filepath)
+
+
+def accumulator(entry):
+    """
+    resume the fit from a cache entry
+    """
+    return Accumulator(entry["degree"], entry["state"], entry["nsamples"], entry["rate_min"], entry["rate_max"])
+
+
+def calibrate(config, files, filepath: str=None, timeconst: float=None, degree: int=DEFAULT_DEGREE, reset: bool=False):
+    """
+    fit deadtime models from the maps in files, and store them in the calibration cache
+
+    groups already in the cache are extended with the new samples, unless reset
+        or if fitted with a different degree
+
+    returns the updated cache
+    """
+    filepath = cachepath(config) if filepath is None else filepath
+    cache = emptycache() if reset else loadcache(filepath)
+    calibrations = cache["calibrations"]
+
+    groups = {}
+
+    for fi in files:
+        print("--------------")
+        print(f"CALIBRATING FROM {fi}")
+
+        tc, dwell, rate, dt = ingest(config, fi, timeconst)
+        key = groupkey(tc, dwell)
+
+        if not key in groups:
+            entry = calibrations.get(key)
+
+            if entry is not None and entry["degree"] == degree:
+                groups[key] = { "timeconst": tc, "dwell": dwell, "fit": accumulator(entry), "sources": list(entry["sources"]) }
+            else:
+                groups[key] = { "timeconst": tc, "dwell": dwell, "fit": Accumulator(degree), "sources": [] }
+
+        groups[key]["fit"].add(rate, dt)
+        groups[key]["sources"].append(os.path.basename(fi))
+
+        print(f"{len(rate)} samples at {key}")
+
+    for key, group in groups.items():
+        fit = group["fit"]
+
+        try:
+            polynomial, rms = fit.fit()
+        except ValueError as e:
+            print(f"WARNING: could not fit deadtime model for {key}: {e}")
+            print(f"continuing without calibration for {key}")
+            continue
+
+        calibrations[key] = {
+            "timeconst": group["timeconst"],
+            "dwell": group["dwell"],
+            "degree": fit.degree,
+            "coefficients": polynomial.coef.tolist(),
+            "domain": polynomial.domain.tolist(),
+            "window": polynomial.window.tolist(),
+            "rms": rms,
+            "nsamples": fit.nsamples,
+            "rate_min": fit.rate_min,
+            "rate_max": fit.rate_max,
+            "state": fit.r.tolist(),
+            "sources": group["sources"],
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    savecache(cache, filepath)
+
+    return cache
+
+
+def lookup(timeconst: float, dwell: float, config=None, filepath: str=None):
+    """
+    calibration for timeconst and dwell from the cache
+        or if no exact match, the calibration at the nearest dwell for this time constant
+
+    returns cache entry, or None if this time constant is not calibrated
+    """
+    filepath = cachepath(config) if filepath is None else filepath
+
+    candidates = [ entry for entry in loadcache(filepath)["calibrations"].values() \
+                    if np.isclose(entry["timeconst"], float(timeconst)) ]
+
+    if len(candidates) == 0:
+        return None
+
+    entry = min(candidates, key=lambda entry: abs(entry["dwell"] - float(dwell)))
+
+    if not np.isclose(entry["dwell"], float(dwell)):
+        print(f"WARNING: deadtime not calibrated for dwell {dwell} ms at TC={timeconst}")
+        print(f"continuing with calibration at dwell {entry['dwell']} ms")
+
+    return entry
+
+
+def report(cache):
+    """
+    print a table of calibrations
+    """
+    columns = [ "timeconst", "dwell", "degree", "nsamples", "rate_min", "rate_max", "rms" ]
+
+    rows = [ [ entry[column] for column in columns ] for entry in cache["calibrations"].values() ]
+
+    print(tabulate(rows, headers=columns, tablefmt='psql', floatfmt=".4g"))
@@ -1,14 +1,35 @@
 import numpy as np
 import os
 import time
-import matplotlib.pyplot as plt
 from numpy.polynomial  import Polynomial
 
+import xfmkit.dtcalibration as dtcalibration
+
 import logging
 logger = logging.getLogger(__name__)
 
 cset = ['red', 'pink', 'blue', 'lightblue']
 
+#deadtime prediction models
+#   linear: from counts per pixel across detectors, via dtcalc_a, dtcalc_c, dtcalc_cutoff in config
+#   poly3: from counts per pixel per detector, via a polynomial fit to a series of geological standards
+#   calibrated: from counts per pixel per detector, via a polynomial fitted to measured deadtimes, see dtcalibration
+DT_MODELS = [ "linear", "poly3", "calibrated" ]
+
+#model for each calibrated time constant (us), unless given by dt_models in config
+DEFAULT_DT_MODELS = { 0.5: "poly3" }
+
+#poly3 calibration
+POLY3_COEFFICIENTS = [0.23438781, 0.21464015, 0.05402071, 0.02689396]
+POLY3_DOMAIN = [ 4.08008563, 99.727441  ]
+POLY3_WINDOW = [-1.,  1.]
+
+SATURATION_CUTOFF = 65
+MAX_CUTOFF = 80
+
+DT_BLOCK = 262144       #values evaluated at once, keeps temporaries in cache
+
+
 def dt_stats(dt):
     """
     print deadtime statistics to stdout
@@ -29,107 +50,180 @@ def dt_stats(dt):
     return dt_mean
 
 
-def predict_single_dt(config, pxsum, dwell, timeconst):
+class DeadtimeModel:
+    """
+    deadtime prediction for one time constant and dwell, calibration read once
+
+    predict() evaluates over whole arrays of counts, or any block of pixels at a time
+    """
+    def __init__(self, name: str, timeconst: float, dwell: float, config=None, calibration=None):
+        if not name in DT_MODELS:
+            raise ValueError(f"unrecognised deadtime model {name}, expected one of {DT_MODELS}")
+
+        self.name = name
+        self.timeconst = timeconst
+        self.dwell = dwell
+
+        if name == "linear":
+            if config is None:
+                raise ValueError("linear deadtime model requires dtcalc_a, dtcalc_c and dtcalc_cutoff from config")
+
+            self.a = float(config['dtcalc_a'])
+            self.c = float(config['dtcalc_c'])
+            self.cutoff = float(config['dtcalc_cutoff'])
+        elif name == "calibrated":
+            if calibration is None:
+                raise ValueError(f"calibrated deadtime model requires a calibration for TC={timeconst}, see dtcalibration")
+
+            #fitted in count rate, giving %
+            polynomial = Polynomial(calibration['coefficients'], domain=calibration['domain'], window=calibration['window']).convert()
+            self.coefficients = [ c/dwell**k for k, c in enumerate(polynomial.coef) ]
+            self.calibration = calibration
+        else:
+            #coefficients in raw counts, with the domain, dwell and scaling to % folded in
+            polynomial = Polynomial(POLY3_COEFFICIENTS, domain=POLY3_DOMAIN, window=POLY3_WINDOW).convert()
+            self.coefficients = [ 100*c/dwell**k for k, c in enumerate(polynomial.coef) ]
+
+    def predict(self, sums):
+        """
+        predict deadtimes from counts per pixel per detector, shape (npx, ndet)
+
+        returns deadtimes as float32, same shape as sums
+        """
+        sums = np.asarray(sums)
+
+        if self.name == "linear":
+            #sum per pixel, corrected for dwell and no. detectors
+            #   the same deadtime is assigned to each detector
+            norm_sum = np.sum(sums, axis=-1, dtype=np.float64, keepdims=True)/self.dwell/2
+            predicted = np.minimum(norm_sum*self.a + self.c, self.cutoff)
+
+            return np.broadcast_to(predicted, sums.shape).astype(np.float32)
+
+        #polynomial via Horner's method, a block at a time
+        flat = sums.ravel()
+        result = np.empty(flat.shape, dtype=np.float32)
+        work = np.empty(min(len(flat), DT_BLOCK), dtype=np.float64)
+
+        for first in range(0, len(flat), DT_BLOCK):
+            x = flat[first:first+DT_BLOCK]
+            y = work[:len(x)]
+
+            y[:] = self.coefficients[-1]
+            for c in self.coefficients[-2::-1]:
+                y *= x
+                y += c
+
+            result[first:first+len(x)] = y
+
+        return result.reshape(sums.shape)
+
+
+def dt_model(timeconst: float, dwell: float, config=None, name: str=None):
     """
-    predict missing deadtimes from countrate, dwell and time-constant
-    must be calibrated for each time-constant, will fail if current TC is uncalibrated    
+    deadtime model calibrated for timeconst
+        fitted to measured deadtimes, if DT_CALIBRATION is set in config and the calibration cache holds this time constant
+        otherwise as given by dt_models in config if present, or DEFAULT_DT_MODELS
+        or the named model, if the time constant is calibrated
+
+    must be calibrated for each time-constant, will fail if current TC is uncalibrated
     """
-    norm_sum=(pxsum/dwell)/2 #sum per pixel, corrected for dwell
-                                            # corrected for no. detectors
+    use_calibration = config is not None and config.get('DT_CALIBRATION', False)
+
+    if ( name is None and use_calibration ) or name == "calibrated":
+        filepath = dtcalibration.cachepath(config)
+        calibration = dtcalibration.lookup(timeconst, dwell, config, filepath)
+
+        if calibration is not None:
+            print(f"Predicting deadtimes from calibration at TC={timeconst}, dwell {calibration['dwell']} ms in {filepath}")
+            return DeadtimeModel("calibrated", timeconst, dwell, config, calibration)
+        elif name == "calibrated":
+            raise ValueError(f"Deadtime not calibrated for TC={timeconst} in {filepath}")
 
-    a=float(config['dtcalc_a'])
-    c=float(config['dtcalc_c'])
-    cutoff=float(config['dtcalc_cutoff'])
+    models = DEFAULT_DT_MODELS if config is None else config.get('dt_models', DEFAULT_DT_MODELS)
+    models = { float(tc): model for tc, model in models.items() }
 
-    dtmod=norm_sum*a+c
-    dtmod=float(min(dtmod,cutoff))
+    if not float(timeconst) in models:
+        raise ValueError(f"Deadtime prediction not yet calibrated for TC={timeconst}")
+
+    return DeadtimeModel(models[float(timeconst)] if name is None else name, timeconst, dwell, config)
+
+
+def check_saturation(predicted):
+    """
+    warn of predicted deadtimes in the saturation zone, or beyond the maximum
+    """
+    nsaturated = np.count_nonzero(predicted > SATURATION_CUTOFF)
+
+    if nsaturated > 0:
+        print(f"WARNING: When predicting deadtimes, {nsaturated} pixels in saturation zone ({nsaturated/predicted.shape[0]*100:.2f}% of pixels at >{SATURATION_CUTOFF}% DT)")
+
+    nmax = np.count_nonzero(predicted > MAX_CUTOFF)
+
+    if nmax > 0:
+        print(f"WARNING: When predicting deadtimes, {nmax} pixels at >{MAX_CUTOFF}% deadtime; normalised to 80%")
 
-    return dtmod
 
 def predict_dt_flat(config, pixelseries, xfmap):
     """
-    predict deadtimes-per-pixel from counts
+    predict deadtimes-per-pixel from counts, via the linear model
     
     """
 
     #FUTURE: alternate behaviour if flag:
     #           fill deadtimes with fixed value from average
-    timeconst = xfmap.timeconst
-    dwell = xfmap.dwell
-    ndet = pixelseries.ndet
-
     if pixelseries.parsed == False and not np.max(pixelseries.flatsum) > 0:
         raise ValueError("Deadtime prediction requires parsed map with flattened data")
 
     if len(pixelseries.flatsum) != len(pixelseries.dt[:,0]):
         raise ValueError("sum and dt array sizes differ")
 
-    dtmod=np.zeros((len(pixelseries.dt[:,0]),ndet),dtype=np.float32)
+    model = dt_model(xfmap.timeconst, xfmap.dwell, config, "linear")
 
-    if timeconst == 0.5:    #currently hardcoded to TC = 0.5 us
-        for i in range(len(pixelseries.flatsum)):
-            for j in range(ndet):
-                dtmod[i,j]=predict_single_dt(config, pixelseries.flatsum[i], dwell, timeconst)
-    else:
-        raise ValueError(f"Deadtime prediction not yet calibrated for TC={timeconst}")        
+    #counts across detectors are held as flatsum, so give them as a single detector
+    dtmod = model.predict(pixelseries.flatsum[:,np.newaxis])
+
+    return np.repeat(dtmod, pixelseries.ndet, axis=1)
 
-    return dtmod
 
 def dt_poly3(summed_data, dwell: float):
     """
     predict deadtimes from per-pixel-per-det counts
     """
-    # preset coefficients for polynomial
-    #   calculated from series of geological standards with varied deadtimes
-    COEFFICIENTS = [0.23438781, 0.21464015, 0.05402071, 0.02689396]
-    DOMAIN = [ 4.08008563, 99.727441  ]
-    WINDOW = [-1.,  1.]
-
-    SATURATION_CUTOFF = 65
-    MAX_CUTOFF = 80
-
-    # Create the polynomial
-    q = Polynomial(COEFFICIENTS, domain=DOMAIN, window=WINDOW)
-
-    predicted = q(summed_data/dwell)*100
-
-    lower_mask = np.where(predicted > SATURATION_CUTOFF)
-
-    if len(lower_mask[0]) > 0:
-        print(f"WARNING: When predicting deadtimes, {len(lower_mask[0])} pixels in saturation zone ({len(lower_mask[0])/summed_data.shape[0]*100:.2f}% of pixels at >{SATURATION_CUTOFF}% DT)")
-
-    upper_mask = np.where(predicted > MAX_CUTOFF)
+    predicted = DeadtimeModel("poly3", None, dwell).predict(summed_data)
 
-    if len(upper_mask[0]) > 0:
-        print(f"WARNING: When predicting deadtimes, {len(upper_mask[0])} pixels at >{MAX_CUTOFF}% deadtime; normalised to 80%")
+    check_saturation(predicted)
 
     return predicted
 
 
-def predict_dt(pixelseries, xfmap):
+def predict_dt(pixelseries, xfmap, config=None):
     """
     predict deadtimes-per-pixel from per-detector counts
+        via the model calibrated for the time constant of the map, see dt_model
     
     """
 
     #FUTURE: alternate behaviour if flag:
     #           fill deadtimes with fixed value from average
-    timeconst = xfmap.timeconst
-    dwell = xfmap.dwell
-    n_det = pixelseries.ndet
-
     if pixelseries.parsed == False and not np.max(pixelseries.sum) > 0:
         raise ValueError("Deadtime prediction requires sum-per-pixel-per-detector")
 
     if len(pixelseries.sum) != len(pixelseries.dt):
         raise ValueError("sum and dt array sizes differ")
 
-    dt_pred=np.zeros(pixelseries.dt.shape,dtype=np.float32)
+    model = dt_model(xfmap.timeconst, xfmap.dwell, config)
 
-    if timeconst == 0.5:    #currently hardcoded to TC = 0.5 us
-        dt_pred = dt_poly3(pixelseries.sum, dwell)
-    else:
-        raise ValueError(f"Deadtime prediction not yet calibrated for TC={timeconst}")   
+    dt_pred = model.predict(pixelseries.sum)
+
+    if model.name == "calibrated":
+        nbeyond = np.count_nonzero(pixelseries.sum > model.calibration['rate_max']*xfmap.dwell)
+
+        if nbeyond > 0:
+            print(f"WARNING: When predicting deadtimes, {nbeyond} pixels beyond calibrated count rate of {model.calibration['rate_max']:.1f} counts/ms")
+            print("continuing with extrapolated deadtimes")
+
+    check_saturation(dt_pred)
          
     return dt_pred
 
@@ -155,6 +249,8 @@ def dthist(dt, dir: str, ndet: int):
     """
     generate the deadtime histogram plot
     """
+    import matplotlib.pyplot as plt
+
     try:
         fig = plt.figure(figsize=(6,4))
 
@@ -179,6 +275,8 @@ def dtimages(dt, dir: str, xres: int, yres: int, ndet: int):
     """
     plot the deadtimes as a map image
     """
+    import matplotlib.pyplot as plt
+
     try:
         #https://stackoverflow.com/questions/52273546/matplotlib-typeerror-axessubplot-object-is-not-subscriptable
         #squeeze kwarg forces 1x1 plot to behave as a 2D array so subscripting works
@@ -210,6 +308,8 @@ def diffimage(sum, dir: str, xres: int, yres: int, ndet: int):
     """
     plot the differences in deadtimes between detectors as a map image
     """    
+    import matplotlib.pyplot as plt
+
     try:
         if ndet != 2:
             raise ValueError("Number of detectors != 2, difference map not possible")
@@ -239,6 +339,8 @@ def dtscatter(dt, sum, dir: str, ndet: int):
     """
     produce scatterplot of deadtime vs counts per pixel
     """  
+    import matplotlib.pyplot as plt
+
     try:
         fig = plt.figure(figsize=(8,4))
 
@@ -270,6 +372,8 @@ def predhist(dt, dtmod, dir: str, ndet: int):
     """
     generate the predicted deadtime histogram plot
     """ 
+    import matplotlib.pyplot as plt
+
     try:
         fig = plt.figure(figsize=(6,4))
 
@@ -299,6 +403,8 @@ def preddiffimage(dt, dtmod, dir: str, xres: int, yres: int, ndet: int):
 
     DEPRECATED
     """          
+    import matplotlib.pyplot as plt
+
     diffmap = dtmod-dt
 
     diffimage = diffmap.reshape(yres,xres)
@@ -322,6 +428,8 @@ def predscatter(dt, dtmod, sum, dir: str, ndet: int):
 
     DEPRECATED
     """  
+    import matplotlib.pyplot as plt
+
     fig = plt.figure(figsize=(8,4))
 
     ax = fig.add_subplot(111)
@@ -352,6 +460,8 @@ def dtplots(config, dir: str, dt, sum, dtmod, xres: int, yres: int, ndet: int, I
     """
     produce all deadtime-related plots
     """
+    import matplotlib.pyplot as plt
+
     try:
         dthist(dt, dir, ndet)
         dtimages(dt, dir, xres, yres, ndet)
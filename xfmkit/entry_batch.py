@@ -0,0 +1,259 @@
+import sys
+import os
+import json
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import xfmkit.utils as utils
+import xfmkit.argops as argops
+import xfmkit.planner as planner
+import xfmkit.entry_raw as entry_raw
+
+"""
+Processes a set of .GeoPIXE maps, eg. from a beamline session
+
+- finds maps from directories, files or glob patterns
+- estimates memory for each map from its header
+- runs read_raw for each map across a pool of worker processes
+    - starting maps only while their estimates fit within the memory limit
+    - retrying maps that fail
+- writes a status summary for each map
+"""
+#-----------------------------------
+#vars
+#-----------------------------------
+PACKAGE_CONFIG='xfmkit/config.yaml'
+SUMMARY_NAME="xfmkit_batch.json"
+
+logger = logging.getLogger(__name__)
+
+
+def mapargs(fi, args_map, config):
+    """
+    args for a single map
+        a shared --output-directory is given a subdirectory per map, as per DirectoryStructure
+    """
+    args_fi = [ "-f", fi ] + list(args_map)
+    fname = os.path.splitext(os.path.basename(fi))[0]
+
+    for flag in [ "-o", "--output-directory" ]:
+        if flag in args_fi[:-1]:
+            i = args_fi.index(flag)
+            args_fi[i+1] = os.path.join(os.path.abspath(args_fi[i+1]), config['OUTDIR']+"_"+fname)
+
+    return args_fi
+
+
+def estimatememory(config, fi, args_map):
+    """
+    estimate peak memory (in Mb) to process a map with the given args
+        see planner.estimate
+    """
+    args = argops.readargs(mapargs(fi, args_map, config), config)
+
+    stages = planner.estimate(config, args, planner.readheader(config, args))
+
+    return planner.peak(stages)/config['MBCONV']
+
+
+def batchinit():
+    """
+    worker setup
+        plots are written to file only, never shown
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def batchjob(args_fi):
+    """
+    process one map in a worker
+        returns a small summary, rather than the parsed data
+    """
+    starttime = time.time()
+
+    pixelseries, xfmap = entry_raw.read_raw(args_fi)
+
+    return {
+        "npx": int(pixelseries.npx),
+        "dimensions": [ int(dim) for dim in pixelseries.dimensions ],
+        "parsed": bool(pixelseries.parsed),
+        "runtime": round(time.time() - starttime, 2),
+    }
+
+
+def runbatch(config, args, args_map, files):
+    """
+    process each map across a pool of workers
+
+    maps are started in order while both a worker is free and their memory estimate fits
+        a map larger than the limit is run alone
+        failed maps are retried at the end of the queue
+        if a worker dies, eg. out of memory, all maps running at the time are retried
+
+    returns status for each map
+    """
+    status = {}
+    pending = []
+
+    for fi in files:
+        status[fi] = { "file": fi, "status": "pending", "attempts": 0, "memory_mb": None, "error": None }
+        try:
+            status[fi]["memory_mb"] = round(estimatememory(config, fi, args_map), 1)
+            pending.append(fi)
+        except Exception as e:
+            status[fi]["status"] = "failed"
+            status[fi]["error"] = f"{type(e).__name__}: {e}"
+            print(f"WARNING: could not read header from {fi}, skipping")
+
+    running = {}
+    used = 0.0
+
+    context = mp.get_context("spawn")
+    executor = ProcessPoolExecutor(max_workers=args.batch_workers, mp_context=context, initializer=batchinit)
+
+    try:
+        while pending or running:
+            #start any maps that fit
+            for fi in list(pending):
+                if len(running) >= args.batch_workers:
+                    break
+
+                estimate = status[fi]["memory_mb"]
+
+                if running and used + estimate > args.batch_memory:
+                    continue
+
+                if estimate > args.batch_memory:
+                    print(f"WARNING: estimated memory for {fi} ({estimate} Mb) exceeds --batch-memory, running alone")
+
+                status[fi]["status"] = "running"
+                status[fi]["attempts"] += 1
+                running[executor.submit(batchjob, mapargs(fi, args_map, config))] = fi
+                used += estimate
+                pending.remove(fi)
+
+                print(f"BATCH: started {os.path.basename(fi)} (attempt {status[fi]['attempts']}), {used:.0f}/{args.batch_memory} Mb")
+
+            done, ___ = wait(running, return_when=FIRST_COMPLETED)
+            broken = False
+
+            for future in done:
+                fi = running.pop(future)
+                used -= status[fi]["memory_mb"]
+
+                try:
+                    status[fi].update(future.result())
+                    status[fi]["status"] = "done"
+                    status[fi]["error"] = None
+                except Exception as e:
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    status[fi]["error"] = f"{type(e).__name__}: {e}"
+
+                    if status[fi]["attempts"] <= args.batch_retries:
+                        status[fi]["status"] = "pending"
+                        pending.append(fi)
+                    else:
+                        status[fi]["status"] = "failed"
+
+                print(f"BATCH: {status[fi]['status']} {os.path.basename(fi)}")
+
+            if broken:
+                #pool cannot be reused once a worker has died
+                for future, fi in running.items():
+                    status[fi]["status"] = "pending"
+                    status[fi]["attempts"] -= 1
+                    pending.append(fi)
+
+                running = {}
+                used = 0.0
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = ProcessPoolExecutor(max_workers=args.batch_workers, mp_context=context, initializer=batchinit)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    return [ status[fi] for fi in files ]
+
+
+def writesummary(filepath, args, args_map, results):
+    """
+    write the status of each map to json, and report totals
+    """
+    summary = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "workers": args.batch_workers,
+        "memory_mb": args.batch_memory,
+        "retries": args.batch_retries,
+        "args": list(args_map),
+        "maps": results,
+    }
+
+    with open(filepath, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    ndone = sum(1 for result in results if result["status"] == "done")
+
+    print(
+    "---------------------------\n"
+    "BATCH COMPLETE\n"
+    "---------------------------\n"
+    f"maps found: {len(results)}\n"
+    f"maps completed: {ndone}\n"
+    f"maps failed: {len(results)-ndone}\n"
+    f"summary: {filepath}\n"
+    "---------------------------"
+    )
+
+    for result in results:
+        if not result["status"] == "done":
+            print(f"FAILED: {result['file']} - {result['error']}")
+
+    return summary
+
+
+def entry_batch():
+    """
+    entrypoint wrapper getting args from sys
+    """
+    args_in = sys.argv[1:]  #NB: exclude 0 == script name
+
+    logger = entry_raw.logging_setup()
+
+    read_batch(args_in)
+
+
+def read_batch(args_in):
+    """
+    process all maps according to args_in
+
+    returns the summary of each map
+    """
+    config = utils.initcfg(PACKAGE_CONFIG)
+
+    args, args_map = argops.readargs_batch(args_in, config)
+
+    files = utils.findmaps(args.batch, config)
+
+    if len(files) == 0:
+        raise FileNotFoundError(f"No {config['FTYPE']} files found in {args.batch}")
+
+    if args.batch_summary == None:
+        args.batch_summary = os.path.join(os.path.dirname(files[0]), SUMMARY_NAME)
+
+    print(f"BATCH: {len(files)} maps, {args.batch_workers} workers, {args.batch_memory} Mb")
+
+    results = runbatch(config, args, args_map, files)
+
+    return writesummary(args.batch_summary, args, args_map, results)
+
+
+if __name__ == '__main__':
+    entry_batch()
+
+    sys.exit()
@@ -0,0 +1,128 @@
+import sys
+import os
+import time
+import tempfile
+
+from tabulate import tabulate
+
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import xfmkit.utils as utils
+import xfmkit.argops as argops
+import xfmkit.synthetic as synthetic
+import xfmkit.benchmark as benchmark
+
+"""
+Benchmarks index, parse, write and analysis stages over a matrix of map sizes
+
+- writes a synthetic map of each size to a temporary directory
+- times each stage, with throughput and peak memory
+    see: xfmkit/benchmark.py
+- writes the results, and compares them against a stored baseline
+    any regression fails the run
+"""
+#-----------------------------------
+#vars
+#-----------------------------------
+PACKAGE_CONFIG='xfmkit/config.yaml'
+
+logger = logging.getLogger(__name__)
+
+
+def entry_benchmark():
+    """
+    entrypoint wrapper getting args from sys
+    """
+    args_in = sys.argv[1:]  #NB: exclude 0 == script name
+
+    read_benchmark(args_in)
+
+
+def read_benchmark(args_in):
+    """
+    benchmark all stages and map sizes according to args_in
+
+    raises ValueError if any stage regresses against the baseline
+
+    returns results as dict
+    """
+    starttime = time.time()
+
+    config = utils.initcfg(PACKAGE_CONFIG)
+
+    args = argops.readargs_benchmark(args_in, config)
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": benchmark.machine(),
+        "detectors": args.detectors,
+        "repeats": args.repeats,
+        "results": [],
+    }
+
+    monitor = benchmark.RssMonitor().start()
+
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for xres, yres in args.sizes:
+                size = f"{xres}x{yres}"
+                fi = os.path.join(workdir, f"benchmark_{size}{config['FTYPE']}")
+
+                mapfile = synthetic.write(fi, xres, yres, args.detectors, config['NCHAN'])
+
+                #parse args as for a run writing a modified map
+                outdir = os.path.join(workdir, size)
+                os.mkdir(outdir)
+                rawargs = argops.readargs([ "-f", fi, "-o", outdir, "-w" ], config)
+                config, dirs = utils.initfiles(rawargs, config)
+
+                rows = benchmark.runmap(config, rawargs, dirs, xres*yres, args.stages, args.repeats, monitor)
+
+                for row in rows:
+                    results["results"].append({ "size": size, "xres": xres, "yres": yres, "file_mb": round(mapfile['bytes']/config['MBCONV'], 3), **row })
+    finally:
+        monitor.stop()
+
+    benchmark.report(results)
+
+    filepath = os.path.join(args.output_directory, benchmark.RESULTS_NAME)
+    benchmark.exportresults(results, filepath)
+
+    regressions = []
+
+    if args.save_baseline:
+        benchmark.exportresults(results, args.baseline)
+        print(f"baseline saved to {args.baseline}")
+
+    elif args.baseline != None:
+        regressions = benchmark.compare(results, benchmark.loadresults(args.baseline), args.tolerance)
+
+        if len(regressions) > 0:
+            print(tabulate(regressions, headers=[ "size", "stage", "metric", "baseline", "current", "change (%)" ], tablefmt='psql'))
+
+    runtime = time.time() - starttime
+
+    print(
+    "---------------------------\n"
+    "BENCHMARK COMPLETE\n"
+    "---------------------------\n"
+    f"map sizes: {len(args.sizes)}\n"
+    f"stages: {len(args.stages)}\n"
+    f"results: {filepath}\n"
+    f"regressions: {len(regressions)}\n"
+    f"total time: {round(runtime,2)} s\n"
+    "---------------------------"
+    )
+
+    if len(regressions) > 0:
+        raise ValueError(f"{len(regressions)} regressions against baseline {args.baseline}")
+
+    return results
+
+
+if __name__ == '__main__':
+    entry_benchmark()
+
+    sys.exit()
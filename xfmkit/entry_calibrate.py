@@ -0,0 +1,75 @@
+import sys
+import os
+import time
+
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import xfmkit.utils as utils
+import xfmkit.argops as argops
+import xfmkit.dtcalibration as dtcalibration
+
+"""
+Fits deadtime prediction models to measured deadtimes
+
+- reads measured deadtimes and counts per detector from each input map
+- fits a polynomial per time constant and dwell
+    see: xfmkit/dtcalibration.py
+- stores the fits in the calibration cache, used by deadtime prediction in xfmkit-raw
+"""
+#-----------------------------------
+#vars
+#-----------------------------------
+PACKAGE_CONFIG='xfmkit/config.yaml'
+
+logger = logging.getLogger(__name__)
+
+
+def entry_calibrate():
+    """
+    entrypoint wrapper getting args from sys
+    """
+    args_in = sys.argv[1:]  #NB: exclude 0 == script name
+
+    read_calibrate(args_in)
+
+
+def read_calibrate(args_in):
+    """
+    calibrate deadtime prediction according to args_in
+
+    returns the updated calibration cache as dict
+    """
+    starttime = time.time()
+
+    config = utils.initcfg(PACKAGE_CONFIG)
+
+    args = argops.readargs_calibrate(args_in, config)
+
+    filepath = dtcalibration.cachepath(config) if args.cache == None else args.cache
+
+    cache = dtcalibration.calibrate(config, args.input_files, filepath, args.time_constant, args.degree, args.reset)
+
+    dtcalibration.report(cache)
+
+    runtime = time.time() - starttime
+
+    print(
+    "---------------------------\n"
+    "CALIBRATION COMPLETE\n"
+    "---------------------------\n"
+    f"files: {len(args.input_files)}\n"
+    f"calibrations: {len(cache['calibrations'])}\n"
+    f"cache: {filepath}\n"
+    f"total time: {round(runtime,2)} s\n"
+    "---------------------------"
+    )
+
+    return cache
+
+
+if __name__ == '__main__':
+    entry_calibrate()
+
+    sys.exit()
@@ -0,0 +1,148 @@
+import sys
+import os
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tabulate import tabulate
+
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import xfmkit.utils as utils
+import xfmkit.argops as argops
+import xfmkit.bufferops as bufferops
+
+"""
+Catalogues a set of .GeoPIXE maps, eg. across an archive
+
+- finds maps from directories, files or glob patterns
+- reads only the JSON header and first pixel headers of each map
+    - across a pool of threads, as each read is small and I/O-bound
+- emits one table of map properties
+"""
+#-----------------------------------
+#vars
+#-----------------------------------
+PACKAGE_CONFIG='xfmkit/config.yaml'
+
+#columns of the catalogue, in order
+COLUMNS = [ "file", "xres", "yres", "npx", "width_mm", "height_mm", "dwell_ms", "ndet", "nchan", "gain_ev", "size_mb", "error" ]
+
+logger = logging.getLogger(__name__)
+
+
+def probemap(config, fi):
+    """
+    read the properties of a map from its header, without reading any pixel data
+
+    returns one catalogue row as dict
+        unreadable files are reported via error, rather than raised
+    """
+    row = dict.fromkeys(COLUMNS)
+    row["file"] = fi
+
+    try:
+        row["size_mb"] = round(os.path.getsize(fi)/config['MBCONV'], 3)
+
+        with open(fi, mode='rb') as infile:
+            headerdict, ___, detarray = bufferops.probeheader(infile, config['PXHEADERLEN'])
+
+        header = headerdict['File Header']
+
+        row["xres"] = int(header['Xres'])
+        row["yres"] = int(header['Yres'])
+        row["npx"] = row["xres"]*row["yres"]
+        row["width_mm"] = float(header['Width (mm)'])
+        row["height_mm"] = float(header['Height (mm)'])
+        row["dwell_ms"] = float(header['Dwell (mS)'])
+        row["ndet"] = int(max(detarray)+1)
+        row["nchan"] = int(header['Chan'])
+        row["gain_ev"] = float(header['Gain (eV)'])
+
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+
+    return row
+
+
+def catalogue(config, files, nworkers: int):
+    """
+    probe each file across a pool of threads
+
+    returns list of catalogue rows, in the order of files
+    """
+    with ThreadPoolExecutor(max_workers=nworkers) as executor:
+        rows = list(executor.map(lambda fi: probemap(config, fi), files))
+
+    return rows
+
+
+def writecatalogue(filepath, rows):
+    """
+    write the catalogue as .csv or .json, by extension
+    """
+    if os.path.splitext(filepath)[1] == ".json":
+        with open(filepath, "w") as f:
+            json.dump(rows, f, indent=2)
+    else:
+        with open(filepath, "w", newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    return
+
+
+def entry_catalogue():
+    """
+    entrypoint wrapper getting args from sys
+    """
+    args_in = sys.argv[1:]  #NB: exclude 0 == script name
+
+    read_catalogue(args_in)
+
+
+def read_catalogue(args_in):
+    """
+    catalogue all maps according to args_in
+
+    returns list of catalogue rows
+    """
+    starttime = time.time()
+
+    config = utils.initcfg(PACKAGE_CONFIG)
+
+    args = argops.readargs_catalogue(args_in, config)
+
+    files = utils.findmaps(args.catalogue, config, args.catalogue_recursive)
+
+    rows = catalogue(config, files, args.catalogue_workers)
+
+    print(tabulate([ [ row[column] for column in COLUMNS ] for row in rows ], headers=COLUMNS, tablefmt='psql'))
+
+    if args.catalogue_output != None:
+        writecatalogue(args.catalogue_output, rows)
+
+    runtime = time.time() - starttime
+    nfailed = sum(1 for row in rows if row["error"] is not None)
+
+    print(
+    "---------------------------\n"
+    "CATALOGUE COMPLETE\n"
+    "---------------------------\n"
+    f"maps found: {len(rows)}\n"
+    f"maps unreadable: {nfailed}\n"
+    f"total time: {round(runtime,2)} s\n"
+    "---------------------------"
+    )
+
+    return rows
+
+
+if __name__ == '__main__':
+    entry_catalogue()
+
+    sys.exit()
@@ -10,12 +10,9 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import xfmkit.config as config
 import xfmkit.utils as utils
 import xfmkit.argops as argops
-import xfmkit.clustering as clustering
-import xfmkit.visualisations as vis
 import xfmkit.processops as processops
 import xfmkit.structures as structures
 import xfmkit.geopixeio as geopixeio
-import xfmkit.somfit as somfit
 
 #-----------------------------------
 #vars
@@ -37,7 +34,6 @@ def logging_setup():
     
     logger.addHandler(filehandler)
 
-logging_setup()
 
 def entry_processed(conf_file=CONF_FILE_DEFAULT):
     """
@@ -47,6 +43,8 @@ def entry_processed(conf_file=CONF_FILE_DEFAULT):
 
     config.setup(conf_file=conf_file)
 
+    logging_setup()
+
     read_processed(args_in)
 
     return
@@ -86,7 +84,11 @@ def read_processed(args_in):
 
     overwrite = ( args.force or args.force_clustering )
 
+    import xfmkit.clustering as clustering
+
     if args.use_som:
+        import xfmkit.somfit as somfit
+
         categories, embedding, kde = somfit.run(pxs.weighted.d, output_directory, force=(args.force or args.force_clustering), overwrite=overwrite)
     else:
         categories, embedding, kde = clustering.run(pxs.weighted.d, output_directory, eom=args.classes_eom, majors=args.majors, target_components=args.n_components, force_embed=args.force, force_clust=args.force_clustering, overwrite=overwrite, do_kde=args.kde)
@@ -97,6 +99,8 @@ def read_processed(args_in):
 
     geopixeio.export_regions(categories, pxs.dimensions, output_directory=output_directory)
 
+    import xfmkit.visualisations as vis
+
     if args.use_som:
         palette = vis.plot_som(categories, classavg, embedding, pxs.data.dimensions, output_directory=output_directory, labels=pxs.labels)
     else:
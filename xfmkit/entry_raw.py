@@ -9,14 +9,15 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import xfmkit.utils as utils
 import xfmkit.argops as argops
-import xfmkit.rgbspectrum as rgbspectrum
-import xfmkit.clustering as clustering
-import xfmkit.visualisations as vis
 import xfmkit.dtops as dtops
 import xfmkit.parser as parser
-import xfmkit.diagops as diagops
+import xfmkit.planner as planner
+import xfmkit.instrument as instrument
 import xfmkit.config as configuration
 
+#   analysis modules import matplotlib, seaborn, umap, hdbscan etc., so are imported only when their flags are used
+#       rgbspectrum, diagops with -a, clustering, visualisations with -c
+
 """
 Parses spectrum-by-pixel maps from IXRF XFM
 
@@ -67,9 +68,30 @@ def entry_raw():
 
 
 
-def read_raw(args_in):
+def preview(config, args, dirs, pixelseries, xfmap):
+    """
+    refresh deadtime and colour plots from the rows parsed so far
+        figures are closed after each refresh, so they do not accumulate while following
+    """
+    import matplotlib.pyplot as plt
+    import xfmkit.rgbspectrum as rgbspectrum
+
+    if not args.modify_deadtimes > 100:
+        pixelseries = pixelseries.get_dtmod(config, xfmap, args.modify_deadtimes)
+
+    if np.max(pixelseries.flatsum) > 0:
+        dtops.dtplots(config, dirs.plots, pixelseries.dt, pixelseries.sum, pixelseries.dtmod, pixelseries.dimensions[1], pixelseries.dimensions[0], pixelseries.ndet, args.index_only)
+        rgbspectrum.calccolours(config, pixelseries, xfmap, pixelseries.flattened, dirs)
+
+    plt.close('all')
+
+
+def read_raw(args_in, callback=None):
     """
     parse map according to args_in
+
+    callback(stage, done, total) receives progress within each stage, eg. for a progress bar
+        throughput of each stage is logged, and written to run_report.json in the exports directory
     
     return pixelseries, xfmap and analysis results
     """
@@ -80,17 +102,37 @@ def read_raw(args_in):
     #get command line arguments
     args = argops.readargs(args_in, config)
 
+    #a followed map may have only its header so far
+    if args.follow:
+        parser.waitforheader(args.input_file, config['PXHEADERLEN'], args.follow_interval, args.follow_timeout)
+
+    #estimate memory and choose a parse strategy before any work
+    if not args.no_plan:
+        args = planner.plan(config, args)
+
     #initialise read file and directory structure 
     config, dirs = utils.initfiles(args, config)
 
+    #record throughput of each stage
+    instrument.start(args.input_file, callback, logging.getLogger(__name__))
+
     #perform parse
-    xfmap, pixelseries = parser.read(config, args, dirs)
+    #   when following a file as it is written, refresh plots as rows land
+    if args.follow and args.analyse:
+        onrows = lambda pixelseries, xfmap: preview(config, args, dirs, pixelseries, xfmap)
+    else:
+        onrows = None
+
+    xfmap, pixelseries = parser.read(config, args, dirs, onrows)
 
     #ANALYSIS
 
     #perform post-analysis:
     #   create and show colourmap, deadtime/sum reports
     if args.analyse:
+        import xfmkit.rgbspectrum as rgbspectrum
+        import xfmkit.diagops as diagops
+
         #uncomment to fit baselines
         #pixelseries.corrected=fitting.calc_corrected(pixelseries.flattened, pixelseries.energy, pixelseries.npx, pixelseries.nchan)
 
@@ -101,30 +143,44 @@ def read_raw(args_in):
             realtime, livetime, triggers, events, icr, ocr, dt_evt, dt_rt = diagops.dtfromdiag(dirs.logf)
 
         #if data is present
-        if (np.max(pixelseries.data) > 0) and pixelseries.parsed == True:
-            print("--------------")
-            print("GENERATING PLOTS")
-            dtops.dtplots(config, dirs.plots, pixelseries.dt, pixelseries.sum, pixelseries.dtmod, xfmap.xres, xfmap.yres, pixelseries.ndet, args.index_only)
-
-            pixelseries.rgbarray, pixelseries.rvals, pixelseries.gvals, pixelseries.bvals \
-                = rgbspectrum.calccolours(config, pixelseries, xfmap, pixelseries.flattened, dirs)       #flattened / corrected
-            print("--------------")
-            print("PLOTTING COMPLETE")
+        if pixelseries.parsed == True and (np.max(pixelseries.flatsum) > 0):
+            with instrument.stage("plots") as stage:
+                print("--------------")
+                print("GENERATING PLOTS")
+                dtops.dtplots(config, dirs.plots, pixelseries.dt, pixelseries.sum, pixelseries.dtmod, pixelseries.dimensions[1], pixelseries.dimensions[0], pixelseries.ndet, args.index_only)
+
+                if args.stream:
+                    #second pass over the file, one batch at a time
+                    pixelseries.rgbarray, pixelseries.rvals, pixelseries.gvals, pixelseries.bvals \
+                        = rgbspectrum.calccolours(config, pixelseries, xfmap, None, dirs, batches=parser.iter_pixels(xfmap, pixelseries))
+                else:
+                    pixelseries.rgbarray, pixelseries.rvals, pixelseries.gvals, pixelseries.bvals \
+                        = rgbspectrum.calccolours(config, pixelseries, xfmap, pixelseries.flattened, dirs)       #flattened / corrected
+                print("--------------")
+                print("PLOTTING COMPLETE")
+                stage.add(pixels=pixelseries.npx)
         dt_avg = dtops.dt_stats(pixelseries.dt)
      
     else:
         pixelseries.rgbarray = None
     #perform clustering
     if args.classify_spectra:
-        pixelseries.categories, embedding = clustering.run( pixelseries.flattened, dirs.embeddings, force_embed=args.force, force_clust=args.force, overwrite=config['OVERWRITE_EXPORTS'] )
-        
-        pixelseries.classavg = clustering.get_classavg( pixelseries.flattened, pixelseries.categories, dirs.embeddings, force=args.force, overwrite=config['OVERWRITE_EXPORTS'])
+        import xfmkit.clustering as clustering
+        import xfmkit.visualisations as vis
 
-        palette = vis.plot_clusters(pixelseries.categories, pixelseries.classavg, embedding, pixelseries.dimensions)
+        with instrument.stage("clustering") as stage:
+            pixelseries.categories, embedding = clustering.run( pixelseries.flattened, dirs.embeddings, force_embed=args.force, force_clust=args.force, overwrite=config['OVERWRITE_EXPORTS'] )
+            
+            pixelseries.classavg = clustering.get_classavg( pixelseries.flattened, pixelseries.categories, dirs.embeddings, force=args.force, overwrite=config['OVERWRITE_EXPORTS'])
+
+            palette = vis.plot_clusters(pixelseries.categories, pixelseries.classavg, embedding, pixelseries.dimensions)
+            stage.add(pixels=pixelseries.npx)
     else:
         pixelseries.categories = None
         pixelseries.classavg = None
 
+    instrument.finish(dirs.exports)
+
     print("Processing complete")
 
     return pixelseries, xfmap, #dt_log
@@ -0,0 +1,74 @@
+import sys
+import os
+import time
+
+import logging
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import xfmkit.utils as utils
+import xfmkit.argops as argops
+import xfmkit.synthetic as synthetic
+
+"""
+Writes a synthetic .GeoPIXE map
+
+- dimensions, detectors, count rate, sparsity and deadtime as given
+- optionally truncated, or with corrupted records
+    see: xfmkit/synthetic.py
+"""
+#-----------------------------------
+#vars
+#-----------------------------------
+PACKAGE_CONFIG='xfmkit/config.yaml'
+
+logger = logging.getLogger(__name__)
+
+
+def entry_synthetic():
+    """
+    entrypoint wrapper getting args from sys
+    """
+    args_in = sys.argv[1:]  #NB: exclude 0 == script name
+
+    write_synthetic(args_in)
+
+
+def write_synthetic(args_in):
+    """
+    write a synthetic map according to args_in
+
+    returns the result of synthetic.write
+    """
+    starttime = time.time()
+
+    config = utils.initcfg(PACKAGE_CONFIG)
+
+    args = argops.readargs_synthetic(args_in, config)
+
+    result = synthetic.write(args.synthetic, args.xres, args.yres, args.detectors, config['NCHAN'], \
+        rate=args.rate, distribution=args.rate_distribution, sparsity=args.sparsity, deadtime=args.deadtime, \
+        truncate=args.truncate, corrupt=args.corrupt, seed=args.seed)
+
+    runtime = time.time() - starttime
+
+    print(
+    "---------------------------\n"
+    "SYNTHETIC MAP COMPLETE\n"
+    "---------------------------\n"
+    f"file: {result['file']}\n"
+    f"dimensions (x,y): {args.xres},{args.yres}\n"
+    f"detectors: {args.detectors}\n"
+    f"size: {round(result['bytes']/config['MBCONV'], 1)} Mb\n"
+    f"corrupted records: {len(result['corrupted'])}\n"
+    f"total time: {round(runtime,2)} s\n"
+    "---------------------------"
+    )
+
+    return result
+
+
+if __name__ == '__main__':
+    entry_synthetic()
+
+    sys.exit()
@@ -1,6 +1,5 @@
 import numpy as np
 
-from scipy import ndimage
 from math import sqrt
 
 import xfmkit.utils as utils
@@ -12,12 +11,15 @@ def gaussianblur(img, kernelsize: int):
     """
     applies a gaussian blur to a single image according to kernel size (in pixels, = sd param) 
     """
+    from scipy import ndimage
+
     img_ = ndimage.gaussian_filter(img, kernelsize, mode='mirror')
 
     return img_
 
 
 def img_resize(img, zoom_factor, order=1):
+    from scipy import ndimage
 
     img_ = ndimage.zoom(map,  zoom_factor, order=order) 
 
@@ -28,6 +30,7 @@ def apply_resize(img, sd_img, zoom_factor, order=1):
     resizes a map 
 
     """
+    from scipy import ndimage
     
     #if multiple channels are present (ie. X, Y, NCHAN)
     #   do not resize along channel axis
@@ -0,0 +1,183 @@
+import sys
+import os
+import json
+import time
+from contextlib import contextmanager
+
+import logging
+logger = logging.getLogger(__name__)
+
+"""
+Records throughput for each stage of a run
+
+- wall and CPU time, bytes, records and pixels per stage
+- logs each stage as it completes, and writes a JSON run report
+- passes progress within each stage to an optional callback, eg. for a progress bar
+    callback(stage: str, done: int, total: int)
+
+stages are recorded against the active run, if any, see start()
+    otherwise they are timed and discarded
+"""
+#-----------------------------------
+#vars
+#-----------------------------------
+REPORT_NAME = "run_report.json"
+MBCONV = 1048576    #bytes per Mb
+
+#-----------------------------------
+#INITIALISE
+#-----------------------------------
+
+this = sys.modules[__name__]
+
+this.active = None      #RunReport receiving stages
+
+
+def cputime():
+    """
+    CPU time of this process and its finished child processes
+    """
+    times = os.times()
+
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class Stage:
+    """
+    counts and timings for one stage
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.bytes = 0
+        self.records = 0
+        self.pixels = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def add(self, nbytes: int=0, records: int=0, pixels: int=0):
+        """
+        add to the counts for this stage
+        """
+        self.bytes += int(nbytes)
+        self.records += int(records)
+        self.pixels += int(pixels)
+
+    def asdict(self):
+        return {
+            "stage": self.name,
+            "wall_s": round(self.wall, 6),
+            "cpu_s": round(self.cpu, 6),
+            "bytes": self.bytes,
+            "records": self.records,
+            "pixels": self.pixels,
+            "mb_per_s": round(self.bytes/MBCONV/self.wall, 3) if self.wall > 0 else None,
+            "px_per_s": round(self.pixels/self.wall, 1) if self.wall > 0 else None,
+        }
+
+
+class RunReport:
+    """
+    stages recorded over one run
+    """
+    def __init__(self, source: str=None, callback=None, log=None):
+        self.source = source
+        self.callback = callback
+        self.log = logger if log is None else log
+        self.stages = []
+        self.current = None
+        self.created = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.wall = time.perf_counter()
+        self.cpu = cputime()
+
+    def record(self, stage):
+        """
+        keep a completed stage, and log it
+        """
+        self.stages.append(stage)
+
+        result = stage.asdict()
+        self.log.info(f"stage {stage.name}: {result['wall_s']} s wall, {result['cpu_s']} s cpu, "
+            f"{stage.bytes} bytes, {stage.records} records, {stage.pixels} pixels, "
+            f"{result['mb_per_s']} MB/s, {result['px_per_s']} px/s")
+
+    def asdict(self):
+        wall = time.perf_counter() - self.wall
+
+        return {
+            "file": self.source,
+            "created": self.created,
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cputime() - self.cpu, 6),
+            "stages": [ stage.asdict() for stage in self.stages ],
+        }
+
+    def export(self, dir):
+        """
+        write the report to json
+        """
+        with open(os.path.join(dir, REPORT_NAME), "w") as f:
+            json.dump(self.asdict(), f, indent=2)
+
+
+def start(source: str=None, callback=None, log=None):
+    """
+    begin recording a run
+
+    returns RunReport
+    """
+    this.active = RunReport(source, callback, log)
+
+    return this.active
+
+
+def finish(dir: str=None):
+    """
+    stop recording the active run, and write its report to dir if given
+
+    returns RunReport
+    """
+    report = this.active
+    this.active = None
+
+    if report is not None and dir is not None:
+        report.export(dir)
+
+    return report
+
+
+@contextmanager
+def stage(name: str):
+    """
+    time a stage of the active run
+
+    yields Stage, to which counts may be added
+    """
+    current = Stage(name)
+    report = this.active
+
+    if report is not None:
+        previous = report.current
+        report.current = current
+
+    wall = time.perf_counter()
+    cpu = cputime()
+
+    try:
+        yield current
+    finally:
+        current.wall = time.perf_counter() - wall
+        current.cpu = cputime() - cpu
+
+        if report is not None:
+            report.current = previous
+            report.record(current)
+
+
+def progress(done: int, total: int):
+    """
+    pass progress within the current stage to the callback
+    """
+    report = this.active
+
+    if report is not None and report.callback is not None and report.current is not None:
+        report.callback(report.current.name, int(done), int(total))
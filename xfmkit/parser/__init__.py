@@ -1,3 +1,7 @@
 from ._read import *
 from ._parse import *
-from ._utils import *
\ No newline at end of file
+from ._utils import *
+from ._cache import *
+from ._stream import *
+from ._follow import *
+from ._scan import *
@@ -0,0 +1,134 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+INDEX_CACHE_VERSION = 1
+INDEX_CACHE_SUFFIX = ".index.npz"
+HASH_BLOCK = 1048576    #bytes hashed at start, middle and end of file
+
+#per-record arrays held on pixelseries
+INDEX_CACHE_ARRAYS = [ "pxlen", "xidx", "yidx", "det", "dt" ]
+
+
+def indexcachepath(fi):
+    """
+    sidecar index file, stored alongside the .GeoPIXE
+    """
+    return fi+INDEX_CACHE_SUFFIX
+
+
+def fingerprint(fi):
+    """
+    identify the file without reading all of it
+        size, mtime and a hash of blocks from the start, middle and end
+    """
+    stat = os.stat(fi)
+    hasher = hashlib.blake2b(digest_size=16)
+
+    with open(fi, mode='rb') as f:
+        for pos in [ 0, stat.st_size//2, stat.st_size-HASH_BLOCK ]:
+            f.seek(max(pos, 0))
+            hasher.update(f.read(HASH_BLOCK))
+
+    return f"{stat.st_size}:{stat.st_mtime_ns}:{hasher.hexdigest()}"
+
+
+def saveindex(xfmap, pixelseries, fi):
+    """
+    write the index and pixel header arrays to the sidecar cache
+
+    skipped with a warning if the cache cannot be written, eg. read-only directory
+    """
+    cachefile = indexcachepath(fi)
+    tmpfile = cachefile+".tmp.npz"
+
+    try:
+        np.savez(tmpfile, 
+            version=np.array(INDEX_CACHE_VERSION),
+            fingerprint=np.array(fingerprint(fi)),
+            headerdict=np.array(json.dumps(xfmap.headerdict, sort_keys=True)),
+            detarray=xfmap.detarray,
+            indexlist=xfmap.indexlist,
+            npx=np.array(pixelseries.npx),
+            nrows=np.array(pixelseries.nrows),
+            pxlen=pixelseries.pxlen,
+            xidx=pixelseries.xidx,
+            yidx=pixelseries.yidx,
+            det=pixelseries.det,
+            dt=pixelseries.dt,
+        )
+        os.replace(tmpfile, cachefile)
+        print(f"index cached to {cachefile}")
+    except OSError:
+        print(f"WARNING: could not write index cache {cachefile}")
+
+    return
+
+
+def loadindex(xfmap, pixelseries, fi):
+    """
+    load the index and pixel header arrays from the sidecar cache, in place of indexmap()
+
+    only loaded if fingerprint, header and detector config match the current file
+
+    returns pixelseries, xfmap, and whether cache was loaded
+    """
+    cachefile = indexcachepath(fi)
+
+    if not os.path.isfile(cachefile):
+        return pixelseries, xfmap, False
+
+    #read and check everything before touching pixelseries
+    #   so a partial read leaves it as it was for a fresh index
+    try:
+        with np.load(cachefile, allow_pickle=False) as cache:
+            if not ( int(cache['version']) == INDEX_CACHE_VERSION 
+                    and str(cache['fingerprint']) == fingerprint(fi) 
+                    and str(cache['headerdict']) == json.dumps(xfmap.headerdict, sort_keys=True) 
+                    and np.array_equal(cache['detarray'], xfmap.detarray) ):
+                print(f"index cache out of date, re-indexing")
+                return pixelseries, xfmap, False
+
+            indexlist = cache['indexlist']
+            npx = int(cache['npx'])
+            nrows = int(cache['nrows'])
+            arrays = { name: cache[name] for name in INDEX_CACHE_ARRAYS }
+
+    except (OSError, KeyError, ValueError):
+        print(f"WARNING: could not read index cache {cachefile}, re-indexing")
+        return pixelseries, xfmap, False
+
+    npx_found = indexlist.shape[0]
+    xwidth = pixelseries.dimensions[1]
+
+    #size after truncation, as per early stop during indexing
+    expected_npx = pixelseries.npx if npx == pixelseries.npx else nrows*xwidth
+    truncated = not npx == pixelseries.npx
+
+    if not ( npx_found > 0 and expected_npx <= pixelseries.npx
+            and ( not truncated or nrows-1 == (npx_found-1)//xwidth )
+            and all( array.shape == (expected_npx,)+pixelseries.pxlen.shape[1:] for array in arrays.values() ) ):
+        print(f"index cache out of date, re-indexing")
+        return pixelseries, xfmap, False
+
+    if truncated:
+        pixelseries.truncate_y(npx_found, nrows)
+
+    for name, array in arrays.items():
+        getattr(pixelseries, name)[:] = array
+
+    pixelseries.npx = npx
+    pixelseries.nrows = nrows
+    pixelseries.dimensions = ( nrows, pixelseries.dimensions[1] )
+
+    xfmap.indexlist = indexlist
+    xfmap.npx_found = npx_found
+
+    print("--------------")
+    print(f"INDEX LOADED FROM CACHE: {cachefile}")
+
+    return pixelseries, xfmap, True
@@ -0,0 +1,142 @@
+import os
+import time
+import numpy as np
+
+import xfmkit.bufferops as bufferops
+import xfmkit.instrument as instrument
+
+from ._parse import parsewindow, parsercore
+from ._utils import pixelwindows, MapEarlyStop
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def waitforheader(fi, pxheaderlen: int, interval: float, timeout: float):
+    """
+    wait until the header and detector config can be read from a map still being written
+        ie. the file header, and pixel headers until detector 0 repeats
+
+    raises ValueError if not written after timeout seconds
+    """
+    idle = 0.0
+
+    while True:
+        try:
+            with open(fi, mode='rb') as infile:
+                bufferops.probeheader(infile, pxheaderlen)
+            return
+        except MapEarlyStop:
+            if idle >= timeout:
+                raise ValueError(f"FATAL: no pixel records within {timeout} s, cannot read detector config")
+
+            time.sleep(interval)
+            idle += interval
+
+
+def followmap(xfmap, pixelseries, python_only: bool, interval: float, timeout: float, onrows=None):
+    """
+    index and parse a map while it is still being written
+    - poll the file for growth every interval seconds
+    - hop over any newly completed records, keeping whole rows only
+    - decode their headers and parse their data into pixelseries
+
+    onrows(pixelseries, xfmap) is called after each set of new rows is parsed
+        eg. to refresh previews
+
+    stops once all rows in the header are found,
+        or after timeout seconds without a new row, truncating as per an early EOF
+    """
+    print("--------------")
+    print(f"FOLLOWING {xfmap.infile.name}")
+
+    if parsercore is None and not python_only:
+        print("WARNING: parsercore submodule not available, falling back to Python")
+        python_only = True
+
+    pxheaderlen = xfmap.PXHEADERLEN
+    ndet = xfmap.ndet
+    xres = xfmap.xres
+
+    indexlist = np.zeros((xfmap.npx, ndet), dtype=np.uint64)
+
+    #derived arrays are filled row by row, rather than by get_derived
+    if pixelseries.parsing:
+        pixelseries.flattened = np.zeros((pixelseries.npx, pixelseries.nchan), dtype=np.uint32)
+
+    npx = 0                     #pixels parsed so far, always whole rows
+    idx = xfmap.datastart       #start of the next unparsed record
+    idle = 0.0
+
+    while npx < xfmap.npx:
+        newpx = 0
+
+        if os.path.getsize(xfmap.infile.name) >= idx + pxheaderlen:
+            with open(xfmap.infile.name, mode='rb') as infile:
+                buffer = bufferops.MmapBuffer(infile, xfmap.chunksize, False)
+
+                offsets, ___ = bufferops.hoprecords(buffer.data, idx, buffer.len, (xfmap.npx-npx)*ndet, pxheaderlen)
+
+                #rows still being written are picked up on a later pass
+                newpx = ( len(offsets)//ndet // xres ) * xres
+
+                if newpx > 0:
+                    last = npx + newpx
+                    offsets = offsets[:newpx*ndet]
+                    headers = bufferops.readpxheaders(buffer.data, offsets, pxheaderlen).reshape(newpx, ndet)
+
+                    if not np.all(headers['det'] == np.arange(ndet, dtype=np.uint16)):
+                        raise ValueError("FATAL: detector order in pixel headers does not match detector config")
+
+                    pixelseries = pixelseries.receiveheaders(npx, headers)
+                    indexlist[npx:last] = offsets.reshape(newpx, ndet)
+
+                    if pixelseries.parsing:
+                        pxlen = pixelseries.pxlen
+                        data = pixelseries.data
+
+                        for window in pixelwindows(indexlist[npx:last], pxlen[npx:last], xfmap.chunksize):
+                            parsewindow(buffer, indexlist[npx:last], pxlen[npx:last], window, data[npx:last], \
+                                pxheaderlen, xfmap.BYTESPERCHAN, python_only, pixelseries.chanwindow, pixelseries.rebin)
+
+                        pixelseries.flattened[npx:last] = np.sum(data[npx:last], axis=1, dtype=np.uint32)
+                        pixelseries.sum[npx:last] = np.sum(data[npx:last], axis=2, dtype=np.uint32)
+                        pixelseries.flatsum[npx:last] = np.sum(pixelseries.sum[npx:last], axis=1, dtype=np.uint32)
+
+                    idx = int(offsets[-1]) + int(pixelseries.pxlen[last-1,-1])
+                    npx = last
+
+                #release the mapping before the file is next checked
+                del buffer
+
+        if newpx > 0:
+            idle = 0.0
+            print(f"rows parsed: {npx//xres}/{xfmap.yres}")
+            instrument.progress(npx, xfmap.npx)
+
+            if onrows is not None:
+                onrows(pixelseries, xfmap)
+        elif npx < xfmap.npx:
+            if idle >= timeout:
+                print(f"\n WARNING: no new rows within {timeout} s - stopping at row {npx//xres}/{xfmap.yres}")
+                break
+
+            time.sleep(interval)
+            idle += interval
+
+    if npx == 0:
+        raise ValueError("FATAL: no complete rows found")
+
+    nrows = npx//xres
+
+    if npx < xfmap.npx:
+        print("Resizing dataset to match size of indexed map")
+        pixelseries.truncate_y(npx, nrows)
+    else:
+        print(f"END OF MAP: row {nrows-1}/{xfmap.yres}, pixel {npx-1}")
+
+    xfmap.indexlist = indexlist[:npx]
+    xfmap.npx_found = npx
+    pixelseries.parsed = pixelseries.parsing
+
+    return pixelseries, xfmap
@@ -1,12 +1,19 @@
+import os
 import time
+import tempfile
 import numpy as np
 import logging
+import multiprocessing as mp
 
-import parsercore
+try:
+    import parsercore
+except ImportError:
+    parsercore = None
 
 import xfmkit.bufferops as bufferops
 import xfmkit.utils as utils
 import xfmkit.structures as structures
+import xfmkit.instrument as instrument
 
 from ._utils import *
 
@@ -15,6 +22,8 @@ logger = logging.getLogger(__name__)
 
 DEBUG = False
 
+PARTITIONS_PER_PROCESS = 4  #more partitions than processes, to balance uneven pixel sizes
+
 
 def indexmap(xfmap, pixelseries, multiload):
     """
@@ -28,7 +37,7 @@ def indexmap(xfmap, pixelseries, multiload):
         indexlist=np.empty((xfmap.npx, xfmap.ndet),dtype=np.uint64) #must match xfmap.indexlist declaration
 
         xfmap.resetfile()
-        buffer = bufferops.MapBuffer(xfmap.infile, xfmap.chunksize, multiload)
+        buffer = xfmap.getbuffer(multiload)
         idx = xfmap.datastart
         pxheaderlen = xfmap.PXHEADERLEN    
 
@@ -56,7 +65,7 @@ def indexmap(xfmap, pixelseries, multiload):
 
         #assign final sizes
         npx=pxidx+1     #pixel index still on final pixel
-        nrows=pixelseries.yidx+1 
+        nrows=int(pixelseries.yidx[pxidx,0])+1
 
         if not pixelseries.npx == xfmap.npx:
             print("WARNING: pixelseries and map object have different pixel sizes at clean completion")
@@ -93,7 +102,320 @@ def indexmap(xfmap, pixelseries, multiload):
         return pixelseries, xfmap
 
 
-def parse(xfmap, pixelseries, multiload):
+def indexmap_vector(xfmap, pixelseries):
+    """
+    index the file via bulk header decode
+    - hop over record lengths to locate every pixel record
+    - decode all pixel headers at once
+
+    equivalent to indexmap(), without per-record Python calls
+    """
+    print("--------------")
+    print("INDEXING")
+
+    xfmap.resetfile()
+    buffer = bufferops.MmapBuffer(xfmap.infile, xfmap.chunksize, False)
+    pxheaderlen = xfmap.PXHEADERLEN
+    ndet = xfmap.ndet
+
+    offsets, idx = bufferops.hoprecords(buffer.data, xfmap.datastart, buffer.len, xfmap.npx*ndet, pxheaderlen)
+
+    #drop any incomplete pixel at EOF
+    npx = len(offsets)//ndet
+
+    if npx == 0:
+        raise ValueError("FATAL: no complete pixel records found")
+
+    offsets = offsets[:npx*ndet]
+    headers = bufferops.readpxheaders(buffer.data, offsets, pxheaderlen).reshape(npx, ndet)
+
+    if not np.all(headers['det'] == np.arange(ndet, dtype=np.uint16)):
+        raise ValueError("FATAL: detector order in pixel headers does not match detector config")
+
+    pixelseries = pixelseries.receiveheaders(0, headers)
+
+    indexlist = offsets.reshape(npx, ndet)
+    nrows = int(headers['yidx'][-1,0])+1
+
+    if npx == xfmap.npx:
+        print(f"END OF MAP: row {nrows-1}/{xfmap.yres}, pixel {npx-1}")
+
+        pixelseries.npx = npx
+        pixelseries.nrows = nrows
+        pixelseries.dimensions = ( nrows, pixelseries.dimensions[1] )
+
+        xfmap.indexlist = indexlist
+        xfmap.npx_found = npx
+    else:
+        print(f"\n WARNING: Early EOF at index {idx} - map dimensions may be incorrect in file header.")
+        print("Resizing dataset to match size of indexed map")
+
+        pixelseries.truncate_y(npx, nrows)
+        xfmap.indexlist = indexlist
+        xfmap.npx_found = npx
+
+    xfmap.resetfile()
+    return pixelseries, xfmap
+
+
+def selectroi(config, xfmap, pixelseries, xcoords, ycoords, parsing: bool):
+    """
+    restrict an indexed map to a rectangular region of interest
+
+    replaces pixelseries with one sized to the region
+        and the index with the records for those pixels only
+        so that parsing seeks directly to each row segment of the region
+    """
+    pixelseries, pxidx = pixelseries.get_roi(config, xfmap, xcoords, ycoords, parsing)
+
+    xfmap.indexlist = xfmap.indexlist[pxidx]
+
+    print(f"Region of interest: {pixelseries.dimensions[1]} x {pixelseries.dimensions[0]} pixels, "
+        f"{pixelseries.npx} of {xfmap.npx} ({100*pixelseries.npx/xfmap.npx:.1f} %)")
+
+    return pixelseries, xfmap
+
+
+def readstream(stream_indexes, stream_pxlen, stream):
+    """
+    parse a chunk of records via parsercore without copying it
+        stream may be bytes, bytearray or memoryview
+        copies to bytes only if this parsercore build rejects the buffer
+    """
+    try:
+        return parsercore.readstream(stream_indexes, stream_pxlen, stream, len(stream))
+    except TypeError:
+        return parsercore.readstream(stream_indexes, stream_pxlen, bytes(stream), len(stream))
+
+
+def parsewindow(buffer, indexlist, pxlen, window, data, pxheaderlen: int, bytesperchan: int, python_only: bool, \
+        chanwindow, rebin: int):
+    """
+    parse one pixel-aligned window from a memory-mapped buffer into data
+        via NumPy if python_only, otherwise via parsercore
+        restricted to chanwindow and rebinned, see bufferops.binchannels
+
+    window as (first pixel, last pixel+1, start byte, end byte), from pixelwindows()
+    """
+    first, last, start, end = window
+
+    if python_only:
+        #view target as one row per record, in file order
+        window_data = data[first:last].reshape(-1, data.shape[-1])
+
+        bufferops.readpxspectra(buffer.data, indexlist[first:last].ravel(), pxlen[first:last].ravel(), \
+                pxheaderlen, bytesperchan, window_data, chanwindow, rebin)
+    else:
+        #slice of the mapping is a view of the current window, not a copy
+        stream = buffer.data[start:end]
+        stream_indexes = indexlist[first:last,:]-np.uint64(start)
+
+        data[first:last,:,:] = bufferops.binspectra(readstream(stream_indexes, pxlen[first:last,:], stream), \
+                chanwindow[0], chanwindow[1], rebin)
+
+    return data
+
+
+def parseworker(fi, datafile, offset: int, shape, dtype: str, first: int, indexlist, pxlen, pxheaderlen: int, bytesperchan: int, windowsize: int, python_only: bool, \
+        chanwindow, rebin: int):
+    """
+    parse one partition of pixels into the shared data array
+        opens its own file handle and memory map
+        indexlist and pxlen cover the partition only, beginning at pixel first
+    """
+    data = np.memmap(datafile, dtype=dtype, mode='r+', shape=shape, offset=offset)
+    partition = data[first:first+indexlist.shape[0]]
+
+    with open(fi, mode='rb') as infile:
+        buffer = bufferops.MmapBuffer(infile, windowsize, False)
+
+        for window in pixelwindows(indexlist, pxlen, windowsize):
+            parsewindow(buffer, indexlist, pxlen, window, partition, pxheaderlen, bytesperchan, python_only, chanwindow, rebin)
+
+    del partition, data
+
+    return first
+
+
+def shareddir():
+    """
+    directory for data shared between processes
+        RAM-backed /dev/shm where available, otherwise system temp
+    """
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    else:
+        return tempfile.gettempdir()
+
+
+def parse_parallel(xfmap, pixelseries, python_only: bool, nprocesses: int):
+    """
+    read in the map data after indexing, across multiple processes
+
+    splits the indexed pixels into contiguous partitions by byte offset
+        each worker opens the file itself and parses its partitions
+        directly into a shared, memory-mapped PixelSeries.data
+    """
+    indexlist = xfmap.indexlist
+    pxlen = pixelseries.pxlen
+    shape = pixelseries.data.shape
+    npx = indexlist.shape[0]
+
+    #backing file for shared data
+    #   out-of-core data is already memory-mapped, workers write to it directly
+    #   otherwise removed once workers complete, mapping remains valid until released
+    shared = not isinstance(pixelseries.data, np.memmap)
+
+    if shared:
+        fd, datafile = tempfile.mkstemp(prefix="xfmkit_", suffix=".dat", dir=shareddir())
+        os.close(fd)
+        data = np.memmap(datafile, dtype=pixelseries.data.dtype, mode='w+', shape=shape)
+    else:
+        data = pixelseries.data
+        data.flush()
+        datafile = data.filename
+
+    totalbytes = int(indexlist[-1,-1]) + int(pxlen[npx-1,-1]) - int(indexlist[0,0])
+    partitionsize = -(-totalbytes // (nprocesses*PARTITIONS_PER_PROCESS))
+    windowsize = max(xfmap.chunksize // nprocesses, 1)
+
+    tasks = [ (xfmap.infile.name, datafile, data.offset, shape, data.dtype.str, first, indexlist[first:last], pxlen[first:last], \
+                xfmap.PXHEADERLEN, xfmap.BYTESPERCHAN, windowsize, python_only, pixelseries.chanwindow, pixelseries.rebin) \
+                for first, last, ___, ___ in pixelwindows(indexlist, pxlen, partitionsize) ]
+
+    print(f"\nParsing {len(tasks)} partitions across {nprocesses} processes {'via Python' if python_only else 'via C++'}")
+
+    try:
+        #spawn fresh workers, rather than fork threads held by eg. clustering libraries
+        with mp.get_context("spawn").Pool(nprocesses) as pool:
+            results = [ pool.apply_async(parseworker, task) for task in tasks ]
+
+            for task, result in zip(tasks, results):
+                result.get()
+                instrument.progress(task[5] + len(task[6]), npx)
+    finally:
+        if shared:
+            try:
+                os.remove(datafile)
+            except OSError:
+                print(f"WARNING: could not remove shared data file {datafile}")
+
+    print(f"\nEND OF MAP: pixel {npx-1}")
+
+    pixelseries.data = data
+    pixelseries.parsed = True
+
+    return pixelseries
+
+
+def parse_sparse(xfmap, pixelseries):
+    """
+    read in the map data after indexing, into CSR arrays on pixelseries
+
+    channel/count pairs are copied straight into place via NumPy
+        row pointers come from the record lengths, so no gapfilling is needed
+    """
+    xfmap.resetfile()
+    buffer = bufferops.MmapBuffer(xfmap.infile, xfmap.chunksize, False)
+
+    indexlist = xfmap.indexlist
+    pxlen = pixelseries.pxlen
+    ndet = pixelseries.ndet
+    chanstart, chanend = pixelseries.chanwindow
+    rebin = pixelseries.rebin
+
+    pixelseries = pixelseries.init_sparse(xfmap.PXHEADERLEN, xfmap.BYTESPERCHAN)
+    indptr = pixelseries.indptr
+
+    print(f"\nParsing via Python into sparse arrays")
+    for first, last, ___, ___ in pixelwindows(indexlist, pxlen, xfmap.chunksize):
+        print(f"\nReading window, pixels {first} to {last-1}")
+
+        for r0, r1, chan, counts, ___ in bufferops.iterpairs(buffer.data, indexlist[first:last].ravel(), pxlen[first:last].ravel(), \
+                xfmap.PXHEADERLEN, xfmap.BYTESPERCHAN):
+
+            #rebinned channels repeat within a row, which CSR sums as duplicates
+            chan, ___, valid = bufferops.binchannels(chan, chanstart, chanend, rebin)
+
+            #channels beyond nchannels or the window are dropped, as per gapfill
+            #   zeroed in place to keep the row pointers valid
+            chan[~valid] = 0
+            counts[~valid] = 0
+
+            start = indptr[first*ndet+r0]
+            end = indptr[first*ndet+r1]
+            pixelseries.channels[start:end] = chan
+            pixelseries.counts[start:end] = counts
+
+        instrument.progress(last, indexlist.shape[0])
+
+    print(f"\nEND OF MAP: pixel {indexlist.shape[0]-1}")
+
+    pixelseries.parsed = True
+    buffer.wait()
+    xfmap.resetfile()
+
+    return pixelseries
+
+
+def parse_reduced(xfmap, pixelseries):
+    """
+    read in the map data after indexing, accumulating derived arrays only
+
+    channel/count pairs are added straight into flattened and per-detector sums via NumPy
+        the per-detector spectra are never held, beyond the current window
+    """
+    xfmap.resetfile()
+    buffer = bufferops.MmapBuffer(xfmap.infile, xfmap.chunksize, False)
+
+    indexlist = xfmap.indexlist
+    pxlen = pixelseries.pxlen
+    ndet = pixelseries.ndet
+    nchannels = pixelseries.nchan
+    chanstart, chanend = pixelseries.chanwindow
+    rebin = pixelseries.rebin
+
+    pixelseries.flattened = np.zeros((pixelseries.npx, nchannels), dtype=np.uint32)
+    pixelseries.sum = np.zeros((pixelseries.npx, ndet), dtype=np.uint32)
+
+    print(f"\nParsing via Python into flattened and summed arrays")
+    for first, last, ___, ___ in pixelwindows(indexlist, pxlen, xfmap.chunksize):
+        print(f"\nReading window, pixels {first} to {last-1}")
+
+        window_sum = pixelseries.sum[first:last].reshape(-1)
+
+        for r0, r1, chan, counts, npairs in bufferops.iterpairs(buffer.data, indexlist[first:last].ravel(), pxlen[first:last].ravel(), \
+                xfmap.PXHEADERLEN, xfmap.BYTESPERCHAN):
+
+            #record of each pair within the window, as pixel and detector
+            record = np.repeat(np.arange(r0, r1, dtype=np.uint32), npairs)
+            pxidx = first + record // np.uint32(ndet)
+            det = record % np.uint32(ndet)
+
+            #channels beyond nchannels or the window are dropped, as per gapfill
+            outchan, phase, valid = bufferops.binchannels(chan, chanstart, chanend, rebin)
+
+            #channels are unique within a record, so one detector and bin phase at a time gives no repeated indexes
+            for i in range(ndet):
+                for j in range(rebin):
+                    mask = valid & (det == i) & (phase == j)
+                    pixelseries.flattened[pxidx[mask], outchan[mask]] += counts[mask]
+
+            window_sum[r0:r1] = np.bincount(record[valid]-np.uint32(r0), weights=counts[valid], \
+                    minlength=r1-r0).astype(np.uint32)
+
+        instrument.progress(last, indexlist.shape[0])
+
+    print(f"\nEND OF MAP: pixel {indexlist.shape[0]-1}")
+
+    pixelseries.parsed = True
+    buffer.wait()
+    xfmap.resetfile()
+
+    return pixelseries
+
+
+def parse(xfmap, pixelseries, multiload, python_only: bool=False, nprocesses: int=1):
     """
     read in the map data after indexing
 
@@ -101,9 +423,27 @@ def parse(xfmap, pixelseries, multiload):
     """
     print("--------------")
     print("PARSING PIXEL DATA")
+
+    if pixelseries.sparse:
+        return parse_sparse(xfmap, pixelseries)
+
+    if pixelseries.reduced:
+        return parse_reduced(xfmap, pixelseries)
+
+    if parsercore is None and not python_only:
+        print("WARNING: parsercore submodule not available, falling back to Python")
+        python_only = True
+
+    if nprocesses > 1:
+        return parse_parallel(xfmap, pixelseries, python_only, nprocesses)
+
     try:
         xfmap.resetfile()
-        buffer = bufferops.MapBuffer(xfmap.infile, xfmap.chunksize, multiload)
+        #python parse needs random access to whole file
+        if python_only:
+            buffer = bufferops.MmapBuffer(xfmap.infile, xfmap.chunksize, multiload)
+        else:
+            buffer = xfmap.getbuffer(multiload)
         idx = xfmap.datastart
 
         pxheaderlen = xfmap.PXHEADERLEN
@@ -114,25 +454,20 @@ def parse(xfmap, pixelseries, multiload):
         indexlist = xfmap.indexlist
         pxlen=pixelseries.pxlen
 
-#        indices_ravel = np.ravel(indexlist, order='F')
-#        pxlens_ravel = np.ravel(pixelseries.pxlen, order='F')
+        #memory-mapped or using NumPy
+        #   windows are cut on pixel boundaries, so no pixel is split across them
+        if python_only or xfmap.memmap:
+            print(f"\nParsing {'via Python' if python_only else 'memory-mapped file via C++'}")
+            for window in pixelwindows(indexlist, pxlen, xfmap.chunksize):
+                print(f"\nReading window, pixels {window[0]} to {window[1]-1}")
 
-        python_only = False
-        if python_only:
-            print(f"\nParsing via Python")            
-            for pxidx in range(pixelseries.npx):
-                for det in range(pixelseries.ndet):
+                parsewindow(buffer, indexlist, pxlen, window, pixelseries.data, pxheaderlen, bytesperchan, python_only, \
+                        pixelseries.chanwindow, pixelseries.rebin)
 
-                    if not det == pixelseries.det[pxidx,det]:
-                        raise ValueError(f"Detector mistmatch at (pixel,det) = ({pxidx},{det})")
+                instrument.progress(window[1], indexlist.shape[0])
 
-                    absidx=indexlist[pxidx,det]
-                    pxlength=pixelseries.pxlen[pxidx,det]
-
-                    #read spectrum and update buffer if needed
-                    buffer, pixelseries.data[pxidx,det,:] = readspectrum(buffer,det,absidx,pxlength,pxheaderlen,bytesperchan,nchannels)
-
-                ___ = endpx(pxidx, absidx, buffer, xfmap, pixelseries)
+            print(f"\nEND OF MAP: pixel {indexlist.shape[0]-1}")
+            raise MapDone
 
         #using C++
         else:         
@@ -156,7 +491,10 @@ def parse(xfmap, pixelseries, multiload):
                     #if buffer ends perfectly at end of pixel, last good pixel is break px
                     buffer_last_px =  buffer_break_px
                 elif indexlist[buffer_break_px,-1] + pxlen[buffer_break_px,-1] < buffer_end:
-                    raise ValueError("break pixel not at buffer end")
+                    #at EOF, the remainder is an incomplete pixel excluded from the index
+                    if buffer_end < xfmap.fullsize or buffer_break_px < indexlist.shape[0]-1:
+                        raise ValueError("break pixel not at buffer end")
+                    buffer_last_px = buffer_break_px
                 else:
                     buffer_last_px = buffer_break_px - 1
 
@@ -174,11 +512,13 @@ def parse(xfmap, pixelseries, multiload):
 
                  #extract the data
                 #---------------------
-                parsed_stream = parsercore.readstream(stream_indexes, stream_pxlen, buffer.data, len(buffer.data))
+                #full chunks preloaded via multiload are bytearrays, passed as-is
+                parsed_stream = readstream(stream_indexes, stream_pxlen, buffer.data)
                 #---------------------
 
                 #copy it to pixelseries
-                pixelseries.data[buffer_start_px:buffer_last_px+1,:,:] = parsed_stream
+                pixelseries.data[buffer_start_px:buffer_last_px+1,:,:] = bufferops.binspectra(parsed_stream, \
+                        pixelseries.chanwindow[0], pixelseries.chanwindow[1], pixelseries.rebin)
 
                 #read in final pixel manually to update buffer if needed
                 #   (will have already been read if stream has pixel perfect end)
@@ -187,7 +527,11 @@ def parse(xfmap, pixelseries, multiload):
                     pxlength=pixelseries.pxlen[buffer_break_px,det]
 
                     #read spectrum and update buffer if needed
-                    buffer, pixelseries.data[buffer_break_px,det,:] = readspectrum(buffer,det,absidx,pxlength,pxheaderlen,bytesperchan,nchannels)
+                    buffer, counts = readspectrum(buffer,det,absidx,pxlength,pxheaderlen,bytesperchan,nchannels)
+                    pixelseries.data[buffer_break_px,det,:] = bufferops.binspectra(counts, \
+                            pixelseries.chanwindow[0], pixelseries.chanwindow[1], pixelseries.rebin)
+
+                instrument.progress(buffer_break_px+1, indexlist.shape[0])
 
                 #check that buffer has changed
                 if buffer_start == buffer.fidx:
@@ -230,7 +574,7 @@ def writemap(config, xfmap, pixelseries, xcoords, ycoords, modify_dt, multiload)
     print("WRITING NEW .GeoPIXE FILE")
     try:
         xfmap.resetfile()
-        buffer = bufferops.MapBuffer(xfmap.infile, xfmap.chunksize, multiload)
+        buffer = xfmap.getbuffer(multiload)
         idx = xfmap.datastart
         pxheaderlen = xfmap.PXHEADERLEN
 
@@ -265,4 +609,85 @@ def writemap(config, xfmap, pixelseries, xcoords, ycoords, modify_dt, multiload)
         buffer.wait()
         xfmap.resetfile()
         return 
-    
\ No newline at end of file
+    
+
+
+def writemap_bulk(config, xfmap, pixelseries, xcoords, ycoords, modify_dt):
+    """
+    Write a map or submap, as per writemap, from the index
+
+        selects the records within the coordinates
+        builds all new pixel headers at once
+        then writes contiguous runs of records in as few operations as possible:
+            runs with unchanged headers are copied in-kernel via bufferops.copyrange
+            otherwise runs are copied from the memory-mapped file and the new headers patched in
+    """
+    print("--------------")
+    print("WRITING NEW .GeoPIXE FILE")
+
+    pxheaderlen = xfmap.PXHEADERLEN
+
+    #indexed records only, pixelseries is padded to the end of the last row on a truncated map
+    nrecords = xfmap.npx_found*xfmap.ndet
+
+    xidx = pixelseries.xidx.ravel()[:nrecords]
+    yidx = pixelseries.yidx.ravel()[:nrecords]
+
+    #records within submap, as per utils.pxinsubmap
+    selected = np.flatnonzero( (xidx >= xcoords[0]) & (xidx < xcoords[1]) \
+        & (yidx >= ycoords[0]) & (yidx < ycoords[1]) )
+
+    offsets = xfmap.indexlist.ravel()[selected]
+    pxlen = pixelseries.pxlen.ravel()[selected]
+
+    if modify_dt > 100:
+        dt = pixelseries.dt.ravel()[selected]
+    else:
+        dt = pixelseries.dtmod.ravel()[selected]
+
+    #new headers, with x/y coords adjusted
+    headers = bufferops.packpxheaders(config, pxlen, xidx[selected]-xcoords[0], \
+        yidx[selected]-ycoords[0], pixelseries.det.ravel()[selected], dt)
+
+    #write file header
+    bufferops.writefileheader(xfmap, xcoords, ycoords)
+
+    #remaining writes go directly to file descriptor
+    xfmap.outfile.flush()
+    infd = xfmap.infile.fileno()
+    outfd = xfmap.outfile.fileno()
+
+    xfmap.resetfile()
+    buffer = bufferops.MmapBuffer(xfmap.infile, xfmap.chunksize, False)
+    raw = np.frombuffer(buffer.data, dtype=np.uint8)
+    step = np.arange(pxheaderlen, dtype=np.uint64)
+
+    ncopied = 0
+    for first, last, start, end in byteruns(offsets, offsets+pxlen, xfmap.chunksize):
+
+        original = bufferops.readpxheaders(buffer.data, offsets[first:last], pxheaderlen)
+
+        if not ( np.array_equal(original['xidx'], xidx[selected[first:last]]) \
+                and np.array_equal(original['yidx'], yidx[selected[first:last]]) \
+                and np.array_equal(original['det'], headers['det'][first:last]) ):
+            raise ValueError(f"values read from pixel header do not match result from indexing")
+
+        if original.tobytes() == headers[first:last].tobytes():
+            bufferops.copyrange(infd, outfd, start, end-start)
+            ncopied += last-first
+        else:
+            run = raw[start:end].copy()
+            run[(offsets[first:last]-np.uint64(start))[:,None]+step] = \
+                headers[first:last].view(np.uint8).reshape(-1, pxheaderlen)
+
+            view = memoryview(run)
+            while len(view) > 0:
+                view = view[os.write(outfd, view):]
+
+    #resync file object with descriptor
+    xfmap.outfile.seek(0, os.SEEK_END)
+    xfmap.resetfile()
+
+    print(f"Wrote {len(selected)} records, {ncopied} copied unchanged")
+
+    return pixelseries
@@ -1,16 +1,19 @@
 
+import os
 import time
 import numpy as np
 
-
-import parsercore
-
 import xfmkit.bufferops as bufferops
 import xfmkit.utils as utils
 import xfmkit.structures as structures
+import xfmkit.instrument as instrument
 
 from ._parse import *
 from ._utils import *
+from ._cache import *
+from ._stream import *
+from ._follow import *
+from ._scan import *
 
 import logging
 logger = logging.getLogger(__name__)
@@ -18,33 +21,100 @@ logger = logging.getLogger(__name__)
 class MapDone(Exception): pass
 
 
-def read(config, args, dirs):
+def read(config, args, dirs, onrows=None):
     """
     Parse full file, creating map and extracted data objects
+
+    with args.follow, onrows(pixelseries, xfmap) is called as each set of new rows is parsed
+
+    each stage is timed and counted against the active run, see instrument
     """
     #start a timer
     starttime = time.time() 
     
     try:
         #initialise map object
-        xfmap = structures.Xfmap(config, dirs.fi, dirs.fsub, args.write_modified, args.chunk_size, args.multiload)
+        with instrument.stage("header") as stage:
+            xfmap = structures.Xfmap(config, dirs.fi, dirs.fsub, args.write_modified, args.chunk_size, args.multiload, args.memory_map)
+            stage.add(xfmap.datastart)
 
-        #initialise the spectrum-by-pixel object
-        pixelseries = structures.PixelSeries(config, xfmap, xfmap.npx, xfmap.detarray, (not args.index_only))
-
-        pixelseries, xfmap = indexmap(xfmap, pixelseries, args.multiload)
+        #out-of-core data is parsed straight into the export file
+        datafile = os.path.join(dirs.exports, config['export_filename'] + ".npy") if args.out_of_core else None
 
-        if not args.index_only:
-            pixelseries = parse(xfmap, pixelseries, args.multiload)
-            pixelseries = pixelseries.get_derived()    #calculate additional derived properties after parse
+        #initialise the spectrum-by-pixel object
+        #   with a region of interest, this holds the full index only, see selectroi
+        pixelseries = structures.PixelSeries(config, xfmap, xfmap.npx, xfmap.detarray, (not args.index_only and not args.roi), \
+            args.sparse, args.stream, args.reduced, args.channel_window, args.rebin, datafile)
+
+        if args.follow:
+            #index and parse together, as rows are written
+            #   the file is still changing, so the index is not cached
+            with instrument.stage("parse") as stage:
+                pixelseries, xfmap = followmap(xfmap, pixelseries, args.python_only, args.follow_interval, args.follow_timeout, onrows)
+                stage.add(np.sum(pixelseries.pxlen, dtype=np.uint64), pixelseries.pxlen.size, pixelseries.npx)
+
+        else:
+            with instrument.stage("index") as stage:
+                #reuse index from previous run if still valid
+                #   validation always re-scans the file
+                use_cache = config['INDEX_CACHE'] and not args.force and not args.validate
+                cached = False
+                repaired = False
+
+                if use_cache:
+                    pixelseries, xfmap, cached = loadindex(xfmap, pixelseries, dirs.fi)
+
+                if not cached:
+                    if args.validate:
+                        pixelseries, xfmap, report = scanmap(xfmap, pixelseries)
+                        exportreport(report, dirs.exports)
+                        repaired = report['repaired']
+                    elif args.stream_index:
+                        pixelseries, xfmap = indexmap(xfmap, pixelseries, args.multiload)
+                    else:
+                        pixelseries, xfmap = indexmap_vector(xfmap, pixelseries)
+
+                    #a repaired index does not describe the file as written, so is not cached
+                    if config['INDEX_CACHE'] and not repaired:
+                        saveindex(xfmap, pixelseries, dirs.fi)
+
+                stage.add(np.sum(pixelseries.pxlen, dtype=np.uint64), pixelseries.pxlen.size, pixelseries.npx)
+
+            if args.roi:
+                pixelseries, xfmap = selectroi(config, xfmap, pixelseries, args.x_coords, args.y_coords, (not args.index_only))
+
+            if not args.index_only and args.stream:
+                #derived properties only, spectra are decoded batch by batch and discarded
+                print("--------------")
+                print("STREAMING PIXEL DATA")
+                with instrument.stage("parse") as stage:
+                    pixelseries = pixelseries.get_derived(iter_pixels(xfmap, pixelseries))
+                    pixelseries.parsed = True
+                    stage.add(np.sum(pixelseries.pxlen, dtype=np.uint64), pixelseries.pxlen.size, pixelseries.npx)
+
+            elif not args.index_only:
+                with instrument.stage("parse") as stage:
+                    pixelseries = parse(xfmap, pixelseries, args.multiload, args.python_only, args.jobs)
+                    stage.add(np.sum(pixelseries.pxlen, dtype=np.uint64), pixelseries.pxlen.size, pixelseries.npx)
+
+                with instrument.stage("derived") as stage:
+                    pixelseries = pixelseries.get_derived()    #calculate additional derived properties after parse
+                    stage.add(pixels=pixelseries.npx)
 
         #assign modified deadtimes
         if not args.modify_deadtimes > 100: #-1 = False
-            pixelseries = pixelseries.get_dtmod(config, xfmap, args.modify_deadtimes)
+            with instrument.stage("deadtime") as stage:
+                pixelseries = pixelseries.get_dtmod(config, xfmap, args.modify_deadtimes)
+                stage.add(pixels=pixelseries.npx)
 
         if args.write_modified:
-            writemap(config, xfmap, pixelseries, args.x_coords, args.y_coords, \
-                args.modify_deadtimes, args.multiload)
+            with instrument.stage("write") as stage:
+                if args.stream_index:
+                    writemap(config, xfmap, pixelseries, args.x_coords, args.y_coords, \
+                        args.modify_deadtimes, args.multiload)
+                else:
+                    writemap_bulk(config, xfmap, pixelseries, args.x_coords, args.y_coords, args.modify_deadtimes)
+                stage.add(xfmap.outfile.tell())
 
     finally:
         xfmap.closefiles()
@@ -66,9 +136,11 @@ def read(config, args, dirs):
 
         #export the pixel header stats and data
 
-        pixelseries.exportpxstats(config, dirs.exports)
+        with instrument.stage("export") as stage:
+            pixelseries.exportpxstats(config, dirs.exports)
 
-        if args.export_data:
-            pixelseries.exportpxdata(config, dirs.exports)    
+            if args.export_data:
+                pixelseries.exportpxdata(config, dirs.exports, args.export_tiled)    
+            stage.add(pixels=pixelseries.npx)
 
     return xfmap, pixelseries
\ No newline at end of file
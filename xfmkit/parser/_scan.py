@@ -0,0 +1,166 @@
+import os
+import json
+import numpy as np
+
+import xfmkit.bufferops as bufferops
+
+import logging
+logger = logging.getLogger(__name__)
+
+REPORT_NAME = "integrity_report.json"
+REPORT_MAX_LISTED = 1000     #missing records listed individually in the report, beyond this counted only
+
+
+def scanmap(xfmap, pixelseries):
+    """
+    index the file while validating every record, repairing the index around corrupt regions
+    - hop over record lengths, checking the flag and length of each record
+    - on a bad record, search forward for the next plausible "DP" header and continue
+    - decode all pixel headers at once, and check coordinates and detectors against raster order
+    - place each valid record by its coordinates,
+        any record lost to corruption is indexed as an empty record, ie. a zero spectrum
+
+    equivalent to indexmap_vector() for an intact file
+
+    returns pixelseries, xfmap and a report of the scan
+    """
+    print("--------------")
+    print("INDEXING WITH VALIDATION")
+
+    xfmap.resetfile()
+    buffer = bufferops.MmapBuffer(xfmap.infile, xfmap.chunksize, False)
+    pxheaderlen = xfmap.PXHEADERLEN
+    bytesperchan = xfmap.BYTESPERCHAN
+    ndet = xfmap.ndet
+    xres = xfmap.xres
+    end = buffer.len
+
+    maxrecords = xfmap.npx*ndet
+
+    #walk the records, resynchronising past any that fail
+    runs = []
+    corrupt = []
+    nfound = 0
+    idx = xfmap.datastart
+
+    while True:
+        offsets, idx = bufferops.hopvalid(buffer.data, idx, end, maxrecords-nfound, pxheaderlen, bytesperchan)
+        runs.append(offsets)
+        nfound += len(offsets)
+
+        if nfound >= maxrecords or idx+pxheaderlen > end:
+            break
+
+        #record with valid flag and length running past EOF is an early end, not corruption
+        if buffer.data[idx:idx+2] == b'DP' and idx + bufferops.pxlenstruct.unpack_from(buffer.data, idx+2)[0] > end:
+            break
+
+        following = bufferops.resync(buffer.mmap, idx, end, pxheaderlen, bytesperchan, ndet, xres, xfmap.yres)
+        print(f"WARNING: corrupt record at byte {idx}, resynchronised at byte {following}")
+        corrupt.append({ "start": int(idx), "end": int(following), "bytes": int(following-idx) })
+
+        if following >= end:
+            break
+
+        idx = following
+
+    offsets = np.concatenate(runs)
+
+    if len(offsets) == 0:
+        raise ValueError("FATAL: no valid pixel records found")
+
+    headers = bufferops.readpxheaders(buffer.data, offsets, pxheaderlen)
+
+    #position of each record in the map, from its header
+    xidx = headers['xidx'].astype(np.int64)
+    yidx = headers['yidx'].astype(np.int64)
+    det = headers['det'].astype(np.int64)
+
+    inbounds = ( xidx < xres ) & ( yidx < xfmap.yres ) & ( det < ndet )
+    key = np.where(inbounds, ( yidx*xres + xidx )*ndet + det, -1)
+
+    #records must strictly follow raster order, pixel by pixel and detector by detector
+    previous = np.concatenate(( [-1], np.maximum.accumulate(key)[:-1] ))
+    inorder = key > previous
+    keep = inbounds & inorder
+
+    keys = key[keep]
+    kept = offsets[keep]
+    kept_headers = headers[keep]
+
+    if len(keys) == 0:
+        raise ValueError("FATAL: no pixel records in raster order")
+
+    #whole rows up to the last valid record
+    nrows = int(keys[-1] // ndet // xres) + 1
+    npx = nrows*xres
+
+    present = np.zeros(npx*ndet, dtype=bool)
+    present[keys] = True
+    missing = np.flatnonzero(~present)
+
+    #complete header and index arrays
+    #   a missing record is given an empty payload at the start of the next valid record
+    #   or at the end of the final record, so that windows remain in file order
+    full_headers = np.empty(npx*ndet, dtype=bufferops.pxheaddtype)
+    full_offsets = np.empty(npx*ndet, dtype=np.uint64)
+
+    full_headers[keys] = kept_headers
+    full_offsets[keys] = kept
+
+    if len(missing) > 0:
+        lastend = int(kept[-1]) + int(kept_headers['pxlen'][-1])
+        following = np.searchsorted(keys, missing)
+        placeholder = np.where(following < len(keys), kept[np.minimum(following, len(keys)-1)], np.uint64(lastend-pxheaderlen))
+
+        full_offsets[missing] = placeholder
+        full_headers['pxflag'][missing] = b'DP'
+        full_headers['pxlen'][missing] = pxheaderlen
+        full_headers['xidx'][missing] = ( missing // ndet ) % xres
+        full_headers['yidx'][missing] = ( missing // ndet ) // xres
+        full_headers['det'][missing] = missing % ndet
+        full_headers['dt'][missing] = 0
+
+    pixelseries = pixelseries.receiveheaders(0, full_headers.reshape(npx, ndet))
+    indexlist = full_offsets.reshape(npx, ndet)
+
+    if npx == xfmap.npx:
+        print(f"END OF MAP: row {nrows-1}/{xfmap.yres}, pixel {npx-1}")
+    else:
+        print(f"\n WARNING: map ends at row {nrows}/{xfmap.yres} - map dimensions may be incorrect in file header.")
+        print("Resizing dataset to match size of indexed map")
+        pixelseries.truncate_y(npx, nrows)
+
+    xfmap.indexlist = indexlist
+    xfmap.npx_found = npx
+
+    report = {
+        "file": xfmap.infile.name,
+        "bytes": int(end),
+        "records_expected": int(maxrecords),
+        "records_found": int(len(offsets)),
+        "records_valid": int(len(keys)),
+        "records_out_of_bounds": int(np.count_nonzero(~inbounds)),
+        "records_out_of_order": int(np.count_nonzero(inbounds & ~inorder)),
+        "records_missing": int(len(missing)),
+        "corrupt_regions": corrupt,
+        "missing": [ { "x": int((i // ndet) % xres), "y": int((i // ndet) // xres), "det": int(i % ndet) } \
+                        for i in missing[:REPORT_MAX_LISTED] ],
+        "rows": int(nrows),
+        "pixels": int(npx),
+        "repaired": bool(len(corrupt) > 0 or len(missing) > 0 or len(keys) < len(offsets)),
+    }
+
+    print(f"records valid: {report['records_valid']}/{report['records_found']}, "
+        f"missing: {report['records_missing']}, corrupt regions: {len(corrupt)}")
+
+    xfmap.resetfile()
+    return pixelseries, xfmap, report
+
+
+def exportreport(report, dir):
+    """
+    write the scan report to json
+    """
+    with open(os.path.join(dir, REPORT_NAME), "w") as f:
+        json.dump(report, f, indent=2)
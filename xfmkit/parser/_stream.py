@@ -0,0 +1,48 @@
+import numpy as np
+
+import xfmkit.bufferops as bufferops
+import xfmkit.structures as structures
+import xfmkit.instrument as instrument
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def iter_pixels(xfmap, pixelseries, batch: int=None):
+    """
+    decode the indexed map as a series of pixel batches
+        without holding the whole spectrum-by-pixel dataset
+
+    opens and memory-maps the file separately, so may be used after read() has closed it
+        each batch is decoded via NumPy into a new array, which may be kept or discarded
+
+    batch sets pixels per batch
+        if None, sized so that each decoded batch fits within the xfmap chunk size
+
+    yields PixelBatch
+    """
+    indexlist = xfmap.indexlist
+    pxlen = pixelseries.pxlen
+    npx = indexlist.shape[0]
+    ndet = pixelseries.ndet
+    nchan = pixelseries.nchan
+
+    if batch is None:
+        batch = max(xfmap.chunksize // (ndet*nchan*pixelseries.dtype.itemsize), 1)
+    elif batch < 1:
+        raise ValueError("pixel batch size must be >= 1")
+
+    with open(xfmap.infile.name, mode='rb') as infile:
+        buffer = bufferops.MmapBuffer(infile, xfmap.chunksize, False)
+
+        for first in range(0, npx, batch):
+            last = min(first+batch, npx)
+
+            data = np.zeros((last-first, ndet, nchan), dtype=pixelseries.dtype)
+
+            bufferops.readpxspectra(buffer.data, indexlist[first:last].ravel(), pxlen[first:last].ravel(), \
+                    xfmap.PXHEADERLEN, xfmap.BYTESPERCHAN, data.reshape(-1, nchan), pixelseries.chanwindow, pixelseries.rebin)
+
+            instrument.progress(last, npx)
+
+            yield structures.PixelBatch(pixelseries, first, last, data)
@@ -5,6 +5,7 @@ import numpy as np
 import xfmkit.bufferops as bufferops
 import xfmkit.utils as utils
 import xfmkit.structures as structures
+import xfmkit.instrument as instrument
 
 class MapDone(Exception): pass
 
@@ -26,7 +27,7 @@ def endpx(pxidx, idx, buffer, xfmap, pixelseries):
     #print pixel index at end of every row
     if pxidx % xfmap.xres == (xfmap.xres-1): 
         print(f"\rRow {row}/{xfmap.yres-1} at pixel {pxidx}, byte {int(buffer.fidx+idx)} ({100*(idx)/xfmap.fullsize:.1f} %)", end='')
-        pass
+        instrument.progress(pxidx+1, xfmap.npx)
     #stop when pixel index greater than expected no. pixels
     if (pxidx >= (xfmap.npx-1)):
         print(f"\nEND OF MAP: row {row}/{xfmap.yres}, pixel {pxidx}")
@@ -37,6 +38,57 @@ def endpx(pxidx, idx, buffer, xfmap, pixelseries):
     return pxidx
 
 
+def byteruns(starts, ends, windowsize: int):
+    """
+    split a series of records into contiguous runs of approx. windowsize bytes
+        runs always begin and end on a record boundary
+        a run always holds at least one record
+        runs also break wherever records are not adjacent in the file, eg. across ROI rows
+
+    takes start and end byte of each record, in file order
+
+    returns list of (first record, last record+1, start byte, end byte)
+    """
+    nrecords = len(starts)
+
+    #records which do not follow on from the previous record
+    gaps = np.flatnonzero(starts[1:] != ends[:-1]) + 1
+
+    runs = []
+    first = 0
+    while first < nrecords:
+        #first record starting beyond the window
+        last = int(np.searchsorted(starts, int(starts[first])+windowsize, side='left'))
+
+        #or the next gap, if sooner
+        nextgap = np.searchsorted(gaps, first, side='right')
+        if nextgap < len(gaps):
+            last = min(last, int(gaps[nextgap]))
+
+        last = min(max(last, first+1), nrecords)
+
+        runs.append((first, last, int(starts[first]), int(ends[last-1])))
+        first = last
+
+    return runs
+
+
+def pixelwindows(indexlist, pxlen, windowsize: int):
+    """
+    split indexed pixels into contiguous windows of approx. windowsize bytes
+        as per byteruns, with all detector records for a pixel kept together
+
+    pxlen may extend beyond indexlist, eg. padded to a whole row by truncate_y
+        only the indexed pixels are windowed
+
+    returns list of (first pixel, last pixel+1, start byte, end byte)
+    """
+    pxstarts = indexlist[:,0]
+    pxends = indexlist[:,-1] + pxlen[:indexlist.shape[0],-1]
+
+    return byteruns(pxstarts, pxends, windowsize)
+
+
 def readspectrum(buffer,det,absidx,pxlength,pxheaderlen,bytesperchan,nchannels):
 #def processpixel(buffer,det,pxidx,indexlist,pxheaderlen,bytesperchan,nchannels):
 
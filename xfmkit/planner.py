@@ -0,0 +1,365 @@
+import os
+import numpy as np
+import psutil
+
+from tabulate import tabulate
+
+import xfmkit.bufferops as bufferops
+import xfmkit.config as configuration
+
+try:
+    import parsercore
+except ImportError:
+    parsercore = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+"""
+Plans memory for a parse before any work is done
+
+- reads map dimensions, detectors and file size from the header
+- estimates memory held and peak for each stage, for the requested flags
+- where no strategy is requested, selects the first that fits within the memory limit:
+    dense > out-of-core > sparse > reduced > rebinned > streaming
+- otherwise, or if none fit, fails before parsing with a report of the estimates
+"""
+#-----------------------------------
+#vars
+#-----------------------------------
+BASELINE_MEMORY=512     #(Mb) interpreter and imported packages
+
+STRATEGIES = [ "dense", "outofcore", "sparse", "reduced", "rebinned", "stream" ]
+REBIN_FACTORS = [ 2, 4, 8, 16 ]
+
+#UMAP neighbour graph, per pixel per neighbour
+#   knn indices and distances, then the symmetrised fuzzy graph, see clustering.reducers()
+UMAP_NEIGHBOURS = 30
+UMAP_BYTES_PER_NEIGHBOUR = 64
+
+#NumPy decode temporaries, per channel/count pair in a block
+#   gathered pair indexes, record index, masks and fancy-index copies, see bufferops.readpxspectra
+DECODE_BYTES_PER_PAIR = 32
+
+
+def readheader(config, args):
+    """
+    read the properties of a map needed to plan memory, without reading any pixel data
+
+    returns dict of map properties
+    """
+    with open(args.input_file, mode='rb') as infile:
+        headerdict, datastart, detarray = bufferops.probeheader(infile, config['PXHEADERLEN'])
+
+    header = headerdict['File Header']
+
+    xres = int(header['Xres'])
+    yres = int(header['Yres'])
+
+    return {
+        "xres": xres,
+        "yres": yres,
+        "npx": xres*yres,
+        "ndet": int(max(detarray)+1),
+        "gain": float(header['Gain (eV)'])/1000,
+        "datastart": datastart,
+        "fullsize": os.path.getsize(args.input_file),
+    }
+
+
+def nchannels(config, args, gain: float, rebin: int=None):
+    """
+    channels held per spectrum, after windowing and rebinning
+        as per PixelSeries
+    """
+    nchan = config['NCHAN']
+    rebin = args.rebin if rebin is None else rebin
+
+    if args.channel_window is None:
+        chanwindow = ( 0, nchan )
+    elif len(args.channel_window) == 0:
+        chanwindow = ( int(np.ceil(config['MIN_E']/gain)), min(int(config['MAX_E']/gain)+1, nchan) )
+    else:
+        chanwindow = args.channel_window
+
+    return -(-(chanwindow[1]-chanwindow[0]) // rebin)
+
+
+def strategyof(args):
+    """
+    strategy given by the parse flags
+    """
+    if args.stream:
+        return "stream"
+    elif args.reduced:
+        return "reduced"
+    elif args.sparse:
+        return "sparse"
+    elif args.out_of_core:
+        return "outofcore"
+    elif args.rebin > 1:
+        return "rebinned"
+    else:
+        return "dense"
+
+
+def compatible(args, strategy: str):
+    """
+    whether a strategy may be selected in place of dense for the given flags
+        as per argops.checkargs
+    """
+    if args.follow:
+        return strategy == "dense"
+    elif strategy == "outofcore":
+        return args.export_data
+    elif strategy == "reduced":
+        return not args.export_data
+    elif strategy == "stream":
+        return not ( args.export_data or args.classify_spectra )
+    else:
+        return True
+
+
+def decoding(config, args, strategy: str, npx_parse: int, ndet: int, nchan: int, itemsize: int, pxbytes: float, pairs: float):
+    """
+    estimate memory (in bytes) for the temporaries of decoding pixel data, beyond the arrays held
+
+    NumPy decodes a block of up to DECODE_PAIRS pairs at a time, see bufferops.iterpairs
+        sparse, reduced and streamed spectra are always decoded via NumPy
+    parsercore decodes a window of up to one chunk, see parser.parsewindow
+        the window is copied to bytes, and decoded to full dense spectra before windowing and rebinning
+    parallel workers each decode a window of chunk/jobs at once
+    """
+    workers = args.jobs if strategy in [ "dense", "outofcore", "rebinned" ] else 1
+    window = min(args.chunk_size/max(workers, 1), npx_parse*pxbytes)
+
+    if args.python_only or parsercore is None or strategy in [ "sparse", "reduced", "stream" ]:
+        block = min(bufferops.DECODE_PAIRS, window/config['BYTESPERCHAN'], pairs)
+        return workers*block*DECODE_BYTES_PER_PAIR
+
+    windowpx = window/max(pxbytes, 1)
+    transient = window + windowpx*ndet*config['NCHAN']*2
+
+    if nchan < config['NCHAN'] or itemsize > 2:
+        transient += windowpx*ndet*nchan*itemsize
+
+    return workers*transient
+
+
+def estimate(config, args, header, strategy: str=None, rebin: int=None):
+    """
+    estimate memory (in bytes) for each stage of read_raw
+
+    counts arrays held by PixelSeries and Xfmap, read buffers, and the largest temporaries
+        page cache for memory-mapped and out-of-core files is not counted
+
+    returns list of stages as [ name, held after stage, peak during stage ]
+    """
+    strategy = strategyof(args) if strategy is None else strategy
+
+    npx = header['npx']
+    ndet = header['ndet']
+    nchan = nchannels(config, args, header['gain'], rebin)
+    chunk = args.chunk_size
+
+    #bytes per count, widened if rebinned, see bufferops.spectrumdtype
+    itemsize = bufferops.spectrumdtype(args.rebin if rebin is None else rebin).itemsize
+
+    #pixels parsed, region of interest only
+    npx_parse = npx
+    if args.roi:
+        xspan = min(args.x_coords[1], header['xres']) - min(args.x_coords[0], header['xres'])
+        yspan = min(args.y_coords[1], header['yres']) - min(args.y_coords[0], header['yres'])
+        npx_parse = xspan*yspan
+
+    #channel/count pairs, from bytes remaining after pixel headers
+    pairs = max(header['fullsize'] - header['datastart'] - npx*ndet*config['PXHEADERLEN'], 0) / config['BYTESPERCHAN']
+    pairs = pairs*npx_parse/max(npx, 1)
+
+    buffer = 0 if args.memory_map else chunk*(2 if args.multiload else 1)
+
+    #mean bytes per pixel record, for decode windows
+    pxbytes = max(header['fullsize'] - header['datastart'], 1)/max(npx, 1)
+
+    stages = []
+    held = BASELINE_MEMORY*config['MBCONV']
+
+    #index, pixel headers and per-detector derived arrays
+    #   headers are decoded all at once, alongside the record offsets
+    held += npx*ndet*( 8 + 2*4 + 4 + 4 + 4 ) + npx*( 4*2 + 8*4 )
+    stages.append([ "index", held, held + npx*ndet*( 16 + 8 ) + buffer ])
+
+    if args.index_only:
+        return stages
+
+    #pixel data
+    if strategy == "stream" or strategy == "outofcore":
+        parsed = 0
+    elif strategy == "sparse":
+        parsed = pairs*( itemsize + 4 ) + npx_parse*ndet*8
+    elif strategy == "reduced":
+        parsed = npx_parse*nchan*4
+    else:
+        parsed = npx_parse*ndet*nchan*itemsize
+
+    held += parsed
+    stages.append([ "parse", held, held + buffer + decoding(config, args, strategy, npx_parse, ndet, nchan, itemsize, pxbytes, pairs) ])
+
+    #flattened spectra and sums
+    #   a streamed batch holds up to one chunk of decoded spectra
+    batch = chunk*( 1 + 2/ndet )
+
+    if strategy == "stream":
+        derived = 0
+        transient = batch + decoding(config, args, strategy, npx_parse, ndet, nchan, itemsize, pxbytes, pairs)
+    elif strategy == "sparse":
+        derived = pairs*( 4 + 4 ) + npx_parse*8
+        transient = 0
+    elif strategy == "reduced":
+        derived = 0
+        transient = 0
+    else:
+        derived = npx_parse*nchan*4
+        transient = 0
+
+    held += derived
+    stages.append([ "derive", held, held + transient ])
+
+    #colour map, spectra are mapped a block of pixels at a time, see rgbspectrum.spectorgb
+    if args.analyse:
+        transient = batch if strategy == "stream" else 0
+
+        stages.append([ "analyse", held, held + transient ])
+
+    #dimensionality reduction on flattened spectra, see clustering.multireduce
+    #   float64 copy for validation, and a second for centring
+    if args.classify_spectra:
+        #read here rather than on import, so planning without -c never touches the conf file
+        pixel_cutoff_pca_only=configuration.get('reducer', 'pixel_cutoff_pca_only')
+        umap_precomponents=configuration.get('reducer', 'umap_precomponents')
+
+        if strategy == "sparse":
+            transient = pairs*( 8 + 4 ) + npx_parse*umap_precomponents*8*4
+        else:
+            transient = npx_parse*nchan*8*2
+
+        if npx_parse < pixel_cutoff_pca_only:
+            transient += npx_parse*UMAP_NEIGHBOURS*UMAP_BYTES_PER_NEIGHBOUR
+
+        stages.append([ "classify", held, held + transient ])
+
+    return stages
+
+
+def peak(stages):
+    """
+    peak memory (in bytes) across stages
+    """
+    return max(stage[2] for stage in stages)
+
+
+def memorylimit(config, args):
+    """
+    memory (in bytes) available to a parse
+        --memory-limit if given, otherwise MEMORY_FRACTION of available system memory
+    """
+    if args.memory_limit is not None:
+        return args.memory_limit*config['MBCONV']
+
+    vmem=psutil.virtual_memory()
+
+    return vmem.available*float(config['MEMORY_FRACTION'])
+
+
+def applystrategy(args, strategy: str, rebin: int=None):
+    """
+    set the parse flags for a strategy selected in place of dense
+    """
+    if strategy == "outofcore":
+        args.out_of_core = True
+    elif strategy == "sparse":
+        args.sparse = True
+    elif strategy == "reduced":
+        args.reduced = True
+    elif strategy == "rebinned":
+        args.rebin = rebin
+    elif strategy == "stream":
+        args.stream = True
+
+    if ( args.sparse or args.reduced ) and args.jobs > 1:
+        print(f"WARNING: {strategy} parse runs in a single process")
+        print("continuing with --jobs 1")
+        args.jobs = 1
+
+    return args
+
+
+def candidates(args):
+    """
+    strategies to try in order, as ( strategy, rebin factor )
+        only dense is tried when the user has chosen a strategy
+    """
+    if not strategyof(args) == "dense":
+        return [ ( strategyof(args), args.rebin ) ]
+
+    result = []
+
+    for strategy in STRATEGIES:
+        if not compatible(args, strategy):
+            continue
+        elif strategy == "rebinned":
+            result += [ ( strategy, factor ) for factor in REBIN_FACTORS ]
+        else:
+            result.append(( strategy, args.rebin ))
+
+    return result
+
+
+def report(config, rows, limit, headers):
+    """
+    print a table of estimates in Mb
+    """
+    mb = config['MBCONV']
+
+    print(tabulate([ [ row[0] ] + [ round(value/mb, 1) for value in row[1:] ] for row in rows ], \
+        headers=headers, tablefmt='psql'))
+    print(f"memory limit: {round(limit/mb, 1)} Mb")
+
+
+def plan(config, args):
+    """
+    estimate memory for the map and flags in args, and choose a parse strategy that fits
+
+    the first strategy that fits is applied to args
+        raises MemoryError if none fit
+
+    returns args
+    """
+    print("--------------")
+    print("MEMORY PLAN")
+
+    header = readheader(config, args)
+    limit = memorylimit(config, args)
+
+    tried = []
+
+    for strategy, rebin in candidates(args):
+        stages = estimate(config, args, header, strategy, rebin)
+
+        name = strategy if strategy != "rebinned" else f"rebinned x{rebin}"
+        tried.append([ name, peak(stages) ])
+
+        if peak(stages) <= limit:
+            report(config, stages, limit, [ "stage", "held (Mb)", "peak (Mb)" ])
+
+            if not strategy == strategyof(args):
+                print(f"WARNING: dense parse exceeds memory limit, continuing with {name}")
+                args = applystrategy(args, strategy, rebin)
+
+            print(f"strategy: {name}")
+            return args
+
+    report(config, tried, limit, [ "strategy", "peak (Mb)" ])
+
+    raise MemoryError(f"estimated peak memory exceeds {round(limit/config['MBCONV'])} Mb for {', '.join(row[0] for row in tried)}" \
+        " - reduce the map with eg. --roi or --channel-window, raise --memory-limit, or skip planning with --no-plan")
@@ -1,7 +1,7 @@
 import os
+import sys
 import re
 import numpy as np
-import periodictable as pt
 from PIL import Image
 from math import sqrt
 
@@ -23,11 +23,20 @@ light_lines=config.get('elements', 'light_lines')
 
 BASEFACTOR=1/10000 #ppm to wt%
 
+this = sys.modules[__name__]
+
+this.possible_lines = None  #built on first use, see get_possible_lines
+
 def get_possible_lines():
     """
     #use the periodic table and known z-cutoffs to get possible lines
+        built once, on first use
     """
-    
+    if this.possible_lines is not None:
+        return this.possible_lines
+
+    import periodictable as pt
+
     possible_lines = []
 
     for ptelement in pt.elements:
@@ -41,6 +50,8 @@ def get_possible_lines():
 
     for line in non_element_lines:
         possible_lines.append(line)
+
+    this.possible_lines = possible_lines
     
     return possible_lines
 
@@ -50,7 +61,7 @@ def check_expected_lines(lines):
     checks that a list of line strings are all expected elements/lines
     """
     for line in lines:
-        if not line in possible_lines:
+        if not line in get_possible_lines():
             raise ValueError(f"Unexpected line {line}, exiting")
 
     return True
@@ -76,7 +87,7 @@ def get_elements(files):
                 pass
             elif found in ignore_lines:
                 pass
-            elif found in possible_lines:
+            elif found in get_possible_lines():
                 elements.append(found)
                 keepfiles.append(fname)
             else:
@@ -307,8 +318,3 @@ def compile(image_directory):
     print(f"Final shape: {ds.data.shape}")
 
     return ds
-
-
-#module local variables
-
-possible_lines = get_possible_lines()
\ No newline at end of file
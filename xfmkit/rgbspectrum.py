@@ -11,6 +11,8 @@ logger = logging.getLogger(__name__)
 #-----------------------------------
 #MODIFIABLE CONSTANTS
 #-----------------------------------
+LO_CHANNEL = 100     #(raw channel) start of the colour range, ends at the elastic peak
+RGB_BLOCK = 8388608  #(bytes) float64 copy of each block of spectra mapped at once
 
 #-----------------------------------
 #INITIALISE
@@ -56,16 +58,17 @@ custom_colour_dict = \
 #FUNCTIONS
 #-----------------------------------
 
-def initialise(config, energy):
+def initialise(config, energy, gain: float):
     """
     initialise the colourmap
 
-    receives energy channel list
+    receives energy channel list, and the gain of raw channels
+        channels are found by energy, so windowed or rebinned spectra map as the full spectrum
     returns red, green, blue arrays
     """
     
-    chan_lo=100
-    chan_hi=np.where(energy==config['ELASTIC'])[0][0]
+    chan_lo=int(np.argmin(np.abs(energy - LO_CHANNEL*gain)))
+    chan_hi=int(np.argmin(np.abs(energy - config['ELASTIC'])))
 
     cmap = matplotlib.colors.LinearSegmentedColormap('hsv_white', segmentdata=custom_colour_dict, N=chan_hi)
 
@@ -88,14 +91,29 @@ def spectorgb(energy, spectrum, red, green, blue):
     """
     maps spectrum onto R G B channels 
     use RGBA colourmap to generate
+
+    accepts a single spectrum, or a dense or sparse array of spectra by pixel
+        arrays are mapped a block of pixels at a time, so the float64 copy is bounded by RGB_BLOCK
     """
+    colours = np.stack((red, green, blue), axis=-1)
+
+    #multiply y vectorwise onto channels
+    if spectrum.ndim == 1:
+        rgb = spectrum @ colours
+    else:
+        rows = max(RGB_BLOCK // (8*spectrum.shape[-1]), 1)
+        rgb = np.empty((spectrum.shape[0], 3))
+
+        for first in range(0, spectrum.shape[0], rows):
+            rgb[first:first+rows] = spectrum[first:first+rows] @ colours
 
-    #multiply y vectorwise onto channels (t/px: 0.004051 s)
-    rsum=np.sum(spectrum*(red))/len(energy)
-    gsum=np.sum(spectrum*(green))/len(energy)
-    bsum=np.sum(spectrum*(blue))/len(energy)
+    rgb = rgb/len(energy)
 
-    ysum=np.sum(spectrum)
+    rsum=rgb[...,0]
+    gsum=rgb[...,1]
+    bsum=rgb[...,2]
+
+    ysum=np.asarray(spectrum.sum(axis=-1)).reshape(np.shape(rsum))
     
 #    max=np.max([rsum,bsum,gsum])
 
@@ -175,26 +193,37 @@ def export_show(rgbimg, rvals, gvals, bvals, dirs):
     plt.savefig(os.path.join(dirs.plots, 'colours.png'), dpi=150)
 
 
-def calccolours(config, pixelseries, xfmap, dataset, dirs):
+def calccolours(config, pixelseries, xfmap, dataset, dirs, batches=None):
+    """
+    map each pixel spectrum onto RGB, compile and export the colour image
+
+    dataset is spectrum-by-pixel, dense or sparse
+        if batches of PixelBatch are given instead, these are consumed one at a time
+    """
     try:
-        red, green, blue = initialise(config, pixelseries.energy)
+        red, green, blue = initialise(config, pixelseries.energy, xfmap.gain)
         
-        rvals=np.zeros(pixelseries.npx)
-        gvals=np.zeros(pixelseries.npx)
-        bvals=np.zeros(pixelseries.npx)
-        totalcounts=np.zeros(pixelseries.npx)
-
-        for i in np.arange(pixelseries.npx):
-            counts=dataset[i,:]
-            rvals[i], bvals[i], gvals[i], totalcounts[i] = spectorgb(pixelseries.energy, counts, red, green, blue)
-
-        rgbimg, rvals, gvals, bvals = compile(rvals, gvals, bvals, xfmap.xres, pixelseries.nrows)
+        #order of outputs as per original per-pixel loop
+        if batches is not None:
+            rvals=np.zeros(pixelseries.npx)
+            gvals=np.zeros(pixelseries.npx)
+            bvals=np.zeros(pixelseries.npx)
+            totalcounts=np.zeros(pixelseries.npx)
+
+            for batch in batches:
+                flattened = np.sum(batch.data, axis=1, dtype=np.uint32)
+                rvals[batch.first:batch.last], bvals[batch.first:batch.last], gvals[batch.first:batch.last], \
+                    totalcounts[batch.first:batch.last] = spectorgb(pixelseries.energy, flattened, red, green, blue)
+        else:
+            rvals, bvals, gvals, totalcounts = spectorgb(pixelseries.energy, dataset, red, green, blue)
+
+        rgbimg, rvals, gvals, bvals = compile(rvals, gvals, bvals, pixelseries.dimensions[1], pixelseries.nrows)
 
         export_show(rgbimg, rvals, gvals, bvals, dirs)
 
         return rgbimg, rvals, gvals, bvals
 
-    except:
-        print('WARNING: could not complete RGB plot')
+    except Exception as e:
+        print(f'WARNING: could not complete RGB plot, {e}')
         return None, None, None, None
         
\ No newline at end of file
@@ -4,7 +4,6 @@ import re
 import copy
 import pickle
 import numpy as np
-from minisom import MiniSom
 
 import numpy as np
 
@@ -27,6 +26,7 @@ neighbourhood = triangle, sigma=1
 """
 
 def som_on_palette(cc_palette):
+    from minisom import MiniSom
 
     coloursom = MiniSom(m, n, len(cc_palette[0]), sigma=1.0,
                 learning_rate=0.2, neighborhood_function='gaussian')
@@ -49,6 +49,8 @@ def som_on_palette(cc_palette):
 
 
 def categories_by_som(data):
+    from minisom import MiniSom
+
 # SOM initialization and training
     print('training...')
     som = MiniSom(m, n, data.shape[1], sigma=0.5,
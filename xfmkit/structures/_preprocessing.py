@@ -1,5 +1,4 @@
 import numpy as np
-import pandas as pd
 
 import xfmkit.structures as structures
 import xfmkit.utils as utils
@@ -33,6 +32,7 @@ def mean_highest_lines(max_set, elements, n_to_avg=N_TO_AVG):
 
     excluding light, bad and non-element lines
     """
+    import pandas as pd
 
     df = pd.DataFrame(columns=elements)
     df.loc[0]=max_set
@@ -1,6 +1,5 @@
 import os
 import numpy as np
-from scipy import ndimage
 
 import xfmkit.bufferops as bufferops
 import xfmkit.dtops as dtops
@@ -191,6 +190,8 @@ class DataSeries:
         """
         scale maps in 2D based on zoom factor
         """
+        from scipy import ndimage
+
         if order == None:   #if no order given, guess from zoom factor
             if zoom_factor < 1:    
                 order = 1   #bicubic for downsampling
@@ -1,11 +1,12 @@
 
 import os
 import numpy as np
-from scipy import ndimage
+from scipy import sparse
 
 import xfmkit.bufferops as bufferops
 import xfmkit.dtops as dtops
 import xfmkit.imgops as imgops
+import xfmkit.tilestore as tilestore
 import xfmkit.utils as utils
 import xfmkit.config as config
 
@@ -23,7 +24,7 @@ class Xfmap:
         methods to parse pixel header and body, manage memory via chunks
             bufferops.py module contains subsidiary code to parse binary
     """
-    def __init__(self, config, fi, fo, WRITE_MODIFIED: bool, CHUNK_SIZE: int, MULTILOAD: bool):
+    def __init__(self, config, fi, fo, WRITE_MODIFIED: bool, CHUNK_SIZE: int, MULTILOAD: bool, MEMMAP: bool=False):
 
         #assign input file object for reading
         try:
@@ -39,17 +40,17 @@ class Xfmap:
         #get total size of file to parse
         self.fullsize = os.path.getsize(fi)
         self.chunksize = CHUNK_SIZE
+        self.memmap = MEMMAP
 
         self.fidx=self.infile.tell()
 
         if self.fidx != 0:
             raise ValueError(f"File pointer at {self.fidx} - Expected 0 (start of file)")
 
-        #read the beginning of the file into buffer
-        buffer = bufferops.MapBuffer(self.infile, self.chunksize, MULTILOAD)
-
-        #read the JSON header and store position of first pixel
-        self.headerdict, self.datastart, buffer = bufferops.readjsonheader(buffer, 0)
+        #read the JSON header, position of first pixel and detector config
+        #   directly from the file, without loading a chunk
+        self.headerdict, self.datastart, self.detarray = bufferops.probeheader(self.infile, config['PXHEADERLEN'])
+        print(f"header length: {self.datastart-2} (bytes)")
         
         #try to assign values from header
         try:
@@ -81,15 +82,23 @@ class Xfmap:
         self.PXHEADERLEN=config['PXHEADERLEN'] 
         self.BYTESPERCHAN=config['BYTESPERCHAN'] 
 
-        self.detarray = bufferops.getdetectors(buffer, self.datastart, self.PXHEADERLEN)
         self.ndet = max(self.detarray)+1
 
         self.indexlist=np.empty((self.npx, self.ndet),dtype=np.uint64)
 
-        buffer.wait()
         self.resetfile()
         return
 
+    def getbuffer(self, multiload: bool):
+        """
+        load a buffer from the current file position
+            memory-maps the whole file if requested, otherwise reads the next chunk
+        """
+        if self.memmap:
+            return bufferops.MmapBuffer(self.infile, self.chunksize, multiload)
+        else:
+            return bufferops.MapBuffer(self.infile, self.chunksize, multiload)
+
     def resetfile(self):
         self.infile.seek(0)
 
@@ -101,7 +110,8 @@ class Xfmap:
 
 
 class PixelSeries:
-    def __init__(self, config, xfmap, npx, detarray, parsing: bool):
+    def __init__(self, config, xfmap, npx, detarray, parsing: bool, SPARSE: bool=False, STREAM: bool=False, REDUCED: bool=False, \
+            CHANWINDOW=None, REBIN: int=1, DATAFILE: str=None):
 
         #copied variables
         self.source=xfmap
@@ -111,9 +121,36 @@ class PixelSeries:
         #derived variables
         self.npx = npx
         self.parsing = parsing
+        self.sparse = SPARSE
+        self.stream = STREAM
+        self.reduced = REDUCED
+        self.datafile = DATAFILE
         self.nrows = xfmap.dimensions[0]
         self.nchan=config['NCHAN']
 
+        #channel window and rebinning applied while decoding
+        #   empty window = energy range of interest from config
+        if CHANWINDOW is None:
+            CHANWINDOW = ( 0, self.nchan )
+        elif len(CHANWINDOW) == 0:
+            CHANWINDOW = ( int(np.ceil(config['MIN_E']/xfmap.gain)), min(int(config['MAX_E']/xfmap.gain)+1, self.nchan) )
+
+        if not ( 0 <= CHANWINDOW[0] < CHANWINDOW[1] <= self.nchan ):
+            raise ValueError(f"channel window {CHANWINDOW} outside 0-{self.nchan}")
+        if REBIN < 1:
+            raise ValueError(f"channel rebin factor must be >= 1, got {REBIN}")
+
+        self.chanwindow = ( int(CHANWINDOW[0]), int(CHANWINDOW[1]) )
+        self.rebin = int(REBIN)
+
+        if not ( self.chanwindow == (0, self.nchan) and self.rebin == 1 ):
+            self.nchan = -(-(self.chanwindow[1]-self.chanwindow[0]) // self.rebin)
+            #energy at centre of each bin
+            self.energy = ( self.chanwindow[0] + self.rebin*np.arange(self.nchan) + (self.rebin-1)/2 )*xfmap.gain
+
+        #counts per channel, widened if rebinned
+        self.dtype = bufferops.spectrumdtype(self.rebin)
+
         #assign number of detectors
         self.detarray = detarray
         self.ndet=max(self.detarray)+1
@@ -147,8 +184,20 @@ class PixelSeries:
         self.corrected=np.zeros(10)
 
         #initialise whole data containers (WARNING: large)
-        if self.parsing:
-            self.data=np.zeros((npx,self.ndet,self.nchan),dtype=np.uint16)
+        #   sparse arrays are sized from the index, see init_sparse
+        #   streamed maps are never held whole, see parser.iter_pixels
+        #   reduced maps hold flattened and sums only, see parser.parse_reduced
+        #   out-of-core maps are decoded into a memory-mapped .npy at datafile
+        self.indptr=None
+        self.channels=None
+        self.counts=None
+
+        if self.parsing and (self.sparse or self.stream or self.reduced):
+            self.data=None
+        elif self.parsing and self.datafile is not None:
+            self.data=np.lib.format.open_memmap(self.datafile, mode='w+', dtype=self.dtype, shape=(npx,self.ndet,self.nchan))
+        elif self.parsing:
+            self.data=np.zeros((npx,self.ndet,self.nchan),dtype=self.dtype)
 #            if config['DOBG']: self.corrected=np.zeros((xfmap.npx,config['NCHAN']),dtype=np.uint16)
         else:
             self.data=np.zeros((1024,self.ndet,self.nchan),dtype=np.uint16)
@@ -163,6 +212,53 @@ class PixelSeries:
         
         return self
 
+    def receiveheaders(self, first, headers):
+        """
+        bulk equivalent of receiveheader
+            takes structured array of pixel headers, shape (npx, ndet)
+        """
+        last = first + headers.shape[0]
+
+        self.pxlen[first:last]=headers['pxlen']
+        self.xidx[first:last]=headers['xidx']
+        self.yidx[first:last]=headers['yidx']
+        self.det[first:last]=headers['det']
+        self.dt[first:last]=headers['dt']
+
+        return self
+
+    def init_sparse(self, pxheaderlen: int, bytesperchan: int):
+        """
+        allocate CSR arrays for the spectra, one row per record
+            row pointers are built from the record lengths in the index
+            rows are ordered pixel-major, detector-minor, as in the file
+
+        data becomes a sparse matrix of shape (npx*ndet, nchan) over these arrays
+        """
+        npairs = (np.maximum(self.pxlen.astype(np.int64)-pxheaderlen, 0)//bytesperchan).ravel()
+        total = int(np.sum(npairs))
+
+        #scipy requires matching index dtypes, int32 where it fits
+        if total < np.iinfo(np.int32).max:
+            idxtype = np.int32
+        else:
+            idxtype = np.int64
+
+        self.indptr=np.zeros(len(npairs)+1, dtype=idxtype)
+        np.cumsum(npairs, out=self.indptr[1:])
+        self.channels=np.zeros(total, dtype=idxtype)
+        self.counts=np.zeros(total, dtype=self.dtype)
+
+        self.data=sparse.csr_matrix((self.counts, self.channels, self.indptr), \
+                shape=(self.npx*self.ndet, self.nchan), copy=False)
+
+        #keep the arrays as held by the matrix, in case scipy recast them
+        self.indptr=self.data.indptr
+        self.channels=self.data.indices
+        self.counts=self.data.data
+
+        return self
+
     def truncate_y(self, npx, nrows):
 
         #find the end of the row
@@ -209,6 +305,46 @@ class PixelSeries:
         self.totalcounts=self.totalcounts[:new_npx]
 
 
+    def get_roi(self, config, xfmap, xcoords, ycoords, parsing: bool):
+        """
+        create a new PixelSeries holding only the pixels within a rectangular region
+            coordinates as [start, end), clipped to the indexed map, as per utils.pxinsubmap
+            on a truncated map, the partly indexed last row is kept only if the region within it was indexed
+            header arrays are copied across, data is allocated at the size of the region
+
+        returns the new PixelSeries, and the index of each of its pixels within this series
+        """
+        xres = self.dimensions[1]
+
+        xstart = max(int(xcoords[0]), 0)
+        xend = min(int(xcoords[1]), xres)
+        ystart = max(int(ycoords[0]), 0)
+        yend = min(int(ycoords[1]), self.nrows)
+
+        #rows indexed before EOF
+        fullrows, remainder = divmod(xfmap.npx_found, xres)
+        yend = min(yend, fullrows + (1 if xend <= remainder else 0))
+
+        if xstart >= xend or ystart >= yend:
+            raise ValueError(f"region x {xcoords}, y {ycoords} lies outside map with dimensions {self.dimensions}")
+
+        #pixels are stored row by row
+        pxidx = ( np.arange(ystart, yend)[:,None]*xres + np.arange(xstart, xend)[None,:] ).ravel()
+
+        roi = PixelSeries(config, xfmap, len(pxidx), self.detarray, parsing, self.sparse, self.stream, self.reduced, \
+            self.chanwindow, self.rebin, self.datafile)
+
+        roi.nrows = yend - ystart
+        roi.dimensions = ( roi.nrows, xend - xstart )
+
+        roi.pxlen=self.pxlen[pxidx]
+        roi.xidx=self.xidx[pxidx]
+        roi.yidx=self.yidx[pxidx]
+        roi.det=self.det[pxidx]
+        roi.dt=self.dt[pxidx]
+
+        return roi, pxidx
+
     def get_dtmod(self, config, xfmap, target_dt: float):
             """
             calculate derived arrays from values extracted from map
@@ -216,7 +352,7 @@ class PixelSeries:
             #modify_dt used as both flag and value
             if target_dt < 0:
                 #dt = predicted
-                self.dtmod = dtops.predict_dt(self, xfmap)
+                self.dtmod = dtops.predict_dt(self, xfmap, config)
             elif target_dt > 100:
                 #dt = unchanged
                 self.dtmod = self.dt
@@ -229,12 +365,29 @@ class PixelSeries:
 
             return self
 
-    def get_derived(self):
+    def get_derived(self, batches=None):
         """
         calculate derived arrays from values extracted from map
+
+        if batches of PixelBatch are given, consume these in place of data
+            flattened is then not kept, as it would hold the whole map
         """
-        self.flattened = np.sum(self.data, axis=1, dtype=np.uint32)
-        self.sum = np.sum(self.data, axis=2, dtype=np.uint32)
+        if self.reduced:
+            #flattened and sum already accumulated during parse
+            pass
+        elif batches is not None:
+            for batch in batches:
+                self.sum[batch.first:batch.last] = np.sum(batch.data, axis=2, dtype=np.uint32)
+        elif self.sparse:
+            #rows for each pixel are adjacent, so every ndet-th row pointer spans one pixel
+            #   own copies of the index arrays, as sum_duplicates rewrites them in place
+            self.flattened = sparse.csr_matrix((self.counts.astype(np.uint32), self.channels.copy(), self.indptr[::self.ndet].copy()), \
+                    shape=(self.npx, self.nchan))
+            self.flattened.sum_duplicates()
+            self.sum = np.asarray(self.data.sum(axis=1, dtype=np.uint32)).reshape(self.npx, self.ndet)
+        else:
+            self.flattened = np.sum(self.data, axis=1, dtype=np.uint32)
+            self.sum = np.sum(self.data, axis=2, dtype=np.uint32)
         self.flatsum = np.sum(self.sum, axis=1, dtype=np.uint32)
 
         return self
@@ -282,17 +435,48 @@ class PixelSeries:
 
 
 
-    def exportpxdata(self, config, dir):
+    def exportpxdata(self, config, dir, tiled: bool=False):
         """
         writes the spectrum-by-pixel data to csv
+            sparse data is always written as .npz, via scipy.sparse.save_npz
+            out-of-core data is already on disk, and is only flushed
+            tiled data is written as a compressed store, see tilestore
         """
-        if config['SAVEFMT_READABLE']:
+        if self.datafile is not None and isinstance(self.data, np.memmap):
+            self.finalise_datafile()
+
+        if tiled:
+            attrs = { "gain": float(self.source.gain), "chanwindow": list(self.chanwindow), "rebin": self.rebin }
+            tilestore.write(tilestore.storepath(dir, config['export_filename']), self.data, self.dimensions, self.ndet, attrs=attrs)
+        elif self.sparse:
+            sparse.save_npz(os.path.join(dir,  config['export_filename']), self.data)
+        elif self.datafile is not None:
+            pass
+        elif config['SAVEFMT_READABLE']:
             for i in self.detarray:
                 np.savetxt(os.path.join(dir,  config['export_filename'] + f"{i}.txt"), self.data[i], fmt='%i')
         else:
             np.save(os.path.join(dir,  config['export_filename']), self.data)
 
 
+    def finalise_datafile(self):
+        """
+        flush the out-of-core data to disk
+            if the map was truncated, rewrites the file at the truncated size, and remaps data onto it
+        """
+        self.data.flush()
+
+        filedata = np.load(self.datafile, mmap_mode='r')
+        fileshape = filedata.shape
+        del filedata
+
+        if not fileshape == self.data.shape:
+            tmpfile = self.datafile + ".tmp.npy"
+            np.save(tmpfile, self.data)
+            os.replace(tmpfile, self.datafile)
+            self.data = np.load(self.datafile, mmap_mode='r+')
+
+
     def importpxdata(self, config, dir):
         """
         read data from csv
@@ -310,4 +494,24 @@ class PixelSeries:
         
         print("loaded successfully", config['export_filename']) 
 
-        return self
\ No newline at end of file
+        return self
+
+
+class PixelBatch:
+    """
+    Contiguous run of pixels decoded from the map
+        holds: spectra for pixels first to last-1, shape (npx, ndet, nchan)
+        together with the header fields for those pixels from PixelSeries
+    """
+    def __init__(self, pixelseries, first: int, last: int, data):
+
+        self.first = first
+        self.last = last
+        self.npx = last - first
+        self.data = data
+
+        self.pxlen=pixelseries.pxlen[first:last]
+        self.xidx=pixelseries.xidx[first:last]
+        self.yidx=pixelseries.yidx[first:last]
+        self.det=pixelseries.det[first:last]
+        self.dt=pixelseries.dt[first:last]
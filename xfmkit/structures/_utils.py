@@ -1,6 +1,5 @@
 import os
 import numpy as np
-from scipy import ndimage
 
 import xfmkit.bufferops as bufferops
 import xfmkit.dtops as dtops
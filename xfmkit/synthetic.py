@@ -0,0 +1,271 @@
+import json
+import struct
+import time
+import numpy as np
+
+import xfmkit.bufferops as bufferops
+
+import logging
+logger = logging.getLogger(__name__)
+
+"""
+Writes synthetic .GeoPIXE maps, eg. for scale and regression testing
+
+- spectra are drawn once into a pool of templates, each a set of peaks over a flat background
+    - sparsity sets the fraction of empty channels in each spectrum
+    - counts per spectrum follow a chosen count-rate distribution
+    - deadtime scales with counts, around a chosen mean
+- each record is a randomly chosen template, so the expected data is known exactly:
+    templates[choice] gives the (pixel, detector, channel) cube
+- records are assembled a block at a time, as 4-byte words
+    whole template records are concatenated, then their pixel headers patched in
+- optionally truncated, or with corrupted records
+"""
+#-----------------------------------
+#vars
+#-----------------------------------
+PXFLAG = b'DP'
+PXHEADERLEN = 16
+NCHAN = 4096
+
+#peak energies (keV) and relative heights of the template spectrum
+#   eg. Ca, Fe, Cu, Zn K-alpha, Mo elastic and Compton
+PEAKS = [ (3.69, 0.4), (6.40, 1.0), (8.05, 0.3), (8.64, 0.5), (17.44, 0.6), (16.60, 0.8) ]
+PEAK_WIDTH = 0.08       #(keV) standard deviation of each peak
+BACKGROUND = 0.2        #fraction of counts in flat background
+
+RATE_DISTRIBUTIONS = [ "constant", "poisson", "lognormal" ]
+BLOCKSIZE = 67108864    #(bytes) approximate size of each block written
+
+
+def fileheader(xres: int, yres: int, ndet: int, nchan: int=NCHAN, gain: float=10.0, dwell: float=100.0, deadtime: float=0.0, \
+        pixelsize: float=0.025):
+    """
+    JSON header of a map, as written by the instrument
+    """
+    return {
+        "File Header": {
+            "Timestamp": time.strftime("%m/%d/%Y at %I:%M %p").lower(),
+            "Duration (H:M:S)": time.strftime("%H:%M:%S", time.gmtime(xres*yres*dwell/1000)),
+            "Dwell (mS)": float(dwell),
+            "Xres": int(xres),
+            "Yres": int(yres),
+            "Width (mm)": float(xres*pixelsize),
+            "Height (mm)": float(yres*pixelsize),
+            "Dets": int(ndet),
+            "Chan": int(nchan),
+            "Gain (eV)": float(gain),
+            "Deadtime (%)": float(deadtime),
+        },
+        "X-ray Source": {
+            "KV": 50.0,
+            "UA (µA)": 200.0,
+            "Elt": "Mo",
+            "Spot (µm)": 10,
+            "Filter": "None",
+            "Incid (°)": 70.0,
+            "Take (°)": 20.0,
+            "Scat (°)": 140.0,
+        },
+        "Detector": {
+            "Idx": 1,
+            "Type": 5,
+            "Elt": 14,
+            "Area (mm²)": 150.0,
+            "Thick (mm)": 0.45,
+            "Win": 14,
+            "WThick (µm)": 7.5,
+        },
+        "Synthetic": True,
+    }
+
+
+def profile(nchan: int, gain: float):
+    """
+    probability of a count in each channel, for peaks over a flat background
+    """
+    energy = np.arange(nchan)*gain/1000
+
+    peaks = np.zeros(nchan)
+    for centre, height in PEAKS:
+        peaks += height*np.exp(-0.5*((energy-centre)/PEAK_WIDTH)**2)
+
+    p = (1-BACKGROUND)*peaks/np.sum(peaks) + BACKGROUND/nchan
+
+    return p/np.sum(p)
+
+
+def templates(rng, ntemplates: int, nchan: int, gain: float, rate: float, distribution: str, spread: float, \
+        sparsity: float, deadtime: float):
+    """
+    draw a pool of template spectra
+
+    returns spectra as uint16 (ntemplates, nchan), deadtime of each as float32
+    """
+    if not distribution in RATE_DISTRIBUTIONS:
+        raise ValueError(f"unrecognised count-rate distribution {distribution}, expected one of {RATE_DISTRIBUTIONS}")
+    if not 0 <= sparsity < 1:
+        raise ValueError("sparsity must be >= 0 and < 1")
+
+    #counts per spectrum
+    if distribution == "constant":
+        totals = np.full(ntemplates, rate)
+    elif distribution == "poisson":
+        totals = rng.poisson(rate, ntemplates)
+    else:
+        totals = rng.lognormal(np.log(rate) - spread**2/2, spread, ntemplates)
+
+    totals = np.maximum(np.round(totals).astype(np.int64), 1)
+
+    p = profile(nchan, gain)
+    occupied = max(int(round((1-sparsity)*nchan)), 1)
+
+    spectra = np.zeros((ntemplates, nchan), dtype=np.uint16)
+
+    for i, total in enumerate(totals):
+        #one count in each occupied channel, remainder spread by profile
+        k = min(occupied, total)
+        chan = rng.choice(nchan, k, replace=False, p=p)
+        counts = 1 + rng.multinomial(total-k, p[chan]/np.sum(p[chan]))
+        spectra[i, chan] = np.minimum(counts, np.iinfo(np.uint16).max)
+
+    #deadtime in proportion to counts
+    dt = np.clip(deadtime*totals/np.mean(totals), 0, 99).astype(np.float32)
+
+    return spectra, dt
+
+
+def encode(spectra):
+    """
+    each spectrum as a whole record of little-endian 4-byte words
+        a placeholder pixel header, then the channel/count pairs
+
+    returns list of records as uint32, one per spectrum
+    """
+    spectrum, chan = np.nonzero(spectra)
+    words = chan.astype('<u4') | ( spectra[spectrum, chan].astype('<u4') << 16 )
+
+    npairs = np.bincount(spectrum, minlength=spectra.shape[0])
+    starts = np.cumsum(npairs) - npairs
+
+    return [ np.concatenate(( np.zeros(PXHEADERLEN//4, dtype='<u4'), words[start:start+n] )) \
+                for start, n in zip(starts, npairs) ]
+
+
+def records(pool, choice, dt, pxidx: int, xres: int, ndet: int):
+    """
+    assemble a block of records as 4-byte words
+
+    choice gives the template of each record, in file order from pixel pxidx
+
+    returns words, and the word offset of each record within the block
+    """
+    n = len(choice)
+    record = np.arange(n)
+    pixel = pxidx + record // ndet
+
+    #copy whole template records, then patch in the pixel headers
+    out = np.concatenate([ pool[i] for i in choice.tolist() ])
+
+    lengths = np.array([ len(template) for template in pool ])[choice]
+    offsets = np.cumsum(lengths) - lengths
+
+    headers = np.empty(n, dtype=bufferops.pxheaddtype)
+    headers['pxflag'] = PXFLAG
+    headers['pxlen'] = 4*lengths
+    headers['xidx'] = pixel % xres
+    headers['yidx'] = pixel // xres
+    headers['det'] = record % ndet
+    headers['dt'] = dt[choice]
+
+    headers = headers.view('<u4').reshape(n, PXHEADERLEN//4)
+    for i in range(PXHEADERLEN//4):
+        out[offsets+i] = headers[:,i]
+
+    return out, offsets
+
+
+def write(filepath: str, xres: int, yres: int, ndet: int=2, nchan: int=NCHAN, gain: float=10.0, dwell: float=100.0, \
+        rate: float=1000, distribution: str="lognormal", spread: float=0.5, sparsity: float=0.9, deadtime: float=5.0, \
+        ntemplates: int=256, truncate: float=None, corrupt: int=0, seed: int=0, blocksize: int=BLOCKSIZE):
+    """
+    write a synthetic map to filepath
+
+    truncate cuts the file to this fraction of its full size, mid-record
+    corrupt overwrites the flag or length of this many records, chosen after the first row
+
+    returns dict of
+        spectra and deadtime of each template, template choice per (pixel, detector),
+        byte offset of each corrupted record, file size
+    """
+    if xres < 1 or yres < 1 or ndet < 1:
+        raise ValueError("map dimensions and detectors must be >= 1")
+    if truncate is not None and not 0 < truncate <= 1:
+        raise ValueError("truncate must be > 0 and <= 1")
+
+    rng = np.random.default_rng(seed)
+
+    spectra, dt = templates(rng, ntemplates, nchan, gain, rate, distribution, spread, sparsity, deadtime)
+    pool = encode(spectra)
+    lengths = np.array([ len(template) for template in pool ])
+
+    npx = xres*yres
+    nrecords = npx*ndet
+    choice = rng.integers(0, ntemplates, nrecords).astype(np.uint16 if ntemplates <= 65536 else np.uint32)
+
+    #records to corrupt, beyond the first row so the detector config can be read
+    corrupted = np.sort(rng.choice(np.arange(xres*ndet, nrecords), min(corrupt, max(nrecords-xres*ndet, 0)), replace=False)) \
+        if corrupt > 0 else np.zeros(0, dtype=np.int64)
+    corrupt_offsets = []
+
+    headerencode = json.dumps(fileheader(xres, yres, ndet, nchan, gain, dwell, deadtime), indent='\t').encode('utf-8')
+
+    #whole pixels per block
+    blockpx = max(int(blocksize // (4*np.mean(lengths)*ndet)), 1)
+
+    fullsize = 2 + len(headerencode) + 4*int(np.sum(lengths[choice]))
+    limit = fullsize if truncate is None else int(fullsize*truncate)
+
+    with open(filepath, mode='wb') as f:
+        f.write(struct.pack("<H", len(headerencode)))
+        f.write(headerencode)
+        position = f.tell()
+
+        for first in range(0, npx, blockpx):
+            last = min(first+blockpx, npx)
+
+            out, offsets = records(pool, choice[first*ndet:last*ndet], dt, first, xres, ndet)
+            block = out.view(np.uint8)
+
+            #flag and length of selected records, alternately
+            for i in corrupted[( corrupted >= first*ndet ) & ( corrupted < last*ndet )]:
+                start = 4*int(offsets[i - first*ndet])
+                if i % 2 == 0:
+                    block[start:start+2] = np.frombuffer(b'XX', dtype=np.uint8)
+                else:
+                    block[start+2:start+6] = np.frombuffer(struct.pack("<I", 7), dtype=np.uint8)
+                corrupt_offsets.append(position + start)
+
+            if position + len(block) >= limit:
+                f.write(block[:limit-position])
+                position = limit
+                break
+
+            f.write(block)
+            position += len(block)
+
+    return {
+        "file": filepath,
+        "bytes": position,
+        "spectra": spectra,
+        "dt": dt,
+        "choice": choice.reshape(npx, ndet),
+        "corrupted": corrupt_offsets,
+    }
+
+
+def expected(result, first: int=0, last: int=None):
+    """
+    the (pixel, detector, channel) data written for pixels first to last
+    """
+    return result["spectra"][result["choice"][first:last]]
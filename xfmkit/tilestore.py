@@ -0,0 +1,244 @@
+"""
+chunked, compressed on-disk store for the spectrum-by-pixel cube
+
+the cube is held as (y, x, detector, channel)
+    split into fixed-size spatial tiles x channel blocks, all detectors kept together
+    each tile is compressed independently and appended to a single data file
+    tiles containing only zeros are not stored
+
+a JSON manifest records the shape, tiling, codec and the byte range of every tile
+    allowing any (y, x, channel) window to be read without touching the rest of the cube
+"""
+import os
+import json
+import zlib
+import lzma
+import numpy as np
+from scipy import sparse
+
+import logging
+logger = logging.getLogger(__name__)
+
+TILESTORE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+TILEDATA_NAME = "tiles.bin"
+TILESTORE_SUFFIX = ".tiles"
+
+TILE_PIXELS = 32        #default tile height and width, in pixels
+TILE_CHANNELS = 256     #default channels per tile
+CODECS = [ "zlib", "lzma", "none" ]
+
+
+def storepath(dir, name):
+    """
+    location of a store with this name within dir
+    """
+    return os.path.join(dir, name+TILESTORE_SUFFIX)
+
+
+def compress(raw: bytes, codec: str, level: int):
+    if codec == "zlib":
+        return zlib.compress(raw, level)
+    elif codec == "lzma":
+        return lzma.compress(raw, preset=level)
+    else:
+        return raw
+
+
+def decompress(raw: bytes, codec: str):
+    if codec == "zlib":
+        return zlib.decompress(raw)
+    elif codec == "lzma":
+        return lzma.decompress(raw)
+    else:
+        return raw
+
+
+def shuffle(tile):
+    """
+    group bytes by significance before compression
+        counts are mostly small, leaving long runs of zero high bytes
+    """
+    itemsize = tile.dtype.itemsize
+    return tile.view(np.uint8).reshape(-1, itemsize).T.tobytes()
+
+
+def unshuffle(raw: bytes, dtype, shape):
+    itemsize = np.dtype(dtype).itemsize
+    return np.frombuffer(raw, dtype=np.uint8).reshape(itemsize, -1).T.copy().view(dtype).reshape(shape)
+
+
+def bounds(length: int, step: int):
+    """
+    (start, end) of each block of size step along an axis of given length
+        the final block may be short
+    """
+    return [ (start, min(start+step, length)) for start in range(0, length, step) ]
+
+
+def write(path, data, dimensions, ndet: int, tilepixels: int=TILE_PIXELS, tilechannels: int=TILE_CHANNELS, \
+        codec: str="zlib", level: int=6, attrs=None):
+    """
+    write the spectrum-by-pixel data as a tiled store at path
+
+    takes:
+        data as (npx, ndet, nchan) array, incl. memmap, or sparse (npx*ndet, nchan) matrix
+        dimensions of the map as (nrows, ncols)
+        attrs: optional dict of additional properties to record in the manifest
+
+    data is read one band of tile rows at a time
+    """
+    if not codec in CODECS:
+        raise ValueError(f"codec {codec} not recognised, expected one of {CODECS}")
+
+    if tilepixels < 1 or tilechannels < 1:
+        raise ValueError("tile dimensions must be >= 1")
+
+    nrows, ncols = int(dimensions[0]), int(dimensions[1])
+    nchan = int(data.shape[-1])
+    dtype = np.dtype(data.dtype).newbyteorder('<')
+
+    if not data.shape[0] in [ nrows*ncols, nrows*ncols*ndet ]:
+        raise ValueError(f"data with shape {data.shape} does not match map dimensions {dimensions}")
+
+    os.makedirs(path, exist_ok=True)
+
+    ybounds = bounds(nrows, tilepixels)
+    xbounds = bounds(ncols, tilepixels)
+    cbounds = bounds(nchan, tilechannels)
+
+    offsets = np.zeros((len(ybounds), len(xbounds), len(cbounds)), dtype=np.int64)
+    lengths = np.zeros((len(ybounds), len(xbounds), len(cbounds)), dtype=np.int64)
+
+    position = 0
+
+    with open(os.path.join(path, TILEDATA_NAME), mode='wb') as f:
+        for iy, (y0, y1) in enumerate(ybounds):
+            if sparse.issparse(data):
+                band = data[y0*ncols*ndet:y1*ncols*ndet].toarray()
+            else:
+                band = np.asarray(data[y0*ncols:y1*ncols])
+
+            band = band.reshape(y1-y0, ncols, ndet, nchan).astype(dtype, copy=False)
+
+            for ix, (x0, x1) in enumerate(xbounds):
+                for ic, (c0, c1) in enumerate(cbounds):
+                    tile = band[:, x0:x1, :, c0:c1]
+
+                    #empty tiles are implicit
+                    if not tile.any():
+                        continue
+
+                    raw = compress(shuffle(np.ascontiguousarray(tile)), codec, level)
+                    f.write(raw)
+
+                    offsets[iy, ix, ic] = position
+                    lengths[iy, ix, ic] = len(raw)
+                    position += len(raw)
+
+    manifest = {
+        "version": TILESTORE_VERSION,
+        "shape": [ nrows, ncols, int(ndet), nchan ],
+        "dtype": dtype.str,
+        "tile": [ int(tilepixels), int(tilepixels), int(tilechannels) ],
+        "codec": codec,
+        "shuffle": True,
+        "offsets": offsets.ravel().tolist(),
+        "lengths": lengths.ravel().tolist(),
+        "attrs": attrs if attrs is not None else {},
+    }
+
+    with open(os.path.join(path, MANIFEST_NAME), mode='w') as f:
+        json.dump(manifest, f)
+
+    stored = int(np.count_nonzero(lengths))
+    print(f"Wrote {stored}/{lengths.size} tiles, {position} bytes, to {path}")
+
+    return path
+
+
+class TileStore:
+    """
+    reader for a tiled store created by tilestore.write
+
+    windows are given as (start, end) along each axis, as per --x-coords
+        None reads the whole axis
+    """
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, MANIFEST_NAME), mode='r') as f:
+            manifest = json.load(f)
+
+        if not manifest['version'] == TILESTORE_VERSION:
+            raise ValueError(f"tile store version {manifest['version']} not supported, expected {TILESTORE_VERSION}")
+
+        self.shape = tuple(manifest['shape'])
+        self.dtype = np.dtype(manifest['dtype'])
+        self.tile = tuple(manifest['tile'])
+        self.codec = manifest['codec']
+        self.shuffled = manifest['shuffle']
+        self.attrs = manifest['attrs']
+
+        self.nrows, self.ncols, self.ndet, self.nchan = self.shape
+        self.ntiles = ( -(-self.nrows//self.tile[0]), -(-self.ncols//self.tile[1]), -(-self.nchan//self.tile[2]) )
+
+        self.offsets = np.asarray(manifest['offsets'], dtype=np.int64).reshape(self.ntiles)
+        self.lengths = np.asarray(manifest['lengths'], dtype=np.int64).reshape(self.ntiles)
+
+    def window(self, window, length: int):
+        if window is None:
+            return 0, length
+
+        start = max(int(window[0]), 0)
+        end = min(int(window[1]), length)
+
+        if start >= end:
+            raise ValueError(f"window {window} lies outside axis of length {length}")
+
+        return start, end
+
+    def read(self, ywindow=None, xwindow=None, chanwindow=None):
+        """
+        read a window from the store
+
+        returns array of shape (y, x, detector, channel) covering the window
+        """
+        y0, y1 = self.window(ywindow, self.nrows)
+        x0, x1 = self.window(xwindow, self.ncols)
+        c0, c1 = self.window(chanwindow, self.nchan)
+
+        ty, tx, tc = self.tile
+        result = np.zeros((y1-y0, x1-x0, self.ndet, c1-c0), dtype=self.dtype)
+
+        with open(os.path.join(self.path, TILEDATA_NAME), mode='rb') as f:
+            for iy in range(y0//ty, -(-y1//ty)):
+                for ix in range(x0//tx, -(-x1//tx)):
+                    for ic in range(c0//tc, -(-c1//tc)):
+                        length = int(self.lengths[iy, ix, ic])
+
+                        if length == 0:
+                            continue
+
+                        #bounds of this tile, and of its overlap with the window
+                        ty0, ty1 = iy*ty, min((iy+1)*ty, self.nrows)
+                        tx0, tx1 = ix*tx, min((ix+1)*tx, self.ncols)
+                        tc0, tc1 = ic*tc, min((ic+1)*tc, self.nchan)
+
+                        f.seek(int(self.offsets[iy, ix, ic]))
+                        raw = decompress(f.read(length), self.codec)
+                        shape = (ty1-ty0, tx1-tx0, self.ndet, tc1-tc0)
+
+                        if self.shuffled:
+                            tile = unshuffle(raw, self.dtype, shape)
+                        else:
+                            tile = np.frombuffer(raw, dtype=self.dtype).reshape(shape)
+
+                        oy0, oy1 = max(y0, ty0), min(y1, ty1)
+                        ox0, ox1 = max(x0, tx0), min(x1, tx1)
+                        oc0, oc1 = max(c0, tc0), min(c1, tc1)
+
+                        result[oy0-y0:oy1-y0, ox0-x0:ox1-x0, :, oc0-c0:oc1-c0] = \
+                            tile[oy0-ty0:oy1-ty0, ox0-tx0:ox1-tx0, :, oc0-tc0:oc1-tc0]
+
+        return result
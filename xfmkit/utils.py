@@ -1,12 +1,11 @@
 import time
 import sys
 import os
+import glob
 import yaml
 
 import numpy as np
 
-from scipy.stats import norm
-
 import logging
 logger = logging.getLogger(__name__)
 
@@ -138,6 +137,31 @@ class DirectoryStructure:
         return
 
 
+def findmaps(patterns, config, recursive: bool=False):
+    """
+    list .GeoPIXE files from directories, files and glob patterns
+        directories are searched recursively only if requested
+    """
+    files = []
+    seen = set()
+
+    for pattern in patterns:
+        if os.path.isdir(pattern) and recursive:
+            found = glob.glob(os.path.join(pattern, "**", "*"+config['FTYPE']), recursive=True)
+        elif os.path.isdir(pattern):
+            found = glob.glob(os.path.join(pattern, "*"+config['FTYPE']))
+        else:
+            found = glob.glob(pattern, recursive=recursive)
+
+        for fi in sorted(found):
+            fi = os.path.abspath(fi)
+            if os.path.isfile(fi) and not fi in seen:
+                files.append(fi)
+                seen.add(fi)
+
+    return files
+
+
 def readcfg(filename):
     """
     read in the config yaml as a dict
@@ -186,6 +210,8 @@ def normgauss(x, mu, sig1, amp):
     creates a gaussian along x
     normalised so max = amp
     """
+    from scipy.stats import norm
+
     g1=norm.pdf(x, mu, sig1)
     g1n=np.divide(g1,max(g1))
     return np.multiply(g1n, amp)